@@ -196,6 +196,14 @@ const runMigrations = async () => {
     'backfill_automation_exam_taxonomy_links.sql',
     'add_user_credits_system.sql',
     'add_chapters_taxonomy.sql',
+    'add_automation_blobs.sql',
+    'add_automation_blob_pins.sql',
+    'add_automation_session_events.sql',
+    'add_automation_batches.sql',
+    'add_automation_batch_priority.sql',
+    'add_automation_session_rollups.sql',
+    'add_automation_session_counters.sql',
+    'add_automation_step_metrics.sql',
   ];
 
   console.log('\n🔄 Running database migrations...\n');
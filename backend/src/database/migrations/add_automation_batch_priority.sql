@@ -0,0 +1,22 @@
+-- Deadline- and priority-aware batch queue for the python-backend automation service
+-- Items carry their batch's priority and the effective deadline (the batch's own, else the exam's
+-- registration_deadline); the scheduler claims earliest deadline first, then highest priority.
+-- automation_exams.batch_paused stops new claims for an exam (running items finish).
+
+ALTER TABLE automation_exams ADD COLUMN IF NOT EXISTS registration_deadline TIMESTAMP;
+ALTER TABLE automation_exams ADD COLUMN IF NOT EXISTS batch_paused BOOLEAN NOT NULL DEFAULT FALSE;
+
+ALTER TABLE automation_batch_jobs ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 0;
+-- Overrides the exam's registration_deadline for this batch (NULL = follow the exam)
+ALTER TABLE automation_batch_jobs ADD COLUMN IF NOT EXISTS deadline TIMESTAMP;
+
+ALTER TABLE automation_batch_items ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE automation_batch_items ADD COLUMN IF NOT EXISTS deadline TIMESTAMP;
+
+DROP INDEX IF EXISTS idx_automation_batch_items_claim;
+CREATE INDEX IF NOT EXISTS idx_automation_batch_items_claim_order ON automation_batch_items(exam_id, deadline, priority DESC, next_attempt_at, id) WHERE status = 'queued';
+-- Recent item durations per exam (throughput for completion projections)
+CREATE INDEX IF NOT EXISTS idx_automation_batch_items_exam_finished ON automation_batch_items(exam_id, completed_at DESC) WHERE status IN ('completed', 'failed');
+
+COMMENT ON COLUMN automation_exams.registration_deadline IS 'When the exam portal closes registrations; batch items are scheduled earliest deadline first';
+COMMENT ON COLUMN automation_exams.batch_paused IS 'No new batch items of this exam are started while true';
@@ -0,0 +1,43 @@
+-- Durable batch jobs for the python-backend automation service
+-- Items are claimed by scheduler workers with FOR UPDATE SKIP LOCKED and held under a lease
+-- (lease_owner / lease_expires_at, renewed by heartbeat). Items whose lease expires - the worker died
+-- or restarted - are queued again, so batches resume after a restart.
+
+CREATE TABLE IF NOT EXISTS automation_batch_jobs (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  exam_id INTEGER NOT NULL REFERENCES automation_exams(id) ON DELETE CASCADE,
+  status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'completed', 'cancelled')),
+  total INTEGER NOT NULL DEFAULT 0,
+  -- Minimum spacing between item starts within this batch (0 = only the portal rate limit applies)
+  delay_seconds INTEGER NOT NULL DEFAULT 0,
+  next_start_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  max_attempts INTEGER NOT NULL DEFAULT 3,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  completed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS automation_batch_items (
+  id BIGSERIAL PRIMARY KEY,
+  batch_id UUID NOT NULL REFERENCES automation_batch_jobs(id) ON DELETE CASCADE,
+  exam_id INTEGER NOT NULL REFERENCES automation_exams(id) ON DELETE CASCADE,
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  session_id UUID REFERENCES automation_sessions(id) ON DELETE SET NULL,
+  status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed', 'cancelled')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  lease_owner VARCHAR(100),
+  lease_expires_at TIMESTAMP,
+  last_error TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  started_at TIMESTAMP,
+  completed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_automation_batch_jobs_created_at ON automation_batch_jobs(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_automation_batch_items_batch_status ON automation_batch_items(batch_id, status);
+CREATE INDEX IF NOT EXISTS idx_automation_batch_items_claim ON automation_batch_items(exam_id, next_attempt_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_automation_batch_items_lease ON automation_batch_items(lease_expires_at) WHERE status = 'running';
+
+COMMENT ON TABLE automation_batch_jobs IS 'Batch registration jobs (one exam, many users)';
+COMMENT ON TABLE automation_batch_items IS 'One user of a batch job - claimed, leased and retried by the batch scheduler';
@@ -0,0 +1,14 @@
+-- Blobs the python-backend automation service must not evict yet
+-- Each unfinished session pins its latest screenshot (the one its paused workflow state and
+-- viewers point at); LRU eviction of automation_blobs skips pinned hashes while the session
+-- has not reached a terminal status (app/services/blob_store.py).
+
+CREATE TABLE IF NOT EXISTS automation_blob_pins (
+  session_id UUID PRIMARY KEY REFERENCES automation_sessions(id) ON DELETE CASCADE,
+  hash VARCHAR(64) NOT NULL,
+  pinned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_automation_blob_pins_hash ON automation_blob_pins(hash);
+
+COMMENT ON TABLE automation_blob_pins IS 'Per unfinished session: the blob hash that LRU eviction must keep';
@@ -0,0 +1,12 @@
+-- Content-addressed blob index for the python-backend automation service
+-- Screenshots are stored once as large objects, keyed by SHA-256; workflow state only carries the hash
+
+CREATE TABLE IF NOT EXISTS automation_blobs (
+  hash VARCHAR(64) PRIMARY KEY,
+  oid OID NOT NULL,
+  size_bytes INTEGER NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_automation_blobs_last_accessed ON automation_blobs(last_accessed_at DESC);
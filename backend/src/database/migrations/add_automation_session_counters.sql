@@ -0,0 +1,28 @@
+-- Typed intervention counters for the python-backend automation service
+-- Human input requests (otp, captcha, custom), LLM captcha solves and captcha retries are
+-- counted per session and per exam, with the time users took to answer, so analytics never
+-- parse session logs. Rows are upserted in batches (app/services/session_counters.py).
+
+CREATE TABLE IF NOT EXISTS automation_session_counters (
+  session_id UUID NOT NULL REFERENCES automation_sessions(id) ON DELETE CASCADE,
+  counter VARCHAR(50) NOT NULL,
+  count INTEGER NOT NULL DEFAULT 0,
+  -- Human input answered: how many, and total seconds from request to submit
+  wait_count INTEGER NOT NULL DEFAULT 0,
+  wait_seconds_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (session_id, counter)
+);
+
+CREATE TABLE IF NOT EXISTS automation_exam_counters (
+  exam_id INTEGER NOT NULL REFERENCES automation_exams(id) ON DELETE CASCADE,
+  counter VARCHAR(50) NOT NULL,
+  count BIGINT NOT NULL DEFAULT 0,
+  wait_count BIGINT NOT NULL DEFAULT 0,
+  wait_seconds_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (exam_id, counter)
+);
+
+COMMENT ON TABLE automation_session_counters IS 'Per session: intervention counters (otp/captcha/custom requests, LLM captcha solves, retries) and human wait time';
+COMMENT ON TABLE automation_exam_counters IS 'Per exam: the same counters summed over all sessions';
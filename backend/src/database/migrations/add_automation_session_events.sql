@@ -0,0 +1,17 @@
+-- Append-only session log for the python-backend automation service
+-- Replaces appending to automation_sessions.logs (a growing JSONB array rewritten on every entry)
+-- seq is global and increasing, so (session_id, seq) pages through one session's log in order
+
+CREATE TABLE IF NOT EXISTS automation_session_events (
+  seq BIGSERIAL PRIMARY KEY,
+  session_id UUID NOT NULL REFERENCES automation_sessions(id) ON DELETE CASCADE,
+  level VARCHAR(20) NOT NULL DEFAULT 'info',
+  message TEXT NOT NULL,
+  node VARCHAR(100),
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_automation_session_events_session_seq ON automation_session_events(session_id, seq);
+
+COMMENT ON TABLE automation_session_events IS 'Append-only workflow log entries per automation session';
+COMMENT ON COLUMN automation_sessions.logs IS 'Optional summary of the latest automation_session_events entries (see SESSION_LOGS_MIRROR_LIMIT)';
@@ -0,0 +1,27 @@
+-- Incrementally maintained session analytics for the python-backend automation service
+-- One row per (exam, day, terminal status): session count, plus count/sum/sum of squares of
+-- durations (mean and standard deviation without rescanning sessions). A session is added
+-- once when it reaches a terminal status (rolled_up_at guards against double counting) and
+-- taken out again if it is resumed. Build rows for older sessions with
+-- python -m scripts.backfill_analytics_rollups
+
+ALTER TABLE automation_sessions ADD COLUMN IF NOT EXISTS rolled_up_at TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS automation_session_rollups (
+  exam_id INTEGER NOT NULL REFERENCES automation_exams(id) ON DELETE CASCADE,
+  day DATE NOT NULL,
+  status VARCHAR(50) NOT NULL,
+  sessions INTEGER NOT NULL DEFAULT 0,
+  -- Sessions with both started_at and completed_at
+  duration_count INTEGER NOT NULL DEFAULT 0,
+  duration_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  duration_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+  last_completed_at TIMESTAMP,
+  PRIMARY KEY (exam_id, day, status)
+);
+
+-- Terminal sessions not rolled up yet (backfill and catch-up)
+CREATE INDEX IF NOT EXISTS idx_automation_sessions_rollup_pending ON automation_sessions(created_at) WHERE rolled_up_at IS NULL AND status IN ('completed', 'failed', 'stopped');
+
+COMMENT ON TABLE automation_session_rollups IS 'Per exam, day and terminal status: session counts and duration sums for analytics';
+COMMENT ON COLUMN automation_sessions.rolled_up_at IS 'When this session was added to automation_session_rollups (NULL = not counted)';
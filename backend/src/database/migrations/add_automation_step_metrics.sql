@@ -0,0 +1,29 @@
+-- Per-step playbook metrics for the python-backend automation service
+-- One row per executed playbook step: when it started, how long it took, attempts, outcome,
+-- cached-selector hits vs LLM calls, and bytes exchanged with Stagehand. Written in batches
+-- with COPY (app/services/step_metrics.py). playbook_version is the playbook's "version"
+-- field, or a hash of its steps, so durations of edited playbooks are not mixed.
+
+CREATE TABLE IF NOT EXISTS automation_step_metrics (
+  id BIGSERIAL PRIMARY KEY,
+  session_id UUID NOT NULL REFERENCES automation_sessions(id) ON DELETE CASCADE,
+  exam_id INTEGER REFERENCES automation_exams(id) ON DELETE CASCADE,
+  playbook_version VARCHAR(64),
+  step_no INTEGER NOT NULL,
+  step_name VARCHAR(100) NOT NULL,
+  action VARCHAR(50),
+  started_at TIMESTAMP NOT NULL,
+  duration_ms INTEGER NOT NULL,
+  attempts SMALLINT NOT NULL DEFAULT 1,
+  outcome VARCHAR(20) NOT NULL,
+  cache_hits SMALLINT NOT NULL DEFAULT 0,
+  llm_calls SMALLINT NOT NULL DEFAULT 0,
+  bytes_sent INTEGER NOT NULL DEFAULT 0,
+  bytes_received INTEGER NOT NULL DEFAULT 0
+);
+
+-- Step analytics per exam and playbook version over a time window
+CREATE INDEX IF NOT EXISTS idx_automation_step_metrics_exam ON automation_step_metrics(exam_id, started_at);
+CREATE INDEX IF NOT EXISTS idx_automation_step_metrics_session ON automation_step_metrics(session_id);
+
+COMMENT ON TABLE automation_step_metrics IS 'Per executed playbook step: duration, attempts, outcome (success, failed, stopped), cache hits, LLM calls and bytes';
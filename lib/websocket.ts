@@ -5,6 +5,8 @@
 
 interface WebSocketMessage {
     type: string;
+    seq?: number;
+    epoch?: string;
     payload?: {
         sessionId?: string;
         message?: string;
@@ -17,15 +19,31 @@ interface WebSocketMessage {
         type?: string;
         success?: boolean;
         userData?: Record<string, unknown>;
+        hash?: string;
+        binary?: boolean;
+        seq?: number;
+        epoch?: string | null;
+        replayed?: number;
+        gap?: boolean;
+        entries?: { message?: string; level?: 'info' | 'success' | 'warning' | 'error' }[];
     };
 }
 
 // No trailing slash - we append /workflow or /workflow/:id
 const WS_BASE = (process.env.NEXT_PUBLIC_AUTOMATION_WS_URL || 'ws://localhost:8000/ws').replace(/\/$/, '');
+// HTTP origin of the same server (ws://host:8000/ws -> http://host:8000)
+const HTTP_BASE = WS_BASE.replace(/^ws/, 'http').replace(/\/ws$/, '');
+
+/**
+ * Full-resolution screenshot URL (live updates carry a downscaled preview plus this hash)
+ */
+export function getScreenshotUrl(hash: string): string {
+    return `${HTTP_BASE}/api/screenshots/${hash}`;
+}
 
 export interface WorkflowHandlers {
     onLog: (message: string, level: 'info' | 'success' | 'warning' | 'error') => void;
-    onScreenshot: (imageBase64: string, step: string) => void;
+    onScreenshot: (imageBase64: string, step: string, hash?: string) => void;
     onStatus: (step: string, progress: number, message: string) => void;
     onRequestOTP: () => void;
     onRequestCaptcha: (imageBase64: string) => void;
@@ -35,8 +53,13 @@ export interface WorkflowHandlers {
     onUserData: (userData: Record<string, unknown>) => void;
     onError: (message: string) => void;
     onClose: () => void;
+    onReplayComplete: (seq: number, gap: boolean) => void;
 }
 
+// Last event seq seen per session - reconnects replay only what was missed.
+// Seqs restart at 1 in a new epoch (backend restart, expired buffer, another worker).
+const lastSeqBySession = new Map<string, { seq: number; epoch?: string }>();
+
 /**
  * Connect to workflow WebSocket and start automation
  */
@@ -53,6 +76,7 @@ export function connectToWorkflow(
     ws.onopen = () => {
         opened = true;
         console.log('[WebSocket] Connected to workflow');
+        requestBinaryPreviews(ws);
 
         const payload: Record<string, unknown> = { examId, userId };
         if (options?.startFromStep) {
@@ -68,14 +92,8 @@ export function connectToWorkflow(
         }));
     };
 
-    ws.onmessage = (event) => {
-        try {
-            const message = JSON.parse(event.data);
-            handleMessage(message, handlers);
-        } catch (error) {
-            console.error('[WebSocket] Error parsing message:', error);
-        }
-    };
+    ws.binaryType = 'arraybuffer';
+    ws.onmessage = createMessageReader(handlers, options?.sessionId);
 
     ws.onerror = () => {
         if (!opened) {
@@ -99,28 +117,29 @@ export function connectToWorkflow(
 }
 
 /**
- * Connect to existing workflow session
+ * Connect to existing workflow session.
+ * Missed events are replayed from the server's buffer: after `since` if given,
+ * otherwise after the last event this page saw for the session (0 = everything buffered).
  */
 export function connectToSession(
     sessionId: string,
-    handlers: Partial<WorkflowHandlers>
+    handlers: Partial<WorkflowHandlers>,
+    options?: { since?: number }
 ): WebSocket {
-    const ws = new WebSocket(`${WS_BASE}/workflow/${sessionId}`);
+    const last = lastSeqBySession.get(sessionId);
+    const since = options?.since ?? last?.seq ?? 0;
+    const epoch = options?.since === undefined && last?.epoch ? `&epoch=${encodeURIComponent(last.epoch)}` : '';
+    const ws = new WebSocket(`${WS_BASE}/workflow/${sessionId}?since=${since}${epoch}`);
     let opened = false;
 
     ws.onopen = () => {
         opened = true;
         console.log(`[WebSocket] Connected to session: ${sessionId}`);
+        requestBinaryPreviews(ws);
     };
 
-    ws.onmessage = (event) => {
-        try {
-            const message = JSON.parse(event.data);
-            handleMessage(message, handlers);
-        } catch (error) {
-            console.error('[WebSocket] Error parsing message:', error);
-        }
-    };
+    ws.binaryType = 'arraybuffer';
+    ws.onmessage = createMessageReader(handlers, sessionId);
 
     ws.onerror = () => {
         if (!opened) handlers.onError?.('Cannot reach automation server. Is the Python backend running on port 8000?');
@@ -135,6 +154,79 @@ export function connectToSession(
     return ws;
 }
 
+/**
+ * Ask the server for screenshot previews as binary frames (JSON header, then JPEG bytes)
+ */
+function requestBinaryPreviews(ws: WebSocket, width?: number, quality?: number) {
+    ws.send(JSON.stringify({
+        type: 'SET_PREVIEW',
+        payload: { binary: true, width, quality }
+    }));
+}
+
+function arrayBufferToBase64(buffer: ArrayBuffer): string {
+    const bytes = new Uint8Array(buffer);
+    let binary = '';
+    const chunk = 0x8000;
+    for (let i = 0; i < bytes.length; i += chunk) {
+        binary += String.fromCharCode(...bytes.subarray(i, i + chunk));
+    }
+    return btoa(binary);
+}
+
+/**
+ * Build an onmessage handler: JSON text frames go to handleMessage;
+ * a binary frame is the body of the SCREENSHOT header that preceded it.
+ * Events already seen (seq <= last seq for the session, same epoch) are skipped, so replays
+ * never double up. A new epoch - or REPLAY_COMPLETE reporting a lower seq - starts the count over.
+ */
+function createMessageReader(handlers: Partial<WorkflowHandlers>, initialSessionId?: string) {
+    let pendingScreenshot: WebSocketMessage['payload'] | null = null;
+    let sessionId = initialSessionId;
+
+    return (event: MessageEvent) => {
+        if (event.data instanceof ArrayBuffer) {
+            if (pendingScreenshot) {
+                handlers.onScreenshot?.(
+                    arrayBufferToBase64(event.data),
+                    pendingScreenshot.step || 'capture',
+                    pendingScreenshot.hash
+                );
+                pendingScreenshot = null;
+            }
+            return;
+        }
+
+        try {
+            const message: WebSocketMessage = JSON.parse(event.data);
+            if (message.type === 'SCREENSHOT' && message.payload?.binary) {
+                pendingScreenshot = message.payload;
+                return;
+            }
+            if (message.type === 'SESSION_CREATED' && message.payload?.sessionId) {
+                sessionId = message.payload.sessionId;
+            }
+            if (sessionId && typeof message.seq === 'number') {
+                const last = lastSeqBySession.get(sessionId);
+                const sameEpoch = !last?.epoch || !message.epoch || last.epoch === message.epoch;
+                if (last && sameEpoch && message.seq <= last.seq) return;
+                lastSeqBySession.set(sessionId, { seq: message.seq, epoch: message.epoch ?? last?.epoch });
+            }
+            if (sessionId && message.type === 'REPLAY_COMPLETE') {
+                const last = lastSeqBySession.get(sessionId);
+                const seq = message.payload?.seq ?? 0;
+                const epoch = message.payload?.epoch ?? undefined;
+                if (!last || seq < last.seq || (epoch && last.epoch && epoch !== last.epoch)) {
+                    lastSeqBySession.set(sessionId, { seq, epoch });
+                }
+            }
+            handleMessage(message, handlers);
+        } catch (error) {
+            console.error('[WebSocket] Error parsing message:', error);
+        }
+    };
+}
+
 /**
  * Handle incoming WebSocket messages
  */
@@ -150,6 +242,12 @@ function handleMessage(message: WebSocketMessage, handlers: Partial<WorkflowHand
             handlers.onLog?.(payload?.message || '', payload?.level || 'info');
             break;
 
+        case 'LOG_BATCH':
+            for (const entry of payload?.entries || []) {
+                handlers.onLog?.(entry.message || '', entry.level || 'info');
+            }
+            break;
+
         case 'USER_DATA':
             if (payload?.userData && typeof payload.userData === 'object') {
                 handlers.onUserData?.(payload.userData as Record<string, unknown>);
@@ -157,7 +255,7 @@ function handleMessage(message: WebSocketMessage, handlers: Partial<WorkflowHand
             break;
 
         case 'SCREENSHOT':
-            handlers.onScreenshot?.(payload?.imageBase64 || '', payload?.step || 'capture');
+            handlers.onScreenshot?.(payload?.imageBase64 || '', payload?.step || 'capture', payload?.hash);
             break;
 
         case 'STATUS':
@@ -180,6 +278,10 @@ function handleMessage(message: WebSocketMessage, handlers: Partial<WorkflowHand
             handlers.onResult?.(payload?.success || false, payload?.message || '');
             break;
 
+        case 'REPLAY_COMPLETE':
+            handlers.onReplayComplete?.(payload?.seq || 0, payload?.gap || false);
+            break;
+
         case 'ERROR':
             handlers.onError?.(payload?.message || ''   );
             break;
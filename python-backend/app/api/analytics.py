@@ -2,12 +2,18 @@
 Analytics API Endpoints
 Provides workflow analytics and statistics using PostgreSQL.
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 
 from app.services.database import fetch_one, fetch_all
+from app.services.analytics_rollups import duration_stats, get_rollup_totals
+from app.services import session_counters
+from app.services.step_metrics import get_step_stats
+from app.graph.resume_latency import get_resume_latency_stats
+from app.services.tracing import get_latency_histograms, export_chrome_trace
 
 
 router = APIRouter()
@@ -21,8 +27,14 @@ class AnalyticsResponse(BaseModel):
     failed_runs: int
     success_rate: float
     avg_duration_seconds: float
+    duration_stddev_seconds: float = 0.0
     otp_requests: int
     captcha_requests: int
+    custom_input_requests: int = 0
+    captcha_llm_solved: int = 0
+    captcha_retries: int = 0
+    captcha_auto_solve_rate: float = 0.0
+    avg_human_wait_seconds: float = 0.0
     last_run_at: Optional[datetime]
 
 
@@ -35,23 +47,52 @@ class GlobalAnalytics(BaseModel):
     success_rate: float
 
 
-@router.get("/global", response_model=GlobalAnalytics)
-async def get_global_analytics():
-    """Get global analytics across all exams."""
-    # Count sessions by status
-    stats = await fetch_one("""
+def _intervention_stats(counters: dict[str, dict]) -> dict:
+    """AnalyticsResponse intervention fields from session_counters totals."""
+    def total(counter: str, field: str = "count"):
+        return (counters.get(counter) or {}).get(field) or 0
+
+    requests = (session_counters.OTP_REQUESTED, session_counters.CAPTCHA_REQUESTED, session_counters.CUSTOM_REQUESTED)
+    waits = sum(total(c, "wait_count") for c in requests)
+    captcha_requests = total(session_counters.CAPTCHA_REQUESTED)
+    llm_solved = total(session_counters.CAPTCHA_LLM_SOLVED)
+    
+    return {
+        "otp_requests": total(session_counters.OTP_REQUESTED),
+        "captcha_requests": captcha_requests,
+        "custom_input_requests": total(session_counters.CUSTOM_REQUESTED),
+        "captcha_llm_solved": llm_solved,
+        "captcha_retries": total(session_counters.CAPTCHA_RETRY),
+        # Captchas solved without asking the user
+        "captcha_auto_solve_rate": llm_solved / (llm_solved + captcha_requests) if llm_solved + captcha_requests else 0.0,
+        "avg_human_wait_seconds": sum(total(c, "wait_seconds_sum") for c in requests) / waits if waits else 0.0,
+    }
+
+
+async def _open_sessions(exam_id: Optional[int] = None) -> dict:
+    """Sessions not finished yet (few, and indexed by status): open total and active."""
+    query = """
         SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as successful,
-            SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed,
-            SUM(CASE WHEN status IN ('running', 'waiting_input', 'pending') THEN 1 ELSE 0 END) as active
+            COUNT(*) as open,
+            COUNT(*) FILTER (WHERE status IN ('running', 'waiting_input', 'pending')) as active
         FROM automation_sessions
-    """)
+        WHERE status IN ('pending', 'running', 'waiting_input', 'paused')
+    """
+    if exam_id is None:
+        return await fetch_one(query)
+    return await fetch_one(query + " AND exam_id = $1", exam_id)
+
+
+@router.get("/global", response_model=GlobalAnalytics)
+async def get_global_analytics():
+    """Get global analytics across all exams (finished sessions come from the rollups)."""
+    by_status = {row["status"]: row for row in await get_rollup_totals()}
+    open_sessions = await _open_sessions()
     
-    total = stats.get("total", 0) or 0
-    successful = stats.get("successful", 0) or 0
-    failed = stats.get("failed", 0) or 0
-    active = stats.get("active", 0) or 0
+    successful = by_status.get("completed", {}).get("sessions", 0) or 0
+    failed = by_status.get("failed", {}).get("sessions", 0) or 0
+    active = open_sessions.get("active", 0) or 0
+    total = sum(row["sessions"] or 0 for row in by_status.values()) + (open_sessions.get("open", 0) or 0)
     
     return GlobalAnalytics(
         total_workflows=total,
@@ -64,19 +105,13 @@ async def get_global_analytics():
 
 @router.get("/exam/{exam_id}", response_model=AnalyticsResponse)
 async def get_exam_analytics(exam_id: int):
-    """Get analytics for a specific exam."""
-    stats = await fetch_one("""
-        SELECT 
-            COUNT(*) as total_runs,
-            SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as successful_runs,
-            SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed_runs,
-            MAX(completed_at) as last_run_at,
-            AVG(EXTRACT(EPOCH FROM (COALESCE(completed_at, CURRENT_TIMESTAMP) - started_at))) as avg_duration
-        FROM automation_sessions
-        WHERE exam_id = $1
-    """, exam_id)
+    """Get analytics for a specific exam (finished sessions come from the rollups, interventions from session_counters)."""
+    by_status = {row["status"]: row for row in await get_rollup_totals(exam_id)}
+    open_sessions = await _open_sessions(exam_id)
+    interventions = _intervention_stats(await session_counters.get_counter_totals(exam_id))
     
-    if not stats or stats.get("total_runs", 0) == 0:
+    total = sum(row["sessions"] or 0 for row in by_status.values()) + (open_sessions.get("open", 0) or 0)
+    if total == 0:
         return AnalyticsResponse(
             exam_id=exam_id,
             total_runs=0,
@@ -84,15 +119,18 @@ async def get_exam_analytics(exam_id: int):
             failed_runs=0,
             success_rate=0.0,
             avg_duration_seconds=0.0,
-            otp_requests=0,
-            captcha_requests=0,
-            last_run_at=None
+            last_run_at=None,
+            **interventions
         )
     
-    total = stats.get("total_runs", 0) or 0
-    successful = stats.get("successful_runs", 0) or 0
-    failed = stats.get("failed_runs", 0) or 0
-    avg_duration = stats.get("avg_duration", 0) or 0
+    successful = by_status.get("completed", {}).get("sessions", 0) or 0
+    failed = by_status.get("failed", {}).get("sessions", 0) or 0
+    avg_duration, stddev = duration_stats(
+        sum(row["duration_count"] or 0 for row in by_status.values()),
+        sum(row["duration_sum"] or 0 for row in by_status.values()),
+        sum(row["duration_sum_sq"] or 0 for row in by_status.values()),
+    )
+    finished_at = [row["last_completed_at"] for row in by_status.values() if row["last_completed_at"]]
     
     return AnalyticsResponse(
         exam_id=exam_id,
@@ -101,12 +139,73 @@ async def get_exam_analytics(exam_id: int):
         failed_runs=failed,
         success_rate=successful / total if total > 0 else 0.0,
         avg_duration_seconds=avg_duration,
-        otp_requests=0,  # Would need to parse logs JSONB for this
-        captcha_requests=0,
-        last_run_at=stats.get("last_run_at")
+        duration_stddev_seconds=stddev,
+        last_run_at=max(finished_at) if finished_at else None,
+        **interventions
     )
 
 
+@router.get("/exam/{exam_id}/daily")
+async def get_exam_daily_analytics(exam_id: int, days: int = Query(30, ge=1, le=366)):
+    """Finished sessions of an exam per day and status, with duration mean and stddev (from the rollups)."""
+    rows = await fetch_all("""
+        SELECT day, status, sessions, duration_count, duration_sum, duration_sum_sq
+        FROM automation_session_rollups
+        WHERE exam_id = $1 AND day > CURRENT_DATE - $2::int
+        ORDER BY day, status
+    """, exam_id, days)
+    
+    result = []
+    for row in rows:
+        mean, stddev = duration_stats(row["duration_count"], row["duration_sum"], row["duration_sum_sq"])
+        result.append({
+            "day": row["day"].isoformat(),
+            "status": row["status"],
+            "sessions": row["sessions"],
+            "avg_duration_seconds": mean,
+            "duration_stddev_seconds": stddev,
+        })
+    return result
+
+
+@router.get("/exam/{exam_id}/steps")
+async def get_exam_step_analytics(
+    exam_id: int,
+    days: int = Query(30, ge=1, le=366),
+    version: Optional[str] = None
+):
+    """
+    Playbook step durations (p50/p95/p99) and failure rates, per playbook version and step.
+    Versions are listed most recently run first; failure_rate leaves out steps stopped by the user.
+    """
+    versions: dict[str, dict] = {}
+    for row in await get_step_stats(exam_id, days=days, playbook_version=version):
+        key = row["playbook_version"] or "unknown"
+        entry = versions.setdefault(key, {"playbook_version": key, "last_run_at": None, "steps": []})
+        if entry["last_run_at"] is None or row["last_run_at"] > entry["last_run_at"]:
+            entry["last_run_at"] = row["last_run_at"]
+        finished = row["runs"] - row["stopped"]
+        entry["steps"].append({
+            "step": row["step_no"],
+            "name": row["step_name"],
+            "runs": row["runs"],
+            "failures": row["failures"],
+            "failure_rate": row["failures"] / finished if finished > 0 else 0.0,
+            "p50_seconds": round(row["p50_ms"] / 1000, 2),
+            "p95_seconds": round(row["p95_ms"] / 1000, 2),
+            "p99_seconds": round(row["p99_ms"] / 1000, 2),
+            "avg_attempts": round(row["avg_attempts"] or 0, 2),
+            "cache_hits": row["cache_hits"],
+            "llm_calls": row["llm_calls"],
+            "avg_bytes": round(row["avg_bytes"] or 0),
+        })
+    
+    ordered = sorted(versions.values(), key=lambda v: v["last_run_at"], reverse=True)
+    for entry in ordered:
+        entry["last_run_at"] = entry["last_run_at"].isoformat()
+    return {"exam_id": exam_id, "days": days, "versions": ordered}
+
+
 @router.get("/recent-sessions")
 async def get_recent_sessions(limit: int = 10):
     """Get recent workflow sessions."""
@@ -170,3 +269,51 @@ async def get_exam_sessions(exam_id: int, limit: int = 20):
         }
         for s in sessions
     ]
+
+
+@router.get("/resume-latency")
+async def get_resume_latency():
+    """
+    Latency from user input submission to the workflow acting again (this worker).
+    graph_resumed: interrupted node restored; next_action: input entered in the browser.
+    """
+    return get_resume_latency_stats()
+
+
+@router.get("/latency")
+async def get_latency(exam_id: Optional[int] = None):
+    """
+    Per-exam latency histograms of workflow spans on this worker
+    (LangGraph nodes, playbook handlers, Stagehand calls, LLM calls, sleeps, human waits).
+    """
+    return get_latency_histograms(exam_id)
+
+
+@router.get("/sessions/{session_id}/trace")
+async def get_session_trace(session_id: str):
+    """Download a session's spans as a Chrome trace file (open in chrome://tracing or Perfetto)."""
+    trace = export_chrome_trace(session_id)
+    return JSONResponse(
+        content=trace,
+        headers={"Content-Disposition": f'attachment; filename="trace-{session_id}.json"'},
+    )
+
+
+@router.get("/websocket-metrics")
+async def get_websocket_metrics():
+    """
+    Outbound WebSocket queue depth, sent and dropped message counts (this worker),
+    plus per-session log frames/bytes unbatched vs. as LOG_BATCH.
+    """
+    from app.api.websocket import manager
+    return manager.metrics()
+
+
+@router.get("/portal-metrics")
+async def get_portal_metrics():
+    """
+    Per exam-portal host (this worker): limits, sessions holding a slot and queued,
+    time spent queued for a slot, and browser action pacing waits.
+    """
+    from app.services.portal_limiter import get_portal_limiter
+    return get_portal_limiter().metrics()
@@ -1,44 +1,42 @@
 """
 Batch Processing API
 Handles batch workflow execution for multiple registrations.
-Uses PostgreSQL for storage.
+Uses PostgreSQL for storage; items are run by the batch scheduler (app/services/batch_scheduler.py).
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Literal
+from typing import Optional
 from datetime import datetime
 import asyncio
+import json
 import uuid
 
+from app.config import settings
 from app.services.database import fetch_one, fetch_all, Database
-from app.api.websocket import manager, MessageTypes
+from app.services.analytics_rollups import roll_up_sessions
+from app.services.batch_scheduler import batch_counts, get_batch_scheduler, project_batch, publish_items, refresh_batch
+from app.api.exams import naive_utc
+from app.api.websocket import MessageTypes, batch_topic, manager, request_stop
 
 
 router = APIRouter()
 
 
-class BatchJob(BaseModel):
-    """Batch job configuration."""
-    id: str
-    exam_id: int
-    user_ids: list[int]
-    status: Literal["pending", "running", "completed", "failed", "cancelled"]
-    total: int
-    completed: int
-    successful: int
-    failed: int
-    created_at: datetime
-
-
-# In-memory batch job storage (for demo - use Redis/DB table in production)
-_batch_jobs: dict[str, dict] = {}
-
-
 class BatchCreateRequest(BaseModel):
     """Request to create a batch job."""
     exam_id: int
     user_ids: list[int]
-    delay_between_runs_seconds: int = 30  # Rate limiting
+    delay_between_runs_seconds: int = 0  # Spacing between starts in this batch (portal rate limits always apply)
+    max_attempts: int = settings.batch_max_attempts
+    priority: int = 0  # Higher runs first among items with the same deadline
+    deadline: Optional[datetime] = None  # Defaults to the exam's registration_deadline
+
+
+class BatchExpediteRequest(BaseModel):
+    """Request to move a batch (or some of its users) up the queue."""
+    priority: int = settings.batch_expedite_priority
+    user_ids: Optional[list[int]] = None  # Default: every queued item of the batch
 
 
 class BatchStatusResponse(BaseModel):
@@ -50,166 +48,386 @@ class BatchStatusResponse(BaseModel):
     successful: int
     failed: int
     progress: float
-    sessions: list[dict]
+    priority: int = 0
+    deadline: Optional[str] = None
+    paused: bool = False
+    throughput_per_hour: Optional[float] = None
+    projected_completion_at: Optional[str] = None
+    at_risk: bool = False
+    sessions: list[dict]  # One page, in item order
+    next_after: Optional[int] = None  # Pass as ?after= for the next page (null when there is none)
+
+
+def _parse_batch_id(batch_id: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(batch_id)
+    except ValueError:
+        raise HTTPException(404, "Batch not found")
+
+
+async def find_missing_users(user_ids: list[int]) -> list[int]:
+    """IDs from user_ids with no users row, in one query."""
+    rows = await fetch_all("""
+        SELECT u.id
+        FROM unnest($1::int[]) WITH ORDINALITY AS u(id, position)
+        LEFT JOIN users x ON x.id = u.id
+        WHERE x.id IS NULL
+        ORDER BY u.position
+    """, user_ids)
+    return [r["id"] for r in rows]
 
 
 @router.post("/")
-async def create_batch(request: BatchCreateRequest, background_tasks: BackgroundTasks):
-    """Create a new batch job."""
+async def create_batch(request: BatchCreateRequest):
+    """
+    Create a new batch job (queued for the batch scheduler).
+    The job, one pending session per user and the items are written in one transaction with COPY.
+    """
     # Validate exam exists
-    exam = await fetch_one("SELECT * FROM automation_exams WHERE id = $1", request.exam_id)
+    exam = await fetch_one("SELECT id, registration_deadline FROM automation_exams WHERE id = $1", request.exam_id)
     if not exam:
         raise HTTPException(404, "Exam not found")
-    
+
+    # Each user once, in request order
+    user_ids = list(dict.fromkeys(request.user_ids))
+    if not user_ids:
+        raise HTTPException(400, "No users given")
+
     # Validate users exist
-    for user_id in request.user_ids:
-        user = await fetch_one("SELECT id FROM users WHERE id = $1", user_id)
-        if not user:
-            raise HTTPException(404, f"User not found: {user_id}")
-    
-    # Create batch job
-    batch_id = str(uuid.uuid4())
-    batch = {
-        "id": batch_id,
-        "exam_id": request.exam_id,
-        "user_ids": request.user_ids,
-        "status": "pending",
-        "total": len(request.user_ids),
-        "completed": 0,
-        "successful": 0,
-        "failed": 0,
-        "sessions": [],
-        "delay_seconds": request.delay_between_runs_seconds,
-        "created_at": datetime.utcnow()
-    }
-    _batch_jobs[batch_id] = batch
-    
-    # Start batch processing in background
-    background_tasks.add_task(run_batch, batch_id)
-    
-    return {"batch_id": batch_id, "message": f"Batch created with {len(request.user_ids)} users"}
+    missing = await find_missing_users(user_ids)
+    if missing:
+        shown = ", ".join(str(user_id) for user_id in missing[:20])
+        more = f" (+{len(missing) - 20} more)" if len(missing) > 20 else ""
+        raise HTTPException(404, f"Users not found: {shown}{more}")
+
+    # Create batch job, its sessions and items
+    batch_id = uuid.uuid4()
+    session_ids = [uuid.uuid4() for _ in user_ids]
+    batch_deadline = naive_utc(request.deadline)
+    deadline = batch_deadline or exam["registration_deadline"]
+    async with Database.transaction() as conn:
+        await conn.execute("""
+            INSERT INTO automation_batch_jobs (id, exam_id, status, total, delay_seconds, max_attempts, priority, deadline)
+            VALUES ($1, $2, 'pending', $3, $4, $5, $6, $7)
+        """, batch_id, request.exam_id, len(user_ids),
+            max(0, request.delay_between_runs_seconds), max(1, request.max_attempts),
+            request.priority, batch_deadline)
+        await conn.copy_records_to_table(
+            "automation_sessions",
+            records=[(session_id, request.exam_id, user_id, "pending") for session_id, user_id in zip(session_ids, user_ids)],
+            columns=("id", "exam_id", "user_id", "status"),
+        )
+        await conn.copy_records_to_table(
+            "automation_batch_items",
+            records=[
+                (batch_id, request.exam_id, user_id, session_id, request.priority, deadline)
+                for session_id, user_id in zip(session_ids, user_ids)
+            ],
+            columns=("batch_id", "exam_id", "user_id", "session_id", "priority", "deadline"),
+        )
+
+    scheduler = get_batch_scheduler()
+    if scheduler:
+        scheduler.wake()
+
+    projection = await project_batch({"id": batch_id, "exam_id": request.exam_id, "remaining": len(user_ids)})
+    message = f"Batch created with {len(user_ids)} users"
+    if projection.get("at_risk"):
+        message += " - at current capacity it will not finish before the deadline"
+
+    return {"batch_id": str(batch_id), "message": message, **projection}
 
 
 @router.get("/{batch_id}", response_model=BatchStatusResponse)
-async def get_batch_status(batch_id: str):
-    """Get batch job status."""
-    batch = _batch_jobs.get(batch_id)
+async def get_batch_status(
+    batch_id: str,
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = None
+):
+    """
+    Get batch job status with one page of its sessions (items after item id ?after=).
+    For live updates use GET /{batch_id}/events instead of polling.
+    """
+    batch = await batch_counts(_parse_batch_id(batch_id))
     if not batch:
         raise HTTPException(404, "Batch not found")
-    
+
+    query = """
+        SELECT i.id, i.user_id, i.session_id, i.status, i.attempts, i.last_error,
+               u.name AS user_name, u.email AS user_email
+        FROM automation_batch_items i
+        LEFT JOIN users u ON u.id = i.user_id
+        WHERE i.batch_id = $1 AND i.id > $2
+    """
+    args: list = [batch["id"], after]
+    if status:
+        args.append(status)
+        query += f" AND i.status = ${len(args)}"
+    args.append(limit)
+    query += f" ORDER BY i.id LIMIT ${len(args)}"
+    items = await fetch_all(query, *args)
+
+    completed = batch["total"] - batch["remaining"]
+    projection = await project_batch(batch)
     return BatchStatusResponse(
-        id=batch["id"],
+        id=str(batch["id"]),
         status=batch["status"],
         total=batch["total"],
-        completed=batch["completed"],
+        completed=completed,
         successful=batch["successful"],
         failed=batch["failed"],
-        progress=(batch["completed"] / batch["total"]) * 100 if batch["total"] > 0 else 0,
-        sessions=batch.get("sessions", [])
+        progress=(completed / batch["total"]) * 100 if batch["total"] > 0 else 0,
+        priority=batch["priority"],
+        deadline=projection.get("deadline"),
+        paused=projection.get("paused", False),
+        throughput_per_hour=projection.get("throughput_per_hour"),
+        projected_completion_at=projection.get("projected_completion_at"),
+        at_risk=projection.get("at_risk", False),
+        sessions=[
+            {
+                "item_id": i["id"],
+                "session_id": str(i["session_id"]) if i.get("session_id") else None,
+                "user_id": i["user_id"],
+                "user_name": i.get("user_name") or i.get("user_email"),
+                "status": i["status"],
+                "attempts": i["attempts"],
+                "error": i.get("last_error")
+            }
+            for i in items
+        ],
+        next_after=items[-1]["id"] if len(items) == limit else None
+    )
+
+
+def _sse(event: str, data: dict, event_id: str = None) -> str:
+    """One Server-Sent Events frame."""
+    frame = f"id: {event_id}\n" if event_id else ""
+    return frame + f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# SSE event names of topic messages
+_SSE_EVENTS = {MessageTypes.BATCH_PROGRESS: "progress", MessageTypes.BATCH_ITEMS: "items"}
+
+
+async def _batch_snapshot(batch_uuid: uuid.UUID) -> Optional[dict]:
+    batch = await batch_counts(batch_uuid)
+    if not batch:
+        return None
+    return {
+        "batch_id": str(batch["id"]),
+        "exam_id": batch["exam_id"],
+        "status": batch["status"],
+        "current": batch["total"] - batch["remaining"],
+        "total": batch["total"],
+        "successful": batch["successful"],
+        "failed": batch["failed"],
+        "cancelled": batch["cancelled"],
+        **(await project_batch(batch)),
+    }
+
+
+@router.get("/{batch_id}/events")
+async def stream_batch_events(batch_id: str, request: Request, last_event_id: Optional[str] = None):
+    """
+    Stream a batch's progress as Server-Sent Events.
+
+    Events: `snapshot` (aggregate counters, sent first and after any gap), `progress`
+    (counter updates) and `items` (item state transitions). Reconnecting clients send
+    Last-Event-ID (or ?last_event_id=) and get only what they missed; if that is no longer
+    available (ring overflow, or another worker) they get a fresh snapshot instead - then
+    re-page GET /{batch_id} for item states. The stream ends once the batch is finished.
+    """
+    batch_uuid = _parse_batch_id(batch_id)
+    topic = batch_topic(str(batch_uuid))
+    # Listen before reading the snapshot, so nothing published in between is lost
+    queue = manager.listen(topic)
+    buffer = manager.topic_buffer(topic)
+    listened_at = buffer.seq
+    snapshot = await _batch_snapshot(batch_uuid)
+    if not snapshot:
+        manager.unlisten(topic, queue)
+        raise HTTPException(404, "Batch not found")
+    resume_from = request.headers.get("last-event-id") or last_event_id
+
+    async def stream():
+        # Events up to `sent` were delivered (replay) or predate the queue (snapshot)
+        sent = listened_at
+        try:
+            yield "retry: 3000\n\n"
+            replayed = None
+            epoch, _, seq = (resume_from or "").partition(":")
+            if epoch == buffer.epoch and seq.isdigit():
+                events, complete = buffer.since(int(seq))
+                if complete:
+                    replayed = events
+            if replayed is None:
+                yield _sse("snapshot", snapshot, f"{buffer.epoch}:{listened_at}")
+            else:
+                for seq_no, message in replayed:
+                    sent = seq_no
+                    yield _sse(_SSE_EVENTS.get(message.get("type"), "message"), message.get("payload", {}), f"{buffer.epoch}:{seq_no}")
+            if snapshot["status"] in ("completed", "cancelled"):
+                return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.sse_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return  # Fell too far behind; the client reconnects with Last-Event-ID
+                seq_no, message = event
+                if seq_no <= sent:
+                    continue  # Already replayed
+                sent = seq_no
+                payload = message.get("payload", {})
+                yield _sse(_SSE_EVENTS.get(message.get("type"), "message"), payload, f"{buffer.epoch}:{seq_no}")
+                if message.get("type") == MessageTypes.BATCH_PROGRESS and payload.get("status") in ("completed", "cancelled"):
+                    return
+        finally:
+            manager.unlisten(topic, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 @router.get("/")
 async def list_batches():
     """List all batch jobs."""
+    batches = await fetch_all("""
+        SELECT j.id, j.exam_id, j.status, j.total, j.priority, j.deadline, j.created_at,
+            count(i.id) FILTER (WHERE i.status = 'completed') AS successful,
+            count(i.id) FILTER (WHERE i.status = 'failed') AS failed,
+            count(i.id) FILTER (WHERE i.status NOT IN ('queued', 'running')) AS completed
+        FROM automation_batch_jobs j
+        LEFT JOIN automation_batch_items i ON i.batch_id = j.id
+        GROUP BY j.id
+        ORDER BY j.created_at DESC
+    """)
     return [
         {
-            "id": b["id"],
+            "id": str(b["id"]),
+            "exam_id": b["exam_id"],
             "status": b["status"],
             "total": b["total"],
             "completed": b["completed"],
             "successful": b["successful"],
             "failed": b["failed"],
-            "created_at": b["created_at"].isoformat()
+            "priority": b["priority"],
+            "deadline": b["deadline"].isoformat() if b.get("deadline") else None,
+            "created_at": b["created_at"].isoformat() if b.get("created_at") else None
         }
-        for b in _batch_jobs.values()
+        for b in batches
     ]
 
 
 @router.post("/{batch_id}/cancel")
 async def cancel_batch(batch_id: str):
-    """Cancel a running batch job."""
-    batch = _batch_jobs.get(batch_id)
-    if not batch:
-        raise HTTPException(404, "Batch not found")
-    
-    if batch["status"] in ["completed", "failed"]:
-        raise HTTPException(400, "Batch already finished")
-    
-    batch["status"] = "cancelled"
+    """Cancel a batch job: queued items are dropped, running workflows are stopped."""
+    batch_uuid = _parse_batch_id(batch_id)
+    async with Database.transaction() as conn:
+        batch = await conn.fetchrow(
+            "SELECT status FROM automation_batch_jobs WHERE id = $1 FOR UPDATE", batch_uuid
+        )
+        if not batch:
+            raise HTTPException(404, "Batch not found")
+        if batch["status"] in ("completed", "cancelled"):
+            raise HTTPException(400, "Batch already finished")
+
+        await conn.execute("""
+            UPDATE automation_batch_jobs
+            SET status = 'cancelled', completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = $1
+        """, batch_uuid)
+        dropped = await conn.fetch("""
+            UPDATE automation_batch_items
+            SET status = 'cancelled', completed_at = CURRENT_TIMESTAMP
+            WHERE batch_id = $1 AND status = 'queued'
+            RETURNING id, batch_id, exam_id, user_id, session_id, status, attempts, last_error
+        """, batch_uuid)
+        await conn.execute("""
+            UPDATE automation_sessions
+            SET status = 'failed', success = false, error = 'Batch cancelled', completed_at = CURRENT_TIMESTAMP
+            WHERE id = ANY($1::uuid[]) AND status = 'pending'
+        """, [r["session_id"] for r in dropped if r["session_id"]])
+        await roll_up_sessions([r["session_id"] for r in dropped], conn)
+        running = await conn.fetch("""
+            SELECT session_id FROM automation_batch_items
+            WHERE batch_id = $1 AND status = 'running' AND session_id IS NOT NULL
+        """, batch_uuid)
+
+    publish_items([dict(r) for r in dropped])
+    for row in running:
+        await request_stop(str(row["session_id"]))
+    await refresh_batch(batch_uuid)
+
     return {"message": "Batch cancelled"}
 
 
-async def run_batch(batch_id: str):
-    """
-    Run batch processing.
-    Creates workflow sessions for each user sequentially.
-    """
-    batch = _batch_jobs.get(batch_id)
-    if not batch:
-        return
-    
-    batch["status"] = "running"
-    
-    exam_id = batch["exam_id"]
-    delay = batch.get("delay_seconds", 30)
-    
-    # Get exam details
-    exam = await fetch_one("SELECT * FROM automation_exams WHERE id = $1", exam_id)
-    if not exam:
-        batch["status"] = "failed"
-        return
-    
-    for i, user_id in enumerate(batch["user_ids"]):
-        # Check if cancelled
-        if batch["status"] == "cancelled":
-            break
-        
-        try:
-            # Get user
-            user = await fetch_one("SELECT id, name, email FROM users WHERE id = $1", user_id)
-            if not user:
-                batch["failed"] += 1
-                batch["completed"] += 1
-                continue
-            
-            # Create workflow session in PostgreSQL
-            session_id = str(uuid.uuid4())
-            
-            async with Database.connection() as conn:
-                await conn.execute("""
-                    INSERT INTO automation_sessions (id, exam_id, user_id, status, created_at)
-                    VALUES ($1, $2, $3, 'pending', CURRENT_TIMESTAMP)
-                """, uuid.UUID(session_id), exam_id, user_id)
-            
-            # Record session
-            batch["sessions"].append({
-                "session_id": session_id,
-                "user_id": user_id,
-                "user_name": user.get("name") or user.get("email"),
-                "status": "created"
-            })
-            
-            # Broadcast progress
-            await manager.broadcast({
-                "type": MessageTypes.BATCH_PROGRESS,
-                "payload": {
-                    "batch_id": batch_id,
-                    "current": i + 1,
-                    "total": batch["total"],
-                    "user_name": user.get("name") or user.get("email")
-                }
-            })
-            
-            batch["completed"] += 1
-            
-            # Rate limiting - wait between runs
-            if i < len(batch["user_ids"]) - 1:
-                await asyncio.sleep(delay)
-            
-        except Exception as e:
-            print(f"[Batch] Error processing user {user_id}: {e}")
-            batch["failed"] += 1
-            batch["completed"] += 1
-    
-    batch["status"] = "completed" if batch["status"] != "cancelled" else "cancelled"
+@router.post("/{batch_id}/expedite")
+async def expedite_batch(batch_id: str, request: BatchExpediteRequest):
+    """Raise the priority of a batch's queued items (all, or only request.user_ids)."""
+    batch_uuid = _parse_batch_id(batch_id)
+    async with Database.transaction() as conn:
+        batch = await conn.fetchrow("SELECT status FROM automation_batch_jobs WHERE id = $1", batch_uuid)
+        if not batch:
+            raise HTTPException(404, "Batch not found")
+        if batch["status"] in ("completed", "cancelled"):
+            raise HTTPException(400, "Batch already finished")
+
+        if request.user_ids is None:
+            await conn.execute(
+                "UPDATE automation_batch_jobs SET priority = $2, updated_at = CURRENT_TIMESTAMP WHERE id = $1",
+                batch_uuid, request.priority
+            )
+            result = await conn.execute("""
+                UPDATE automation_batch_items SET priority = $2
+                WHERE batch_id = $1 AND status = 'queued'
+            """, batch_uuid, request.priority)
+        else:
+            result = await conn.execute("""
+                UPDATE automation_batch_items SET priority = $2
+                WHERE batch_id = $1 AND status = 'queued' AND user_id = ANY($3::int[])
+            """, batch_uuid, request.priority, request.user_ids)
+
+    scheduler = get_batch_scheduler()
+    if scheduler:
+        scheduler.wake()
+    await refresh_batch(batch_uuid)
+
+    updated = int(result.split()[-1])
+    return {"message": f"{updated} queued item(s) set to priority {request.priority}"}
+
+
+async def _set_exam_paused(exam_id: int, paused: bool) -> None:
+    row = await fetch_one("""
+        UPDATE automation_exams SET batch_paused = $2, updated_at = CURRENT_TIMESTAMP
+        WHERE id = $1
+        RETURNING id
+    """, exam_id, paused)
+    if not row:
+        raise HTTPException(404, "Exam not found")
+
+
+@router.post("/exams/{exam_id}/pause")
+async def pause_exam_batches(exam_id: int):
+    """Stop starting batch items of an exam (running items finish)."""
+    await _set_exam_paused(exam_id, True)
+    return {"message": "Batches paused for exam"}
+
+
+@router.post("/exams/{exam_id}/resume")
+async def resume_exam_batches(exam_id: int):
+    """Start batch items of an exam again."""
+    await _set_exam_paused(exam_id, False)
+    scheduler = get_batch_scheduler()
+    if scheduler:
+        scheduler.wake()
+    return {"message": "Batches resumed for exam"}
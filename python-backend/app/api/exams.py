@@ -5,7 +5,7 @@ CRUD operations for automation exam configurations using PostgreSQL.
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
 from typing import Optional, Any
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 
 from app.services.database import fetch_one, fetch_all, execute, Database
@@ -45,6 +45,7 @@ class ExamCreate(BaseModel):
     notify_on_complete: bool = True
     notify_on_failure: bool = True
     notification_emails: list[str] = []
+    registration_deadline: Optional[datetime] = None  # Batch items are scheduled earliest deadline first
 
 
 class ExamUpdate(BaseModel):
@@ -57,6 +58,7 @@ class ExamUpdate(BaseModel):
     notify_on_complete: Optional[bool] = None
     notify_on_failure: Optional[bool] = None
     notification_emails: Optional[list[str]] = None
+    registration_deadline: Optional[datetime] = None
 
 
 class ExamResponse(BaseModel):
@@ -71,10 +73,19 @@ class ExamResponse(BaseModel):
     notify_on_complete: bool
     notify_on_failure: bool
     notification_emails: list[str]
+    registration_deadline: Optional[datetime] = None
+    batch_paused: bool = False
     created_at: datetime
     updated_at: datetime
 
 
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timezone-aware datetimes as naive UTC (columns are TIMESTAMP without time zone)."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 def row_to_exam_response(row: dict) -> ExamResponse:
     """Convert database row to ExamResponse."""
     # Parse JSONB columns if they're strings (asyncpg returns JSONB as strings)
@@ -101,6 +112,8 @@ def row_to_exam_response(row: dict) -> ExamResponse:
         notify_on_complete=row["notify_on_complete"],
         notify_on_failure=row["notify_on_failure"],
         notification_emails=row["notification_emails"] or [],
+        registration_deadline=row.get("registration_deadline"),
+        batch_paused=row.get("batch_paused") or False,
         created_at=row["created_at"],
         updated_at=row["updated_at"],
     )
@@ -156,8 +169,9 @@ async def create_exam(data: ExamCreate):
     query = """
         INSERT INTO automation_exams (
             name, slug, url, is_active, field_mappings, agent_config,
-            notify_on_complete, notify_on_failure, notification_emails
-        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+            notify_on_complete, notify_on_failure, notification_emails,
+            registration_deadline
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
         RETURNING *
     """
     
@@ -173,6 +187,7 @@ async def create_exam(data: ExamCreate):
             data.notify_on_complete,
             data.notify_on_failure,
             data.notification_emails,
+            naive_utc(data.registration_deadline),
         )
     
     return row_to_exam_response(dict(row))
@@ -231,6 +246,11 @@ async def update_exam(exam_id: int, data: ExamUpdate):
         values.append(data.notification_emails)
         param_count += 1
     
+    if data.registration_deadline is not None:
+        update_fields.append(f"registration_deadline = ${param_count}")
+        values.append(naive_utc(data.registration_deadline))
+        param_count += 1
+    
     if not update_fields:
         # No updates, return existing
         return row_to_exam_response(existing)
@@ -248,8 +268,17 @@ async def update_exam(exam_id: int, data: ExamUpdate):
         RETURNING *
     """
     
-    async with Database.connection() as conn:
+    async with Database.transaction() as conn:
         row = await conn.fetchrow(query, *values)
+        if data.registration_deadline is not None:
+            # Queued batch items follow the exam's deadline unless their batch set its own
+            await conn.execute("""
+                UPDATE automation_batch_items i
+                SET deadline = $2
+                FROM automation_batch_jobs j
+                WHERE j.id = i.batch_id AND j.deadline IS NULL
+                  AND i.exam_id = $1 AND i.status = 'queued'
+            """, exam_id, row["registration_deadline"])
     
     return row_to_exam_response(dict(row))
 
@@ -0,0 +1,51 @@
+"""
+Screenshot API Endpoints
+Serves stored screenshots by content hash.
+Live viewers receive downscaled previews over the WebSocket; full resolution is fetched here on demand.
+"""
+import re
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+
+from app.services.blob_store import get_screenshot_bytes
+from app.services.screenshot_preview import get_preview
+
+
+router = APIRouter()
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+# Content-addressed, so a hash always maps to the same bytes; private because filled forms
+# show applicants' personal data (browser cache only, never shared proxies or CDNs)
+_CACHE_HEADERS = {"Cache-Control": "private, max-age=86400, immutable"}
+
+
+def _media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+@router.get("/{digest}")
+async def get_screenshot(digest: str, width: Optional[int] = None, quality: Optional[int] = None):
+    """
+    Get a screenshot by hash at full resolution,
+    or as a JPEG preview when width (and optionally quality) is given.
+    """
+    if not _DIGEST_RE.match(digest):
+        raise HTTPException(400, "Invalid screenshot hash")
+
+    if width:
+        data = await get_preview(digest, width, quality)
+        media_type = "image/jpeg"
+    else:
+        data = await get_screenshot_bytes(digest)
+        media_type = _media_type(data) if data else None
+
+    if not data:
+        raise HTTPException(404, "Screenshot not found")
+
+    return Response(content=data, media_type=media_type, headers=_CACHE_HEADERS)
@@ -0,0 +1,61 @@
+"""
+Session API Endpoints
+Read access to automation session logs (automation_session_events) and intervention counters.
+"""
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services.session_events import get_session_events
+from app.services.session_counters import get_session_counters
+
+
+router = APIRouter()
+
+
+@router.get("/{session_id}/events")
+async def list_session_events(
+    session_id: str,
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    level: Optional[str] = None
+):
+    """
+    Get a session's log entries, oldest first, in pages.
+    Pass the returned next_after as ?after= to fetch the next page (null when there is none).
+    """
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid session id")
+
+    events = await get_session_events(session_id, after_seq=after, limit=limit, level=level)
+
+    return {
+        "events": [
+            {
+                "seq": e["seq"],
+                "timestamp": e["created_at"].isoformat() if e.get("created_at") else None,
+                "level": e["level"],
+                "message": e["message"],
+                "node": e.get("node")
+            }
+            for e in events
+        ],
+        "next_after": events[-1]["seq"] if len(events) == limit else None
+    }
+
+
+@router.get("/{session_id}/counters")
+async def list_session_counters(session_id: str):
+    """
+    Get a session's intervention counters (otp/captcha/custom requests, LLM captcha solves, retries).
+    Request counters also carry wait_count and wait_seconds_sum: answered requests and time the user took.
+    """
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid session id")
+
+    return await get_session_counters(session_id)
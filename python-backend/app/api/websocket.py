@@ -8,18 +8,230 @@ from typing import Optional, Any
 from datetime import datetime
 import json
 import asyncio
+import base64
+import time
 import uuid
+from collections import deque
 
+from app.config import settings
 from app.services.database import fetch_one, fetch_all, Database
+from app.graph.checkpointer import release_session_checkpoints
+from app.services.action_log import delete_actions
+from app.graph import resume_latency
+from app.services.tracing import bind_session
+from app.services.blob_store import get_blob_store, put_screenshot
+from app.services.screenshot_preview import get_preview, normalize_preview
+from app.services.event_replay import EventReplayBuffer
+from app.services.event_bus import get_event_bus
+from app.services.session_writer import BUFFERED_COLUMNS, get_session_writer
+from app.services.session_events import get_session_event_writer
+from app.services import session_counters
+from app.services.portal_limiter import get_portal_limiter, portal_host
+from app.services.analytics_rollups import roll_up_sessions, unroll_sessions
 
 
 router = APIRouter()
 
 
+# Outbound message classes, in the order they are dropped when a queue overflows:
+# screenshots first (a newer one supersedes them anyway), then logs. Control messages
+# (status, input requests, results, error logs) are never dropped.
+KIND_SCREENSHOT = "screenshot"
+KIND_LOG = "log"
+KIND_CONTROL = "control"
+DROPPABLE_KINDS = (KIND_SCREENSHOT, KIND_LOG)
+# Log levels that are never dropped or held back for batching
+URGENT_LOG_LEVELS = ("error", "critical")
+
+# Subscription topics (batch progress and other non-session events)
+TOPIC_ADMIN = "admin"
+
+
+def batch_topic(batch_id: str) -> str:
+    return f"batch:{batch_id}"
+
+
+def exam_topic(exam_id: Any) -> str:
+    return f"exam:{exam_id}"
+
+
+def is_valid_topic(topic: str) -> bool:
+    prefix, _, key = topic.partition(":")
+    return topic == TOPIC_ADMIN or (prefix in ("batch", "exam") and bool(key))
+
+
+def classify_message(message: dict) -> str:
+    """Outbound class of a message (decides its drop policy)."""
+    msg_type = message.get("type")
+    if msg_type == MessageTypes.SCREENSHOT:
+        return KIND_SCREENSHOT
+    if msg_type == MessageTypes.LOG:
+        level = (message.get("payload") or {}).get("level")
+        return KIND_CONTROL if level in URGENT_LOG_LEVELS else KIND_LOG
+    if msg_type == MessageTypes.LOG_BATCH:
+        entries = (message.get("payload") or {}).get("entries") or []
+        return KIND_CONTROL if any(e.get("level") in URGENT_LOG_LEVELS for e in entries) else KIND_LOG
+    return KIND_CONTROL
+
+
+class ConnectionWriter:
+    """
+    Bounded outbound queue for one WebSocket, drained by its own writer task.
+    Producers (workflow nodes) only enqueue, so a slow browser tab never stalls automation.
+    Each queue item is a list of frames (dict -> JSON text, bytes -> binary) sent back to back.
+    """
+    
+    def __init__(self, websocket: WebSocket, on_failure, max_queue: int, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max(1, max_queue)
+        self.send_timeout = send_timeout
+        self.queue: deque[tuple[str, list]] = deque()
+        self.sent = 0
+        self.sent_bytes = 0
+        self.dropped = {kind: 0 for kind in DROPPABLE_KINDS}
+        self.superseded = 0
+        self.max_depth = 0
+        self.closed = False
+        self._on_failure = on_failure
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+    
+    def enqueue(self, kind: str, frames: list) -> None:
+        """Queue frames without waiting. Applies the screenshot/log drop policy."""
+        if self.closed:
+            return
+        
+        if kind == KIND_SCREENSHOT:
+            # An unsent screenshot is stale once a newer one arrives
+            before = len(self.queue)
+            self.queue = deque(item for item in self.queue if item[0] != KIND_SCREENSHOT)
+            self.superseded += before - len(self.queue)
+        
+        if len(self.queue) >= self.max_queue:
+            self._drop_one()
+        
+        self.queue.append((kind, frames))
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+    
+    def _drop_one(self) -> None:
+        """Drop the oldest screenshot, else the oldest log. Control messages may exceed the bound."""
+        for kind in DROPPABLE_KINDS:
+            for index, item in enumerate(self.queue):
+                if item[0] == kind:
+                    del self.queue[index]
+                    self.dropped[kind] += 1
+                    return
+    
+    async def _send_frame(self, frame: Any) -> None:
+        if isinstance(frame, (bytes, bytearray)):
+            await self.websocket.send_bytes(frame)
+            self.sent_bytes += len(frame)
+        elif isinstance(frame, str):
+            await self.websocket.send_text(frame)
+            self.sent_bytes += len(frame)
+        else:
+            text = json.dumps(frame, default=str)
+            await self.websocket.send_text(text)
+            self.sent_bytes += len(text)
+    
+    async def _run(self) -> None:
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            
+            _, frames = self.queue.popleft()
+            try:
+                for frame in frames:
+                    await asyncio.wait_for(self._send_frame(frame), timeout=self.send_timeout)
+                self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ WebSocket writer stopped ({type(e).__name__}: {e})")
+                self.closed = True
+                self.queue.clear()
+                self._on_failure(self.websocket)
+                return
+    
+    def close(self) -> None:
+        """Stop the writer task; unsent messages are discarded."""
+        self.closed = True
+        self.queue.clear()
+        if not self._task.done():
+            self._task.cancel()
+    
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "dropped": dict(self.dropped),
+            "superseded_screenshots": self.superseded,
+        }
+
+
+class LogBatcher:
+    """
+    Coalesces one session's log lines into LOG_BATCH messages.
+    Lines are held for up to `window` seconds or `max_entries` lines, then emitted as one
+    frame. The caller flushes early before any non-log message so ordering is preserved;
+    error/critical lines flush immediately.
+    Counts frames/bytes as they would have been unbatched vs. as actually emitted.
+    """
+    
+    def __init__(self, session_id: str, emit, window: float, max_entries: int):
+        self.session_id = session_id
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self.entries: list[dict] = []
+        self.started_at = time.monotonic()
+        self.stats = {"logs": 0, "unbatched_bytes": 0, "frames": 0, "bytes": 0}
+        self._emit = emit
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    def add(self, entry: dict) -> None:
+        self.entries.append(entry)
+        self.stats["logs"] += 1
+        self.stats["unbatched_bytes"] += len(json.dumps({"type": MessageTypes.LOG, "payload": entry}))
+        if entry.get("level") in URGENT_LOG_LEVELS or len(self.entries) >= self.max_entries:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+    
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.entries:
+            return
+        entries, self.entries = self.entries, []
+        if len(entries) == 1:
+            message = {"type": MessageTypes.LOG, "payload": entries[0]}
+        else:
+            message = {"type": MessageTypes.LOG_BATCH, "payload": {"entries": entries}}
+        self.stats["frames"] += 1
+        self.stats["bytes"] += len(json.dumps(message))
+        self._emit(self.session_id, message)
+    
+    def metrics(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return {
+            **self.stats,
+            "pending": len(self.entries),
+            "unbatched_frames_per_sec": round(self.stats["logs"] / elapsed, 2),
+            "frames_per_sec": round(self.stats["frames"] / elapsed, 2),
+        }
+
+
 class ConnectionManager:
     """
     WebSocket connection manager.
     Handles multiple clients and message broadcasting.
+    Every connection gets a ConnectionWriter, so sends never block the caller.
     """
     
     def __init__(self):
@@ -27,54 +239,353 @@ class ConnectionManager:
         self.active_connections: dict[str, list[WebSocket]] = {}
         # Map WebSocket -> session_id (reverse lookup)
         self.connection_sessions: dict[WebSocket, str] = {}
+        # Map WebSocket -> outbound writer
+        self.writers: dict[WebSocket, ConnectionWriter] = {}
+        # Map WebSocket -> screenshot preview preferences (set by SET_PREVIEW)
+        self.preview_prefs: dict[WebSocket, dict] = {}
+        # Map session_id -> recent events for reconnecting viewers
+        self.replay: dict[str, EventReplayBuffer] = {}
+        # Map session_id -> pending log lines awaiting a LOG_BATCH
+        self.log_batchers: dict[str, LogBatcher] = {}
+        # Map topic -> subscribed connections, and the reverse
+        self.topics: dict[str, set[WebSocket]] = {}
+        self.connection_topics: dict[WebSocket, set[str]] = {}
+        # Map throttle key -> (last publish time, held message, timer) for rate-limited topics
+        self._throttled: dict[str, dict] = {}
+        # Map batch topic -> recent events (for Server-Sent Events resume), and its SSE listeners
+        self.topic_replay: dict[str, EventReplayBuffer] = {}
+        self.topic_listeners: dict[str, set[asyncio.Queue]] = {}
+        # Totals from closed connections (so metrics survive disconnects)
+        self.closed_totals = {"sent": 0, "sent_bytes": 0, "dropped": {kind: 0 for kind in DROPPABLE_KINDS}}
     
     async def connect(self, websocket: WebSocket, session_id: str = None):
         """Accept a new WebSocket connection."""
         await websocket.accept()
         
+        self.writers[websocket] = ConnectionWriter(
+            websocket,
+            on_failure=self._writer_failed,
+            max_queue=settings.ws_queue_max,
+            send_timeout=settings.ws_send_timeout_seconds,
+        )
         if session_id:
-            if session_id not in self.active_connections:
-                self.active_connections[session_id] = []
-            self.active_connections[session_id].append(websocket)
-            self.connection_sessions[websocket] = session_id
+            self.attach(websocket, session_id)
         
         print(f"🔌 WebSocket connected: {session_id or 'no session'}")
     
+    def attach(self, websocket: WebSocket, session_id: str):
+        """Register a connection as a viewer of a session."""
+        connections = self.active_connections.setdefault(session_id, [])
+        if websocket not in connections:
+            connections.append(websocket)
+        self.connection_sessions[websocket] = session_id
+    
     def disconnect(self, websocket: WebSocket):
-        """Remove a WebSocket connection."""
+        """Remove a WebSocket connection (safe to call more than once)."""
         session_id = self.connection_sessions.get(websocket)
         
         if session_id and session_id in self.active_connections:
-            self.active_connections[session_id].remove(websocket)
+            if websocket in self.active_connections[session_id]:
+                self.active_connections[session_id].remove(websocket)
             if not self.active_connections[session_id]:
                 del self.active_connections[session_id]
         
         if websocket in self.connection_sessions:
             del self.connection_sessions[websocket]
         
-        label = session_id if session_id else "no session yet (client closed before START_WORKFLOW)"
+        self.preview_prefs.pop(websocket, None)
+        topics = list(self.connection_topics.get(websocket, ()))
+        for topic in topics:
+            self.unsubscribe(websocket, topic)
+        writer = self.writers.pop(websocket, None)
+        if writer is None:
+            return
+        writer.close()
+        self.closed_totals["sent"] += writer.sent
+        self.closed_totals["sent_bytes"] += writer.sent_bytes
+        for kind, count in writer.dropped.items():
+            self.closed_totals["dropped"][kind] += count
+        
+        if session_id:
+            label = session_id
+        elif topics:
+            label = f"subscriber of {', '.join(sorted(topics))}"
+        else:
+            label = "no session yet (client closed before START_WORKFLOW)"
         print(f"❌ WebSocket disconnected: {label}")
     
+    def _writer_failed(self, websocket: WebSocket):
+        """A send failed or timed out: drop the connection so it stops accumulating messages."""
+        self.disconnect(websocket)
+        asyncio.create_task(self._close_quietly(websocket))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+    
+    def enqueue(self, websocket: WebSocket, message: dict, kind: str = None):
+        """Queue a message for one connection (never blocks)."""
+        writer = self.writers.get(websocket)
+        if writer:
+            writer.enqueue(kind or classify_message(message), [message])
+    
+    def enqueue_frames(self, websocket: WebSocket, kind: str, frames: list):
+        """Queue several frames to be sent back to back (e.g. a header + binary body)."""
+        writer = self.writers.get(websocket)
+        if writer:
+            writer.enqueue(kind, frames)
+    
+    def set_preview(self, websocket: WebSocket, payload: dict):
+        """Store a viewer's screenshot preview preferences (width, quality, binary frames)."""
+        width, quality = normalize_preview(payload.get("width"), payload.get("quality"))
+        self.preview_prefs[websocket] = {
+            "width": width,
+            "quality": quality,
+            "binary": bool(payload.get("binary", True)),
+        }
+    
+    def preview_for(self, websocket: WebSocket) -> dict:
+        """Preview preferences of a viewer (server defaults, JSON frames, if it never sent SET_PREVIEW)."""
+        prefs = self.preview_prefs.get(websocket)
+        if prefs is None:
+            width, quality = normalize_preview()
+            prefs = {"width": width, "quality": quality, "binary": False}
+        return prefs
+    
     async def send_personal(self, websocket: WebSocket, message: dict):
         """Send a message to a specific connection."""
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            print(f"Error sending message: {e}")
+        self.enqueue(websocket, message)
+    
+    def replay_buffer(self, session_id: str, epoch: str = None) -> EventReplayBuffer:
+        """
+        Get or create a session's replay buffer (idle buffers of unwatched sessions expire).
+        epoch is given for another worker's stream: a mirror numbered by an older epoch of the
+        owner (it restarted, or its buffer expired) is started over with the new numbering.
+        """
+        buffer = self.replay.get(session_id)
+        if buffer is None:
+            self._expire_replay_buffers()
+        if buffer is None or (epoch and buffer.epoch != epoch):
+            buffer = self.replay[session_id] = EventReplayBuffer(settings.ws_replay_buffer_size, epoch)
+        return buffer
+    
+    def _expire_replay_buffers(self):
+        cutoff = time.monotonic() - settings.ws_replay_ttl_seconds
+        for session_id, buffer in list(self.replay.items()):
+            if buffer.touched_at < cutoff and session_id not in self.active_connections:
+                del self.replay[session_id]
+                self.log_batchers.pop(session_id, None)
+    
+    def record(self, session_id: str, message: dict, seq: int = None, epoch: str = None) -> dict:
+        """
+        Append a session event to its replay buffer; returns the message stamped with its
+        seq and the buffer's epoch (seqs restart at 1 in a new epoch).
+        seq and epoch are given for events from another worker, which numbered them already.
+        """
+        buffer = self.replay_buffer(session_id, epoch)
+        message = {key: value for key, value in message.items() if key not in ("seq", "epoch")}
+        seq = buffer.append(message, seq)
+        msg_type = message.get("type")
+        if msg_type == MessageTypes.STATUS:
+            buffer.last_status = (seq, message)
+        elif msg_type in INPUT_REQUEST_TYPES:
+            buffer.pending_input = (seq, message)
+        elif msg_type == MessageTypes.RESULT:
+            buffer.pending_input = None
+        return {**message, "seq": seq, "epoch": buffer.epoch}
+    
+    def clear_pending_input(self, session_id: str):
+        """The user answered the input request - don't replay it any more."""
+        buffer = self.replay.get(session_id)
+        if buffer:
+            buffer.pending_input = None
     
     async def send_to_session(self, session_id: str, message: dict):
-        """Send a message to all connections watching a session."""
-        if session_id in self.active_connections:
-            for connection in self.active_connections[session_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error sending to session {session_id}: {e}")
+        """
+        Send a message to all connections watching a session (recorded for replay).
+        Log lines are coalesced into LOG_BATCH messages; anything else flushes them first.
+        """
+        if message.get("type") == MessageTypes.LOG and settings.ws_log_batch_window_ms > 0:
+            self.log_batcher(session_id).add(message.get("payload") or {})
+            return
+        self.flush_logs(session_id)
+        self._dispatch(session_id, message)
+    
+    def _dispatch(self, session_id: str, message: dict):
+        kind = classify_message(message)
+        if kind != KIND_SCREENSHOT:
+            message = self.record(session_id, message)
+            get_event_bus().publish({"kind": "session", "session_id": session_id, "message": message})
+        self.deliver_local(session_id, message, kind)
+    
+    def deliver_local(self, session_id: str, message: dict, kind: str = None):
+        """Queue a message for the viewers of a session connected to this worker."""
+        kind = kind or classify_message(message)
+        for connection in list(self.active_connections.get(session_id, ())):
+            self.enqueue(connection, message, kind)
+    
+    def log_batcher(self, session_id: str) -> LogBatcher:
+        batcher = self.log_batchers.get(session_id)
+        if batcher is None:
+            batcher = self.log_batchers[session_id] = LogBatcher(
+                session_id,
+                self._dispatch,
+                window=settings.ws_log_batch_window_ms / 1000,
+                max_entries=settings.ws_log_batch_max,
+            )
+        return batcher
+    
+    def flush_logs(self, session_id: str):
+        """Send a session's pending log lines now."""
+        batcher = self.log_batchers.get(session_id)
+        if batcher:
+            batcher.flush()
+    
+    def subscribe(self, websocket: WebSocket, topic: str):
+        """Subscribe a connection to a topic (batch:<id>, exam:<id> or admin)."""
+        self.topics.setdefault(topic, set()).add(websocket)
+        self.connection_topics.setdefault(websocket, set()).add(topic)
+    
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.topics[topic]
+        topics = self.connection_topics.get(websocket)
+        if topics is not None:
+            topics.discard(topic)
+            if not topics:
+                del self.connection_topics[websocket]
+    
+    def publish(self, topics: list[str], message: dict, throttle_key: str = None):
+        """
+        Send a message to the subscribers of any of the topics (each connection once).
+        With a throttle_key, publishes are rate-limited to one per ws_topic_min_interval_ms:
+        in-between messages are held and only the latest is sent when the interval ends.
+        """
+        interval = settings.ws_topic_min_interval_ms / 1000
+        if throttle_key is None or interval <= 0:
+            self._deliver(topics, message)
+            return
+        
+        state = self._throttled.setdefault(throttle_key, {"last": 0.0, "held": None, "timer": None})
+        wait = state["last"] + interval - time.monotonic()
+        if wait <= 0 and state["timer"] is None:
+            state["last"] = time.monotonic()
+            self._deliver(topics, message)
+            return
+        state["held"] = (topics, message)
+        if state["timer"] is None:
+            state["timer"] = asyncio.get_running_loop().call_later(max(wait, 0), self._release_held, throttle_key)
+    
+    def flush_topic(self, throttle_key: str):
+        """Send a rate-limited stream's held message now (e.g. before its final event)."""
+        state = self._throttled.get(throttle_key)
+        if state and state["timer"] is not None:
+            state["timer"].cancel()
+            self._release_held(throttle_key)
+    
+    def _release_held(self, throttle_key: str):
+        state = self._throttled.get(throttle_key)
+        if not state:
+            return
+        held, state["held"], state["timer"] = state["held"], None, None
+        if held:
+            state["last"] = time.monotonic()
+            self._deliver(*held)
+    
+    def close_topic_stream(self, throttle_key: str):
+        """Forget a finished stream's rate-limit state."""
+        self.flush_topic(throttle_key)
+        self._throttled.pop(throttle_key, None)
+    
+    def _deliver(self, topics: list[str], message: dict):
+        get_event_bus().publish({"kind": "topic", "topics": topics, "message": message})
+        self.deliver_topics_local(topics, message)
+    
+    def deliver_topics_local(self, topics: list[str], message: dict):
+        """Queue a message for this worker's subscribers of any of the topics."""
+        recipients: set[WebSocket] = set()
+        for topic in topics:
+            recipients.update(self.topics.get(topic, ()))
+            if topic.startswith("batch:"):
+                self._record_topic(topic, message)
+        kind = classify_message(message)
+        for connection in recipients:
+            self.enqueue(connection, message, kind)
+    
+    def topic_buffer(self, topic: str) -> EventReplayBuffer:
+        """Get or create a batch topic's replay buffer (idle buffers without listeners expire)."""
+        buffer = self.topic_replay.get(topic)
+        if buffer is None:
+            cutoff = time.monotonic() - settings.ws_replay_ttl_seconds
+            for key, idle in list(self.topic_replay.items()):
+                if idle.touched_at < cutoff and key not in self.topic_listeners:
+                    del self.topic_replay[key]
+            buffer = self.topic_replay[topic] = EventReplayBuffer(settings.ws_replay_buffer_size)
+        return buffer
+    
+    def _record_topic(self, topic: str, message: dict):
+        buffer = self.topic_buffer(topic)
+        seq = buffer.append(message)
+        if message.get("type") == MessageTypes.BATCH_PROGRESS:
+            buffer.last_status = (seq, message)
+        for queue in list(self.topic_listeners.get(topic, ())):
+            if queue.qsize() >= settings.sse_queue_max:
+                # Too slow: end its stream, the client resumes from its Last-Event-ID
+                self.unlisten(topic, queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait((seq, message))
+    
+    def listen(self, topic: str) -> asyncio.Queue:
+        """Queue receiving (seq, message) for every event of a batch topic; None ends the stream."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self.topic_listeners.setdefault(topic, set()).add(queue)
+        return queue
+    
+    def unlisten(self, topic: str, queue: asyncio.Queue):
+        listeners = self.topic_listeners.get(topic)
+        if listeners is not None:
+            listeners.discard(queue)
+            if not listeners:
+                del self.topic_listeners[topic]
     
     async def broadcast(self, message: dict):
         """Send a message to all connected clients."""
-        for session_id in self.active_connections:
-            await self.send_to_session(session_id, message)
+        kind = classify_message(message)
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                self.enqueue(connection, message, kind)
+    
+    def metrics(self) -> dict:
+        """Queue depth, sent and drop counters per session and in total."""
+        sessions: dict[str, list[dict]] = {}
+        totals = {
+            "connections": len(self.writers),
+            "queued": 0,
+            "sent": self.closed_totals["sent"],
+            "sent_bytes": self.closed_totals["sent_bytes"],
+            "dropped": dict(self.closed_totals["dropped"]),
+        }
+        for websocket, writer in self.writers.items():
+            m = writer.metrics()
+            sessions.setdefault(self.connection_sessions.get(websocket, "unattached"), []).append(m)
+            totals["queued"] += m["queue_depth"]
+            totals["sent"] += m["sent"]
+            totals["sent_bytes"] += m["sent_bytes"]
+            for kind, count in m["dropped"].items():
+                totals["dropped"][kind] += count
+        log_batching = {session_id: b.metrics() for session_id, b in self.log_batchers.items()}
+        totals["log_batching"] = {
+            key: sum(m[key] for m in log_batching.values())
+            for key in ("logs", "unbatched_bytes", "frames", "bytes")
+        }
+        return {"totals": totals, "sessions": sessions, "log_batching": log_batching}
 
 
 # Global connection manager
@@ -83,6 +594,41 @@ manager = ConnectionManager()
 # Running workflow tasks and cancelled sessions (so no API calls run after stop)
 _running_workflow_tasks: dict[str, asyncio.Task] = {}
 _cancelled_sessions: set[str] = set()
+# Sessions started on this worker and not finished yet (their viewer input is handled here)
+_owned_sessions: set[str] = set()
+# Sessions whose paused LangGraph workflow is being resumed on this worker
+_resuming_sessions: set[str] = set()
+# session_id -> portal host of a LangGraph session waiting for input (slot given back meanwhile)
+_paused_hosts: dict[str, str] = {}
+
+
+# Statuses after which a session never resumes (its checkpoints can be dropped)
+TERMINAL_STATUSES = ("completed", "failed", "stopped")
+
+
+def _release_owned(session_id: str):
+    """A session of this worker finished (or was stopped): forget it and free its portal slot."""
+    _owned_sessions.discard(session_id)
+    _paused_hosts.pop(session_id, None)
+    session_counters.discard(session_id)
+    get_portal_limiter().release(session_id)
+
+
+def _release_paused(session_id: str):
+    """A LangGraph session is waiting for input: free its portal slot until it is resumed."""
+    limiter = get_portal_limiter()
+    host = limiter.session_hosts.get(session_id)
+    if host:
+        _paused_hosts[session_id] = host
+    limiter.release(session_id)
+
+
+async def _release_session_state(session_id: str):
+    """A session reached a terminal status: drop its checkpoints and action log, unpin its screenshot."""
+    await release_session_checkpoints(session_id)
+    await delete_actions(session_id)
+    await get_blob_store().unpin(session_id)
+    resume_latency.discard(session_id)
 
 
 def is_session_cancelled(session_id: str) -> bool:
@@ -102,6 +648,10 @@ class MessageTypes:
     PAUSE_WORKFLOW = "PAUSE_WORKFLOW"
     RESUME_WORKFLOW = "RESUME_WORKFLOW"
     STOP_WORKFLOW = "STOP_WORKFLOW"
+    SET_PREVIEW = "SET_PREVIEW"
+    RESUME_FROM = "RESUME_FROM"
+    SUBSCRIBE = "SUBSCRIBE"
+    UNSUBSCRIBE = "UNSUBSCRIBE"
     
     # Server -> Client
     LOG = "LOG"
@@ -112,7 +662,25 @@ class MessageTypes:
     REQUEST_CUSTOM = "REQUEST_CUSTOM_INPUT"
     STATUS = "STATUS"
     BATCH_PROGRESS = "BATCH_PROGRESS"
+    BATCH_ITEMS = "BATCH_ITEMS"
     RESULT = "RESULT"
+    LOG_BATCH = "LOG_BATCH"
+    SUBSCRIBED = "SUBSCRIBED"
+    REPLAY_COMPLETE = "REPLAY_COMPLETE"
+
+
+# Input requests stay replayable until answered
+INPUT_REQUEST_TYPES = (MessageTypes.REQUEST_OTP, MessageTypes.REQUEST_CAPTCHA, MessageTypes.REQUEST_CUSTOM)
+
+# Viewer input handled by the worker running the session
+SESSION_CONTROL_TYPES = (
+    MessageTypes.OTP_SUBMIT,
+    MessageTypes.CAPTCHA_SUBMIT,
+    MessageTypes.CUSTOM_SUBMIT,
+    MessageTypes.PAUSE_WORKFLOW,
+    MessageTypes.RESUME_WORKFLOW,
+    MessageTypes.STOP_WORKFLOW,
+)
 
 
 # ============= Session Helpers (PostgreSQL) =============
@@ -134,18 +702,37 @@ async def create_session(exam_id: int, user_id: int) -> str:
 
 
 async def get_session(session_id: str) -> Optional[dict]:
-    """Get session by ID."""
-    return await fetch_one(
+    """Get session by ID (including progress still in the write-behind buffer)."""
+    session = await fetch_one(
         "SELECT * FROM automation_sessions WHERE id = $1",
         uuid.UUID(session_id)
     )
+    writer = get_session_writer()
+    if session and writer:
+        session.update(writer.peek(session_id))
+    return session
 
 
 async def update_session(session_id: str, **kwargs) -> None:
-    """Update session fields."""
+    """
+    Update session fields.
+    Progress-only updates are buffered and written in batches (see session_writer);
+    anything else is written now, along with the session's buffered progress.
+    Status changes keep the analytics rollups in step (see analytics_rollups).
+    """
     if not kwargs:
         return
     
+    writer = get_session_writer()
+    if writer:
+        if set(kwargs) <= BUFFERED_COLUMNS:
+            fields = {key: value for key, value in kwargs.items() if value is not None}
+            if fields:
+                writer.add(session_id, fields)
+            return
+        kwargs = {**writer.take(session_id), **{k: v for k, v in kwargs.items() if v is not None}}
+        await writer.settle()
+    
     # Build dynamic update query
     fields = []
     values = []
@@ -164,46 +751,50 @@ async def update_session(session_id: str, **kwargs) -> None:
     if not fields:
         return
     
-    values.append(uuid.UUID(session_id))
+    session_uuid = uuid.UUID(session_id)
+    values.append(session_uuid)
     query = f"""
         UPDATE automation_sessions 
         SET {', '.join(fields)}, updated_at = CURRENT_TIMESTAMP
         WHERE id = ${param_count}
     """
     
-    async with Database.connection() as conn:
+    if not kwargs.get("status"):
+        async with Database.connection() as conn:
+            await conn.execute(query, *values)
+        return
+    
+    # Take the session out of the rollups under its old status and add it back under the new
+    # one (roll_up_sessions skips non-terminal statuses), atomically
+    async with Database.transaction() as conn:
+        await unroll_sessions([session_uuid], conn)
         await conn.execute(query, *values)
+        await roll_up_sessions([session_uuid], conn)
 
 
 async def add_session_log(session_id: str, message: str, level: str = "info", node: str = None):
-    """Add a log entry to session."""
-    log_entry = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "level": level,
-        "message": message,
-        "node": node
-    }
-    
-    # Append to logs JSONB array
-    query = """
-        UPDATE automation_sessions 
-        SET logs = logs || $1::jsonb, updated_at = CURRENT_TIMESTAMP
-        WHERE id = $2
-    """
-    
-    async with Database.connection() as conn:
-        await conn.execute(query, json.dumps([log_entry]), uuid.UUID(session_id))
+    """Add a log entry to session (queued; written in batches to automation_session_events)."""
+    get_session_event_writer().append(session_id, level, message, node)
 
 
 # ============= WebSocket Endpoints =============
 
 @router.websocket("/workflow/{session_id}")
-async def workflow_websocket(websocket: WebSocket, session_id: str):
+async def workflow_websocket(
+    websocket: WebSocket,
+    session_id: str,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None
+):
     """
     WebSocket endpoint for workflow monitoring.
     Clients connect here to receive real-time updates.
+    Pass ?since=<last seq seen> (0 for everything buffered) to replay missed events first,
+    with &epoch=<epoch of that seq> so a seq from an older buffer isn't taken for a current one.
     """
     await manager.connect(websocket, session_id)
+    if since is not None:
+        await replay_session(websocket, session_id, since, epoch)
     
     try:
         while True:
@@ -233,15 +824,15 @@ async def workflow_websocket_new(websocket: WebSocket):
             data = await websocket.receive_text()
             message = json.loads(data)
             
+            # Preview preferences may arrive before the session exists
+            if message.get("type") == MessageTypes.SET_PREVIEW:
+                manager.set_preview(websocket, message.get("payload", {}))
             # Handle START_WORKFLOW to get session ID
-            if message.get("type") == MessageTypes.START_WORKFLOW:
+            elif message.get("type") == MessageTypes.START_WORKFLOW:
                 session_id = await handle_start_workflow(websocket, message)
                 if session_id:
                     # Register connection with session
-                    if session_id not in manager.active_connections:
-                        manager.active_connections[session_id] = []
-                    manager.active_connections[session_id].append(websocket)
-                    manager.connection_sessions[websocket] = session_id
+                    manager.attach(websocket, session_id)
             else:
                 session_id = manager.connection_sessions.get(websocket)
                 if session_id:
@@ -254,6 +845,58 @@ async def workflow_websocket_new(websocket: WebSocket):
         manager.disconnect(websocket)
 
 
+@router.websocket("/batches")
+async def batches_websocket(
+    websocket: WebSocket,
+    batch_id: Optional[str] = None,
+    exam_id: Optional[int] = None,
+    admin: bool = False
+):
+    """
+    WebSocket endpoint for batch progress.
+    Subscribe with ?batch_id=, ?exam_id= or ?admin=true (all batches),
+    or later with SUBSCRIBE / UNSUBSCRIBE messages: {"type": "SUBSCRIBE", "payload": {"topic": "batch:<id>"}}.
+    Only BATCH_PROGRESS events of subscribed topics are delivered.
+    """
+    await manager.connect(websocket)
+    if batch_id:
+        manager.subscribe(websocket, batch_topic(batch_id))
+    if exam_id is not None:
+        manager.subscribe(websocket, exam_topic(exam_id))
+    if admin:
+        manager.subscribe(websocket, TOPIC_ADMIN)
+    
+    try:
+        while True:
+            data = await websocket.receive_text()
+            message = json.loads(data)
+            msg_type = message.get("type")
+            topic = str((message.get("payload") or {}).get("topic") or "")
+            
+            if msg_type not in (MessageTypes.SUBSCRIBE, MessageTypes.UNSUBSCRIBE):
+                continue
+            if not is_valid_topic(topic):
+                manager.enqueue(websocket, {
+                    "type": "ERROR",
+                    "payload": {"message": f"Unknown topic: {topic}"}
+                })
+                continue
+            if msg_type == MessageTypes.SUBSCRIBE:
+                manager.subscribe(websocket, topic)
+            else:
+                manager.unsubscribe(websocket, topic)
+            manager.enqueue(websocket, {
+                "type": MessageTypes.SUBSCRIBED,
+                "payload": {"topics": sorted(manager.connection_topics.get(websocket, ()))}
+            })
+    
+    except WebSocketDisconnect:
+        manager.disconnect(websocket)
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+        manager.disconnect(websocket)
+
+
 # ============= Message Handlers =============
 
 async def handle_client_message(websocket: WebSocket, session_id: str, message: dict):
@@ -261,6 +904,29 @@ async def handle_client_message(websocket: WebSocket, session_id: str, message:
     msg_type = message.get("type")
     payload = message.get("payload", {})
     
+    if msg_type in SESSION_CONTROL_TYPES:
+        bus = get_event_bus()
+        if bus.distributed and session_id not in _owned_sessions:
+            # The workflow runs on another worker - let its owner handle the input
+            bus.publish({"kind": "control", "session_id": session_id, "message": message})
+        else:
+            await handle_session_control(session_id, msg_type, payload)
+    
+    elif msg_type == MessageTypes.SET_PREVIEW:
+        manager.set_preview(websocket, payload)
+    
+    elif msg_type == MessageTypes.RESUME_FROM:
+        await replay_session(websocket, session_id, int(payload.get("seq") or 0), payload.get("epoch"))
+    
+    else:
+        await manager.send_personal(websocket, {
+            "type": "ERROR",
+            "payload": {"message": f"Unknown message type: {msg_type}"}
+        })
+
+
+async def handle_session_control(session_id: str, msg_type: str, payload: dict):
+    """Handle viewer input for a workflow running on this worker."""
     if msg_type == MessageTypes.OTP_SUBMIT:
         await handle_otp_submit(session_id, payload)
     
@@ -278,12 +944,27 @@ async def handle_client_message(websocket: WebSocket, session_id: str, message:
     
     elif msg_type == MessageTypes.STOP_WORKFLOW:
         await handle_stop_workflow(session_id)
+
+
+async def on_bus_event(envelope: dict):
+    """Handle an envelope published by another worker (see app.services.event_bus)."""
+    kind = envelope.get("kind")
+    session_id = envelope.get("session_id")
     
-    else:
-        await manager.send_personal(websocket, {
-            "type": "ERROR",
-            "payload": {"message": f"Unknown message type: {msg_type}"}
-        })
+    if kind == "session":
+        message = envelope["message"]
+        message = manager.record(session_id, message, seq=message.get("seq"), epoch=message.get("epoch"))
+        manager.deliver_local(session_id, message)
+    
+    elif kind == "screenshot":
+        await _show_screenshot(session_id, envelope["shot"])
+    
+    elif kind == "topic":
+        manager.deliver_topics_local(envelope["topics"], envelope["message"])
+    
+    elif kind == "control" and session_id in _owned_sessions:
+        message = envelope["message"]
+        await handle_session_control(session_id, message.get("type"), message.get("payload", {}))
 
 
 async def handle_start_workflow(websocket: WebSocket, message: dict) -> Optional[str]:
@@ -365,22 +1046,46 @@ async def handle_start_workflow(websocket: WebSocket, message: dict) -> Optional
             pass
     
     # Start workflow in background task
+    start_workflow_task(session_id, exam, user_id_int, user_data)
+    return session_id
+
+
+def start_workflow_task(session_id: str, exam: dict, user_id: int, user_data: dict) -> asyncio.Task:
+    """Run a session's workflow in a background task owned by this worker."""
     _cancelled_sessions.discard(session_id)
-    exam_slug = exam.get("slug", "")
     task = asyncio.create_task(
         execute_workflow(
             session_id=session_id,
-            exam_id=exam_id_int,
-            user_id=user_id_int,
+            exam_id=exam["id"],
+            user_id=user_id,
             exam_url=exam["url"],
             exam_name=exam["name"],
-            exam_slug=exam_slug,
+            exam_slug=exam.get("slug", ""),
             field_mappings=exam.get("field_mappings", {}),
             user_data=user_data,
         )
     )
     _running_workflow_tasks[session_id] = task
-    return session_id
+    _owned_sessions.add(session_id)
+    return task
+
+
+def abort_workflow(session_id: str):
+    """Stop a session's workflow on this worker without any database write (it may be unreachable)."""
+    _cancelled_sessions.add(session_id)
+    _release_owned(session_id)
+    task = _running_workflow_tasks.get(session_id)
+    if task and not task.done():
+        task.cancel()
+
+
+async def request_stop(session_id: str):
+    """Stop a session's workflow, on whichever worker runs it."""
+    bus = get_event_bus()
+    if bus.distributed and session_id not in _owned_sessions:
+        bus.publish({"kind": "control", "session_id": session_id, "message": {"type": MessageTypes.STOP_WORKFLOW}})
+    else:
+        await handle_stop_workflow(session_id)
 
 
 async def execute_workflow(
@@ -397,6 +1102,7 @@ async def execute_workflow(
     Execute the workflow. Uses a deterministic playbook if one exists for
     the exam, otherwise falls back to the LLM-driven LangGraph approach.
     """
+    bind_session(session_id, exam_id)
     try:
         # Send user data dict to client so they can see it in the activity log
         await send_user_data(session_id, user_data)
@@ -405,6 +1111,15 @@ async def execute_workflow(
         from app.graph.playbook_executor import load_playbook, run_playbook
         playbook = load_playbook(exam_slug)
 
+        # Wait for a slot on the exam portal (shared with every other session on it)
+        host = portal_host((playbook or {}).get("start_url") or exam_url)
+        waited = await get_portal_limiter().admit(session_id, host)
+        if waited >= 1:
+            await send_log(session_id, f"⏳ Waited {waited:.0f}s for a free slot on {host}", "info")
+        if is_session_cancelled(session_id):
+            _release_owned(session_id)
+            return
+
         if playbook:
             await send_log(session_id, f"📖 Found playbook for {exam_name}", "info")
             
@@ -413,7 +1128,7 @@ async def execute_workflow(
             if start_from_step:
                 await send_log(session_id, f"🔧 DEBUG: Starting from step {start_from_step}", "warning")
             
-            result = await run_playbook(session_id, playbook, user_data, start_from_step=start_from_step)
+            result = await run_playbook(session_id, playbook, user_data, start_from_step=start_from_step, exam_id=exam_id)
         else:
             await send_log(session_id, f"🤖 No playbook — using AI-driven workflow", "info")
             from app.graph.builder import run_workflow
@@ -428,6 +1143,7 @@ async def execute_workflow(
             )
 
         if is_session_cancelled(session_id):
+            _release_owned(session_id)
             return
 
         status = result.get("status", "completed")
@@ -438,10 +1154,17 @@ async def execute_workflow(
             result_message=result.get("result_message"),
             completed_at=datetime.utcnow()
         )
+        if status in TERMINAL_STATUSES:
+            _release_owned(session_id)
+            await _release_session_state(session_id)
+        elif status == "waiting_input":
+            _release_paused(session_id)
 
     except asyncio.CancelledError:
+        _release_owned(session_id)
         raise
     except Exception as e:
+        _release_owned(session_id)
         if not is_session_cancelled(session_id):
             await send_log(session_id, f"Workflow error: {str(e)}", "error")
             await send_result(session_id, False, f"Workflow failed: {str(e)}")
@@ -452,14 +1175,25 @@ async def execute_workflow(
                 error=str(e),
                 completed_at=datetime.utcnow()
             )
+            await _release_session_state(session_id)
     finally:
         _running_workflow_tasks.pop(session_id, None)
+        _screenshot_seq.pop(session_id, None)
+        manager.flush_logs(session_id)
 
 
 async def handle_otp_submit(session_id: str, payload: dict):
     """Handle OTP submission from user."""
     otp = payload.get("otp")
     
+    from app.graph.playbook_executor import has_pending_playbook_input, resolve_human_input
+    playbook_input = has_pending_playbook_input(session_id)
+    
+    manager.clear_pending_input(session_id)
+    if not playbook_input:
+        # Only a LangGraph session paused at await_input is resumed (and measured)
+        resume_latency.mark_input_submitted(session_id)
+    session_counters.input_submitted(session_id)
     await add_session_log(session_id, "OTP received from user", level="info")
     await update_session(session_id, pending_input=None)
     
@@ -469,8 +1203,7 @@ async def handle_otp_submit(session_id: str, payload: dict):
     })
     
     # Route to playbook or LangGraph
-    from app.graph.playbook_executor import has_pending_playbook_input, resolve_human_input
-    if has_pending_playbook_input(session_id):
+    if playbook_input:
         resolve_human_input(session_id, otp)
     else:
         asyncio.create_task(resume_workflow_task(session_id, otp))
@@ -480,6 +1213,13 @@ async def handle_captcha_submit(session_id: str, payload: dict):
     """Handle captcha solution submission from user."""
     solution = payload.get("solution")
     
+    from app.graph.playbook_executor import has_pending_playbook_input, resolve_human_input
+    playbook_input = has_pending_playbook_input(session_id)
+    
+    manager.clear_pending_input(session_id)
+    if not playbook_input:
+        resume_latency.mark_input_submitted(session_id)
+    session_counters.input_submitted(session_id)
     await add_session_log(session_id, "Captcha solution received from user", level="info")
     await update_session(session_id, pending_input=None)
     
@@ -488,8 +1228,7 @@ async def handle_captcha_submit(session_id: str, payload: dict):
         "payload": {"message": "Captcha solution received, continuing...", "level": "success"}
     })
     
-    from app.graph.playbook_executor import has_pending_playbook_input, resolve_human_input
-    if has_pending_playbook_input(session_id):
+    if playbook_input:
         resolve_human_input(session_id, solution)
     else:
         asyncio.create_task(resume_workflow_task(session_id, solution))
@@ -500,6 +1239,13 @@ async def handle_custom_submit(session_id: str, payload: dict):
     field_id = payload.get("fieldId")
     value = payload.get("value")
     
+    from app.graph.playbook_executor import has_pending_playbook_input, resolve_human_input
+    playbook_input = has_pending_playbook_input(session_id)
+    
+    manager.clear_pending_input(session_id)
+    if not playbook_input:
+        resume_latency.mark_input_submitted(session_id)
+    session_counters.input_submitted(session_id)
     await add_session_log(session_id, f"Custom input received for field: {field_id}", level="info")
     await update_session(session_id, pending_input=None)
     
@@ -508,8 +1254,7 @@ async def handle_custom_submit(session_id: str, payload: dict):
         "payload": {"message": f"Input received for {field_id}, continuing...", "level": "success"}
     })
     
-    from app.graph.playbook_executor import has_pending_playbook_input, resolve_human_input
-    if has_pending_playbook_input(session_id):
+    if playbook_input:
         resolve_human_input(session_id, value, field_id)
     else:
         asyncio.create_task(resume_workflow_task(session_id, value, field_id))
@@ -522,9 +1267,30 @@ async def resume_workflow_task(session_id: str, user_input: Any, field_id: str =
     """
     from app.graph.builder import resume_workflow
     
+    if session_id in _resuming_sessions:
+        # Input submitted twice: the first resume owns the session
+        await send_log(session_id, "Resume already in progress", "warning")
+        return
+    
+    _resuming_sessions.add(session_id)
     try:
+        # Take a portal slot again (given back while the session waited for input)
+        host = _paused_hosts.pop(session_id, None)
+        if host:
+            waited = await get_portal_limiter().admit(session_id, host)
+            if waited >= 1:
+                await send_log(session_id, f"⏳ Waited {waited:.0f}s for a free slot on {host}", "info")
+            if is_session_cancelled(session_id):
+                _release_owned(session_id)
+                return
+        
         result = await resume_workflow(session_id, user_input, field_id)
         
+        if result.get("success") is False:
+            resume_latency.discard(session_id)
+            await _fail_resume(session_id, f"Resume failed: {result.get('error')}")
+            return
+        
         # Update session with result if workflow completed
         if result.get("status") in ["success", "failed", "completed"]:
             await update_session(
@@ -534,10 +1300,32 @@ async def resume_workflow_task(session_id: str, user_input: Any, field_id: str =
                 result_message=result.get("result_message"),
                 completed_at=datetime.utcnow()
             )
+            _release_owned(session_id)
+            await _release_session_state(session_id)
+        elif result.get("status") == "waiting_input":
+            _release_paused(session_id)
                 
     except Exception as e:
         await send_log(session_id, f"Resume error: {str(e)}", "error")
-        await send_result(session_id, False, f"Resume failed: {str(e)}")
+        await _fail_resume(session_id, f"Resume failed: {str(e)}")
+    finally:
+        _resuming_sessions.discard(session_id)
+
+
+async def _fail_resume(session_id: str, message: str):
+    """A paused workflow can't continue: free its portal slot and fail the session (unless it already ended)."""
+    _release_owned(session_id)
+    session = await get_session(session_id) or {}
+    if session.get("status") not in TERMINAL_STATUSES:
+        await update_session(
+            session_id,
+            status="failed",
+            success=False,
+            error=message,
+            completed_at=datetime.utcnow()
+        )
+    await send_result(session_id, False, message)
+    await _release_session_state(session_id)
 
 
 async def handle_pause_workflow(session_id: str):
@@ -571,6 +1359,8 @@ async def handle_resume_workflow(session_id: str):
 async def handle_stop_workflow(session_id: str):
     """Stop the running workflow: set cancelled flag, update DB, send result, cancel task. No API calls after this."""
     _cancelled_sessions.add(session_id)
+    _release_owned(session_id)
+    resume_latency.discard(session_id)
 
     # Unblock any playbook wait (OTP/captcha) so the task can be cancelled cleanly
     from app.graph.playbook_executor import resolve_human_input, has_pending_playbook_input
@@ -601,20 +1391,131 @@ async def handle_stop_workflow(session_id: str):
             await task
         except asyncio.CancelledError:
             pass
+    await _release_session_state(session_id)
 
 
 # ============= Helper Functions for Graph Nodes =============
 
+# Latest screenshot sequence per session (older previews finishing late are skipped)
+_screenshot_seq: dict[str, int] = {}
+# Background preview fan-outs (kept referenced until done)
+_screenshot_tasks: set[asyncio.Task] = set()
+
+
 async def send_screenshot(session_id: str, image_base64: str, step: str):
-    """Send screenshot update to connected clients."""
-    await manager.send_to_session(session_id, {
-        "type": MessageTypes.SCREENSHOT,
-        "payload": {
-            "imageBase64": image_base64,
+    """
+    Send screenshot update to connected clients.
+    Returns immediately; previews are encoded and fanned out in the background.
+    """
+    if not image_base64:
+        return
+    
+    seq = _screenshot_seq.get(session_id, 0) + 1
+    _screenshot_seq[session_id] = seq
+    task = asyncio.create_task(_fan_out_screenshot(session_id, seq, image_base64, step, datetime.utcnow().isoformat()))
+    _screenshot_tasks.add(task)
+    task.add_done_callback(_screenshot_tasks.discard)
+
+
+async def _fan_out_screenshot(session_id: str, seq: int, image_base64: str, step: str, timestamp: str):
+    """Store the screenshot, remember it for replay, and send previews to current viewers."""
+    try:
+        digest = await put_screenshot(image_base64, session_id)
+        if not digest or _screenshot_seq.get(session_id) != seq:
+            return
+        
+        shot = {"hash": digest, "step": step, "timestamp": timestamp}
+        get_event_bus().publish({"kind": "screenshot", "session_id": session_id, "shot": shot})
+        await _show_screenshot(session_id, shot)
+    except Exception as e:
+        print(f"⚠️ Screenshot fan-out failed for {session_id}: {e}")
+
+
+async def _show_screenshot(session_id: str, shot: dict):
+    """Remember a stored screenshot for replay and send previews to this worker's viewers."""
+    manager.replay_buffer(session_id).last_screenshot = shot
+    connections = list(manager.active_connections.get(session_id, ()))
+    await _send_screenshot_preview(connections, shot["hash"], shot["step"], shot["timestamp"], session_id=session_id, shot=shot)
+
+
+async def _send_screenshot_preview(
+    connections: list[WebSocket],
+    digest: str,
+    step: str,
+    timestamp: str,
+    session_id: str = None,
+    shot: dict = None
+):
+    """
+    Send each viewer a preview at its requested size.
+    Viewers are grouped by (width, quality) so each encoding is produced once.
+    Binary viewers get a JSON header frame followed by the JPEG as a binary frame;
+    others get the preview base64-encoded in the JSON message.
+    """
+    groups: dict[tuple[int, int], list[WebSocket]] = {}
+    for connection in connections:
+        prefs = manager.preview_for(connection)
+        groups.setdefault((prefs["width"], prefs["quality"]), []).append(connection)
+    
+    for (width, quality), viewers in groups.items():
+        preview = await get_preview(digest, width, quality)
+        if preview is None:
+            continue
+        if shot is not None and getattr(manager.replay.get(session_id), "last_screenshot", None) is not shot:
+            return  # A newer screenshot is already on its way
+        
+        payload = {
             "step": step,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": timestamp,
+            "hash": digest,
+            "format": "jpeg",
+            "width": width,
         }
+        preview_base64 = None
+        for connection in viewers:
+            if manager.preview_for(connection)["binary"]:
+                header = {"type": MessageTypes.SCREENSHOT, "payload": {**payload, "binary": True, "bytes": len(preview)}}
+                manager.enqueue_frames(connection, KIND_SCREENSHOT, [header, preview])
+            else:
+                if preview_base64 is None:
+                    preview_base64 = base64.b64encode(preview).decode("ascii")
+                manager.enqueue(connection, {
+                    "type": MessageTypes.SCREENSHOT,
+                    "payload": {**payload, "imageBase64": preview_base64},
+                }, KIND_SCREENSHOT)
+
+
+async def replay_session(websocket: WebSocket, session_id: str, since: int, epoch: Optional[str] = None):
+    """
+    Bring a (re)connecting viewer up to date from memory:
+    the events after `since`, or - if the ring no longer holds all of them - the latest
+    status and any pending input request first; then the last screenshot and REPLAY_COMPLETE.
+    A `since` from another epoch (backend restarted, buffer expired) counts as 0.
+    Events are queued synchronously, so live events can't interleave with the replay.
+    """
+    buffer = manager.replay.get(session_id)
+    if buffer is None:
+        manager.enqueue(websocket, {
+            "type": MessageTypes.REPLAY_COMPLETE,
+            "payload": {"seq": 0, "epoch": None, "replayed": 0, "gap": False}
+        })
+        return
+    
+    if epoch and epoch != buffer.epoch:
+        since = 0
+    events, complete = buffer.since(since)
+    if not complete:
+        events = buffer.sticky_before_ring() + events
+    for seq, message in events:
+        manager.enqueue(websocket, {**message, "seq": seq, "epoch": buffer.epoch})
+    manager.enqueue(websocket, {
+        "type": MessageTypes.REPLAY_COMPLETE,
+        "payload": {"seq": buffer.seq, "epoch": buffer.epoch, "replayed": len(events), "gap": not complete}
     })
+    
+    last = buffer.last_screenshot
+    if last:
+        await _send_screenshot_preview([websocket], last["hash"], last["step"], last["timestamp"])
 
 
 async def send_log(session_id: str, message: str, level: str = "info"):
@@ -625,6 +1526,36 @@ async def send_log(session_id: str, message: str, level: str = "info"):
     })
 
 
+def publish_batch_progress(batch_id: str, exam_id: Any, payload: dict, final: bool = False):
+    """
+    Send a BATCH_PROGRESS event to subscribers of the batch, its exam and admin.
+    Progress updates are rate-limited per batch (latest wins); final events are sent at once.
+    """
+    topics = [batch_topic(batch_id), exam_topic(exam_id), TOPIC_ADMIN]
+    message = {
+        "type": MessageTypes.BATCH_PROGRESS,
+        "payload": {"batch_id": batch_id, "exam_id": exam_id, **payload}
+    }
+    if final:
+        manager.close_topic_stream(batch_topic(batch_id))
+        manager.publish(topics, message)
+    else:
+        manager.publish(topics, message, throttle_key=batch_topic(batch_id))
+
+
+def publish_batch_items(batch_id: str, exam_id: Any, items: list[dict]):
+    """
+    Send a BATCH_ITEMS event (item state transitions) to subscribers of the batch.
+    Each item: item_id, user_id, session_id, status, attempts, error. Never throttled.
+    """
+    if not items:
+        return
+    manager.publish([batch_topic(batch_id)], {
+        "type": MessageTypes.BATCH_ITEMS,
+        "payload": {"batch_id": batch_id, "exam_id": exam_id, "items": items}
+    })
+
+
 async def send_user_data(session_id: str, user_data: dict):
     """Send the user data dictionary to the client for display on each run."""
     await manager.send_to_session(session_id, {
@@ -656,6 +1587,7 @@ async def request_otp(session_id: str):
         status="waiting_input",
         pending_input={"input_type": "otp", "requested_at": datetime.utcnow().isoformat()}
     )
+    session_counters.input_requested(session_id, "otp")
     
     await manager.send_to_session(session_id, {
         "type": MessageTypes.REQUEST_OTP,
@@ -670,6 +1602,7 @@ async def request_captcha(session_id: str, image_base64: str, auto_solving: bool
         status="waiting_input",
         pending_input={"input_type": "captcha", "requested_at": datetime.utcnow().isoformat()}
     )
+    session_counters.input_requested(session_id, "captcha")
     
     await manager.send_to_session(session_id, {
         "type": MessageTypes.REQUEST_CAPTCHA,
@@ -698,6 +1631,7 @@ async def request_custom_input(
             "requested_at": datetime.utcnow().isoformat()
         }
     )
+    session_counters.input_requested(session_id, "custom")
     
     await manager.send_to_session(session_id, {
         "type": MessageTypes.REQUEST_CUSTOM,
@@ -53,6 +53,86 @@ class Settings(BaseSettings):
     db_min_pool_size: int = 5
     db_max_pool_size: int = 20
     
+    # LangGraph checkpointer: "memory" (local dev) or "postgres"
+    checkpointer_backend: str = "memory"
+    checkpointer_keep_last: int = 5  # Checkpoints kept per session
+    checkpointer_pool_size: int = 5  # Postgres saver connections
+    checkpointer_memory_ttl_seconds: int = 3600  # Evict idle in-memory sessions after this
+    checkpointer_memory_max_threads: int = 200  # LRU cap on in-memory sessions
+    
+    # Screenshot blob store: "disk" or "postgres" (large objects)
+    blob_store_backend: str = "disk"
+    blob_store_dir: str = "data/blobs"
+    blob_store_max_bytes: int = 2 * 1024 * 1024 * 1024  # LRU cap, disk or postgres (2 GB)
+    blob_cache_max_bytes: int = 64 * 1024 * 1024  # In-memory LRU cache (64 MB)
+    
+    # Max differing bits (of 64) in the screenshot perceptual hash for "same page"
+    page_fingerprint_tolerance: int = 6
+    
+    # Full per-session action history (state keeps only the recent tail)
+    action_log_dir: str = "data/action_logs"
+    
+    # WebSocket delivery: per-connection outbound queue bound and send timeout
+    ws_queue_max: int = 256
+    ws_send_timeout_seconds: float = 10.0
+    # Live screenshot previews (viewers can request their own size via SET_PREVIEW)
+    ws_preview_width: int = 640
+    ws_preview_quality: int = 60
+    ws_preview_cache_bytes: int = 32 * 1024 * 1024
+    # Per-session replay ring for reconnecting viewers
+    ws_replay_buffer_size: int = 500
+    ws_replay_ttl_seconds: int = 1800  # Drop idle, unwatched sessions' buffers after this
+    # Log lines are coalesced into one LOG_BATCH frame per window (0 = send each line on its own)
+    ws_log_batch_window_ms: int = 50
+    ws_log_batch_max: int = 20
+    # Minimum interval between progress events on one topic (e.g. a batch); latest update wins
+    ws_topic_min_interval_ms: int = 250
+    # Server-Sent Events (batch progress): keepalive comment interval, and events a slow client may fall behind
+    sse_heartbeat_seconds: int = 15
+    sse_queue_max: int = 1000
+    
+    # Event bus between uvicorn workers: "local" (single worker) or "postgres" (LISTEN/NOTIFY)
+    event_bus_backend: str = "local"
+    event_bus_channel: str = "automation_events"
+    
+    # Session progress updates are buffered and written in batches at this interval (0 = write each one)
+    session_write_interval_ms: int = 500
+    # Session log entries are queued and written with COPY at this interval or batch size
+    session_event_flush_ms: int = 200
+    session_event_batch_max: int = 500
+    # Keep the legacy automation_sessions.logs column as a summary of the latest N entries (0 = off)
+    session_logs_mirror_limit: int = 0
+    # Intervention counters (OTP/captcha requests, LLM captcha solves) are upserted at this interval
+    session_counter_flush_ms: int = 1000
+    # Playbook step metrics (duration, attempts, cache/LLM use) are written with COPY at this interval
+    step_metrics_flush_ms: int = 1000
+    
+    # Portal limiter: per exam-portal host, for every workflow (see app/services/portal_limiter.py)
+    portal_limiter_backend: str = "local"  # "local" or "postgres" (slots held cluster-wide)
+    portal_max_sessions: int = 4  # Workflows on one portal at once
+    portal_starts_per_minute: float = 6.0
+    portal_start_burst: int = 2
+    portal_actions_per_second: float = 2.0  # Browser actions (Stagehand init/reload/execute) per portal
+    portal_action_burst: int = 5
+    portal_poll_interval_seconds: float = 2.0  # Retry interval while other workers hold every slot
+    # Per-host overrides as JSON, host or parent domain, "*" for all, e.g.
+    # {"cuet.nta.nic.in": {"max_sessions": 2, "actions_per_second": 1}}
+    portal_limits: dict[str, dict] = {}
+    
+    # Batch scheduler
+    batch_max_concurrency: int = 4  # Workflows run at once by this worker (0 = don't run batch items here)
+    batch_max_per_exam: int = 2  # Workflows of one exam running at once across all workers
+    batch_max_attempts: int = 3
+    batch_retry_base_seconds: int = 60  # Doubles per attempt
+    batch_retry_max_seconds: int = 1800
+    batch_lease_seconds: int = 60  # Items of a worker that stops heartbeating are re-queued after this
+    batch_poll_interval_seconds: float = 2.0
+    batch_input_timeout_seconds: int = 1800  # Give up on an item waiting this long for user input
+    batch_prefetch_size: int = 50  # Profiles of the next N queued items are loaded in bulk ahead of their start
+    batch_prefetch_ttl_seconds: int = 300  # Prefetched profiles older than this are loaded again
+    batch_expedite_priority: int = 100  # Priority given by POST /api/batch/{id}/expedite
+    batch_throughput_sample_size: int = 50  # Recent items per exam averaged for completion projections
+    
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
@@ -2,41 +2,49 @@
 Graph Builder - NEW LLM-Driven Architecture
 Constructs the LangGraph state machine with LLM vision decision layer.
 """
+import asyncio
+import time
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-from typing import Optional, Literal
+from langgraph.types import Command
+from typing import Any, Optional, Literal
 
 from app.config import settings
 from app.graph.state import GraphState
+from app.graph.checkpointer import get_checkpointer
+from app.services.tracing import traced, bind_session
 from app.graph.nodes import (
     init_browser_node,
     capture_screenshot_node,
     llm_decide_node,
     execute_single_action_node,
+    await_input_node,
     success_node,
     save_analytics_node,
 )
 
 
-# Global checkpointer instance
-_checkpointer: Optional[MemorySaver] = None
+# Compiled graphs, built once and shared across sessions (keyed by variant)
+DEFAULT_GRAPH_VARIANT = "default"
+_compiled_graphs: dict[str, Any] = {}
+_compile_lock = asyncio.Lock()
 
 
-async def get_checkpointer() -> MemorySaver:
-    """Get or create the checkpointer."""
-    global _checkpointer
-    
-    if _checkpointer is None:
-        _checkpointer = MemorySaver()
-    
-    return _checkpointer
+def route_after_capture(state: GraphState) -> Literal["llm_decide", "await_input"]:
+    """
+    Route after screenshot capture.
+    The capture node can itself ask for input (e.g. missing login password);
+    in that case pause at await_input instead of spending an LLM decision.
+    """
+    if state.get("status") == "waiting_input":
+        return "await_input"
+    return "llm_decide"
 
 
-def route_after_execute(state: GraphState) -> Literal["capture_screenshot", "success", "end"]:
+def route_after_execute(state: GraphState) -> Literal["capture_screenshot", "await_input", "success"]:
     """
     Route after action execution.
     If completed or failed, go to success/end.
-    If waiting for input, go to END (workflow will be resumed later).
+    If waiting for input, go to await_input (interrupts; resumed with the user's input).
     Otherwise, loop back to capture for next action.
     """
     status = state.get("status", "running")
@@ -51,8 +59,8 @@ def route_after_execute(state: GraphState) -> Literal["capture_screenshot", "suc
         return "success"
     
     if status == "waiting_input":
-        # Workflow pauses here - will be resumed when user provides input
-        return "end"
+        # Workflow pauses in await_input - resumed there when user provides input
+        return "await_input"
     
     if status == "failed":
         return "success"  # Go to success node to finalize failures
@@ -64,13 +72,20 @@ def route_after_execute(state: GraphState) -> Literal["capture_screenshot", "suc
     return "capture_screenshot"
 
 
+def _traced_node(name: str, node):
+    """Wrap a node so each run is recorded as a 'node' span (parent of its Stagehand/LLM spans)."""
+    return traced("node", name)(node)
+
+
 def build_workflow_graph() -> StateGraph:
     """
     Build the NEW LLM-driven state machine.
     
     SIMPLIFIED Graph structure:
     START -> init_browser -> capture_screenshot -> llm_decide -> execute_action
-    execute_action -> (routing) -> capture_screenshot (loop) | success | end
+    capture_screenshot -> (routing) -> llm_decide | await_input
+    execute_action -> (routing) -> capture_screenshot (loop) | await_input | success
+    await_input -> capture_screenshot (after interrupt is resumed with user input)
     success -> save_analytics -> END
     
     The key insight: LLM decides ONE action at a time, execute it, then re-capture
@@ -81,12 +96,13 @@ def build_workflow_graph() -> StateGraph:
     
     # ============= Add Nodes =============
     
-    builder.add_node("init_browser", init_browser_node)
-    builder.add_node("capture_screenshot", capture_screenshot_node)
-    builder.add_node("llm_decide", llm_decide_node)
-    builder.add_node("execute_action", execute_single_action_node)
-    builder.add_node("success", success_node)
-    builder.add_node("save_analytics", save_analytics_node)
+    builder.add_node("init_browser", _traced_node("init_browser", init_browser_node))
+    builder.add_node("capture_screenshot", _traced_node("capture_screenshot", capture_screenshot_node))
+    builder.add_node("llm_decide", _traced_node("llm_decide", llm_decide_node))
+    builder.add_node("execute_action", _traced_node("execute_action", execute_single_action_node))
+    builder.add_node("await_input", _traced_node("await_input", await_input_node))
+    builder.add_node("success", _traced_node("success", success_node))
+    builder.add_node("save_analytics", _traced_node("save_analytics", save_analytics_node))
     
     # ============= Add Edges =============
     
@@ -95,7 +111,14 @@ def build_workflow_graph() -> StateGraph:
     builder.add_edge("init_browser", "capture_screenshot")
     
     # Main loop: capture -> decide -> execute
-    builder.add_edge("capture_screenshot", "llm_decide")
+    builder.add_conditional_edges(
+        "capture_screenshot",
+        route_after_capture,
+        {
+            "llm_decide": "llm_decide",
+            "await_input": "await_input",  # Capture asked for input
+        }
+    )
     builder.add_edge("llm_decide", "execute_action")
     
     # After execute: conditional routing
@@ -104,11 +127,14 @@ def build_workflow_graph() -> StateGraph:
         route_after_execute,
         {
             "capture_screenshot": "capture_screenshot",  # Loop back
+            "await_input": "await_input",  # Pause for user input
             "success": "success",
-            "end": END,  # Pause for user input
         }
     )
     
+    # Resumed input is entered by capture_screenshot, then the loop continues
+    builder.add_edge("await_input", "capture_screenshot")
+    
     # Finish: success -> save -> END
     builder.add_edge("success", "save_analytics")
     builder.add_edge("save_analytics", END)
@@ -126,11 +152,10 @@ async def create_compiled_graph(with_checkpointing: bool = True):
         checkpointer = await get_checkpointer()
         
         # Compile with checkpointer
-        # Note: interrupts are handled INSIDE execute_single_action_node 
-        # when human input is needed (OTP, captcha)
+        # Note: human input pauses via interrupt() inside await_input_node,
+        # so the checkpoint records exactly where to resume
         graph = builder.compile(
             checkpointer=checkpointer,
-            # No interrupt_before - let execution proceed normally
         )
     else:
         graph = builder.compile()
@@ -138,6 +163,45 @@ async def create_compiled_graph(with_checkpointing: bool = True):
     return graph
 
 
+def graph_variant_for_exam(exam_id: Optional[str]) -> str:
+    """
+    Map an exam to its graph variant.
+    All exams share one graph today; exam-specific graphs get their own key here.
+    """
+    return DEFAULT_GRAPH_VARIANT
+
+
+async def get_compiled_graph(variant: str = DEFAULT_GRAPH_VARIANT):
+    """
+    Get the compiled graph for a variant, compiling it on first use.
+    The lock makes sure concurrent session starts compile it only once.
+    """
+    graph = _compiled_graphs.get(variant)
+    if graph is not None:
+        return graph
+    
+    async with _compile_lock:
+        graph = _compiled_graphs.get(variant)
+        if graph is None:
+            started = time.perf_counter()
+            graph = await create_compiled_graph()
+            _compiled_graphs[variant] = graph
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"✅ Compiled workflow graph '{variant}' in {elapsed_ms:.1f}ms")
+    
+    return graph
+
+
+async def warm_workflow_graph() -> None:
+    """Compile the default graph at startup so the first session doesn't pay for it."""
+    await get_compiled_graph(DEFAULT_GRAPH_VARIANT)
+
+
+def reset_compiled_graphs() -> None:
+    """Drop cached graphs (e.g. after swapping the checkpointer)."""
+    _compiled_graphs.clear()
+
+
 async def run_workflow(
     session_id: str,
     exam_id: str,
@@ -201,8 +265,10 @@ async def run_workflow(
         initial_state["already_filled_fields"] = already_filled_fields  # Restore filled fields
         initial_state["form_filling_progress"] = saved_form_progress
     
-    # Create compiled graph
-    graph = await create_compiled_graph()
+    bind_session(session_id, exam_id)
+    
+    # Reuse the shared compiled graph
+    graph = await get_compiled_graph(graph_variant_for_exam(exam_id))
     
     # Create thread config for checkpointing - increased recursion limit for long workflows
     config = {
@@ -219,55 +285,41 @@ async def run_workflow(
 async def resume_workflow(session_id: str, user_input: any, field_id: str = None) -> dict:
     """
     Resume a paused workflow with user input.
-    Gets the saved state, adds user input, clears waiting flag, and restarts.
+    Continues from the interrupted await_input node using the checkpointer's
+    native resume - no browser re-init, re-capture, or extra LLM decision.
     """
     from app.api.websocket import send_log
     
-    # Get the saved state from checkpointer
-    checkpointer = await get_checkpointer()
-    config = {"configurable": {"thread_id": session_id}}
+    config = {
+        "configurable": {"thread_id": session_id},
+        "recursion_limit": 100
+    }
     
+    # Any compiled graph can read the thread; pick the exam's variant once we know it
     try:
-        checkpoint = await checkpointer.aget(config)
-        if not checkpoint:
-            return {"success": False, "error": "No saved state found"}
-        
-        saved_state = checkpoint.get("values", {})
+        graph = await get_compiled_graph()
+        snapshot = await graph.aget_state(config)
     except Exception as e:
         return {"success": False, "error": f"Failed to get state: {e}"}
     
-    # Get what type of input we were waiting for
-    waiting_type = saved_state.get("waiting_for_input_type")
+    if not snapshot or not snapshot.values:
+        return {"success": False, "error": "No saved state found"}
     
-    await send_log(session_id, f"✓ Received {waiting_type or 'user'} input, resuming...", "success")
+    if "await_input" not in (snapshot.next or ()):
+        return {"success": False, "error": "Workflow is not waiting for input"}
     
-    # Update received_custom_inputs if field_id is provided
-    received_custom_inputs = saved_state.get("received_custom_inputs", {}).copy()
-    if field_id:
-        received_custom_inputs[field_id] = user_input
-    
-    # Update state with user input and clear waiting flag
-    # Preserve waiting_for_login_password flag if it exists
-    updated_state = {
-        **saved_state,
-        "human_input_value": user_input,
-        "waiting_for_input_type": None,
-        "status": "running",
-        "received_custom_inputs": received_custom_inputs,  # Store field_id -> value mapping
-        # Preserve waiting_for_login_password flag if it was set
-        "waiting_for_login_password": saved_state.get("waiting_for_login_password", False),
-    }
-    
-    # Create graph and run from the beginning with updated state
-    # Since we have checkpointing, we just re-invoke with the same thread
-    graph = await create_compiled_graph()
+    saved_state = snapshot.values
+    waiting_type = saved_state.get("waiting_for_input_type")
+    await send_log(session_id, f"✓ Received {waiting_type or 'user'} input, resuming...", "success")
     
-    # Update config with recursion limit
-    config["recursion_limit"] = 100
+    bind_session(session_id, saved_state.get("exam_id"))
+    graph = await get_compiled_graph(graph_variant_for_exam(saved_state.get("exam_id")))
     
-    # Re-run the workflow - it will continue from capture_screenshot
-    # because the state now has status="running"
-    result = await graph.ainvoke(updated_state, config=config)
+    # Resume the interrupted node; await_input_node receives this dict from interrupt()
+    result = await graph.ainvoke(
+        Command(resume={"value": user_input, "field_id": field_id}),
+        config=config,
+    )
     
     return result
 
@@ -276,13 +328,13 @@ async def get_workflow_state(session_id: str) -> Optional[dict]:
     """
     Get the current state of a workflow.
     """
-    checkpointer = await get_checkpointer()
     config = {"configurable": {"thread_id": session_id}}
     
     try:
-        checkpoint = await checkpointer.aget(config)
-        if checkpoint:
-            return checkpoint.get("values", {})
+        graph = await get_compiled_graph()
+        snapshot = await graph.aget_state(config)
+        if snapshot:
+            return snapshot.values
     except Exception:
         pass
     
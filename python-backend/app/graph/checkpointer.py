@@ -0,0 +1,298 @@
+"""
+LangGraph Checkpointer
+Pluggable checkpoint storage for workflow sessions, selected by settings.checkpointer_backend.
+
+- "memory":   in-process MemorySaver with keep-last-N per thread and TTL/LRU eviction (local dev)
+- "postgres": AsyncPostgresSaver on the shared PostgreSQL database, pruned to the last N checkpoints
+
+Completed sessions are released via release_session_checkpoints() so nothing grows without bound.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langgraph.checkpoint.base import INTERRUPT, RESUME
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from app.config import settings
+
+
+# Active checkpointer (created by init_checkpointer / get_checkpointer)
+_checkpointer: Optional[Any] = None
+# psycopg pool used by the Postgres saver (langgraph-checkpoint-postgres is psycopg-based)
+_pg_pool: Optional[Any] = None
+
+
+# Custom types stored in workflow state, allowed through msgpack deserialisation
+# (anything else is blocked - and with LANGGRAPH_STRICT_MSGPACK=true these would be too)
+CHECKPOINT_STATE_TYPES = [("app.graph.state", "ActionRecord")]
+
+
+def checkpoint_serde() -> JsonPlusSerializer:
+    """Serializer for checkpoints, with the workflow state's own types registered."""
+    return JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_STATE_TYPES)
+
+
+# ============= In-Memory (local dev) =============
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver that keeps only the last N checkpoints per thread
+    and evicts idle threads by TTL and LRU (max thread count).
+    Threads paused in interrupt() (waiting for OTP/captcha/custom input) are never evicted -
+    however late the user answers - only released by release_session_checkpoints().
+    """
+
+    def __init__(self, keep_last: int = 5, ttl_seconds: int = 3600, max_threads: int = 200, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_last = max(1, keep_last)
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max(1, max_threads)
+        # thread_id -> last access (monotonic), oldest first
+        self._last_access: OrderedDict[str, float] = OrderedDict()
+        # thread_id -> {(checkpoint_ns, checkpoint_id): {(channel, version), ...}}
+        self._blob_refs: dict[str, dict[tuple[str, str], frozenset]] = {}
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"].get("thread_id")
+        if thread_id in self._last_access:
+            self._touch(thread_id)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        refs = self._blob_refs.setdefault(thread_id, {})
+        refs[(checkpoint_ns, checkpoint["id"])] = frozenset(
+            (channel, str(version)) for channel, version in checkpoint.get("channel_versions", {}).items()
+        )
+
+        self._touch(thread_id)
+        self._trim_thread(thread_id, checkpoint_ns)
+        self._evict(keep=thread_id)
+        return result
+
+    def _trim_thread(self, thread_id: str, checkpoint_ns: str) -> None:
+        """Drop all but the newest keep_last checkpoints (and their writes/blobs) for a thread."""
+        checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        if not checkpoints or len(checkpoints) <= self.keep_last:
+            return
+
+        # Checkpoint IDs are time-ordered (uuid6), so lexical order == age
+        ordered = sorted(checkpoints.keys())
+        stale = ordered[:-self.keep_last]
+        refs = self._blob_refs.get(thread_id, {})
+
+        dropped_refs: set = set()
+        for checkpoint_id in stale:
+            checkpoints.pop(checkpoint_id, None)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            dropped_refs |= refs.pop((checkpoint_ns, checkpoint_id), frozenset())
+
+        blobs = getattr(self, "blobs", None)
+        if blobs is None or not dropped_refs:
+            return
+
+        live_refs: set = set()
+        for (ns, _), channel_versions in refs.items():
+            if ns == checkpoint_ns:
+                live_refs |= channel_versions
+        for channel, version in dropped_refs - live_refs:
+            for key in [k for k in blobs if k[0] == thread_id and k[1] == checkpoint_ns and k[2] == channel and str(k[3]) == version]:
+                blobs.pop(key, None)
+
+    def awaiting_input(self, thread_id: str) -> bool:
+        """True if the thread's latest checkpoint has an interrupt not resumed yet."""
+        checkpoints = self.storage.get(thread_id, {}).get("")
+        if not checkpoints:
+            return False
+        latest = max(checkpoints)
+        channels = {write[1] for write in self.writes.get((thread_id, "", latest), {}).values()}
+        return INTERRUPT in channels and RESUME not in channels
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Evict threads idle longer than the TTL, then the least recently used above max_threads."""
+        now = time.monotonic()
+        for thread_id, last in list(self._last_access.items()):
+            if thread_id != keep and now - last > self.ttl_seconds and not self.awaiting_input(thread_id):
+                self.drop_thread(thread_id)
+
+        excess = len(self._last_access) - self.max_threads
+        for thread_id in list(self._last_access):
+            if excess <= 0:
+                break
+            if thread_id == keep or self.awaiting_input(thread_id):
+                continue
+            self.drop_thread(thread_id)
+            excess -= 1
+
+    def drop_thread(self, thread_id: str) -> None:
+        """Remove every checkpoint, write, and blob stored for a thread."""
+        self.storage.pop(thread_id, None)
+        for key in [k for k in self.writes if k[0] == thread_id]:
+            self.writes.pop(key, None)
+        blobs = getattr(self, "blobs", None)
+        if blobs is not None:
+            for key in [k for k in blobs if k[0] == thread_id]:
+                blobs.pop(key, None)
+        self._blob_refs.pop(thread_id, None)
+        self._last_access.pop(thread_id, None)
+
+
+# ============= PostgreSQL =============
+
+async def prune_postgres_thread(thread_id: str, keep_last: int) -> None:
+    """Keep only the newest keep_last checkpoints for a thread (plus the writes/blobs they use)."""
+    from app.services.database import Database
+
+    async with Database.transaction() as conn:
+        await conn.execute("""
+            DELETE FROM checkpoints
+            WHERE thread_id = $1
+              AND checkpoint_id NOT IN (
+                  SELECT checkpoint_id FROM checkpoints
+                  WHERE thread_id = $1
+                  ORDER BY checkpoint_id DESC
+                  LIMIT $2
+              )
+        """, thread_id, keep_last)
+        await conn.execute("""
+            DELETE FROM checkpoint_writes w
+            WHERE w.thread_id = $1
+              AND NOT EXISTS (
+                  SELECT 1 FROM checkpoints c
+                  WHERE c.thread_id = w.thread_id
+                    AND c.checkpoint_ns = w.checkpoint_ns
+                    AND c.checkpoint_id = w.checkpoint_id
+              )
+        """, thread_id)
+        await conn.execute("""
+            DELETE FROM checkpoint_blobs b
+            WHERE b.thread_id = $1
+              AND NOT EXISTS (
+                  SELECT 1 FROM checkpoints c
+                  WHERE c.thread_id = b.thread_id
+                    AND c.checkpoint_ns = b.checkpoint_ns
+                    AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+              )
+        """, thread_id)
+
+
+async def delete_postgres_thread(thread_id: str) -> None:
+    """Remove every checkpoint row for a thread."""
+    from app.services.database import Database
+
+    async with Database.transaction() as conn:
+        for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+            await conn.execute(f"DELETE FROM {table} WHERE thread_id = $1", thread_id)
+
+
+def _build_postgres_saver(pool):
+    """Create an AsyncPostgresSaver subclass instance that prunes old checkpoints as it writes."""
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+    class BoundedPostgresSaver(AsyncPostgresSaver):
+        """AsyncPostgresSaver that prunes each thread back to keep_last checkpoints."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.keep_last = max(1, settings.checkpointer_keep_last)
+            # thread_id -> writes since the last prune
+            self._puts: dict[str, int] = {}
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            result = await super().aput(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            count = self._puts.get(thread_id, 0) + 1
+            # Prune once per keep_last writes - bounds the table at 2N rows per thread
+            if count >= self.keep_last:
+                count = 0
+                try:
+                    await prune_postgres_thread(thread_id, self.keep_last)
+                except Exception as e:
+                    print(f"⚠️ Checkpoint prune failed for {thread_id}: {e}")
+            self._puts[thread_id] = count
+            return result
+
+    return BoundedPostgresSaver(pool, serde=checkpoint_serde())
+
+
+# ============= Lifecycle =============
+
+async def init_checkpointer():
+    """Create the configured checkpointer. Called once at startup."""
+    global _checkpointer, _pg_pool
+
+    if _checkpointer is not None:
+        return _checkpointer
+
+    backend = (settings.checkpointer_backend or "memory").lower()
+
+    if backend == "postgres":
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+
+        _pg_pool = AsyncConnectionPool(
+            conninfo=settings.database_url,
+            min_size=1,
+            max_size=settings.checkpointer_pool_size,
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            open=False,
+        )
+        await _pg_pool.open()
+        _checkpointer = _build_postgres_saver(_pg_pool)
+        await _checkpointer.setup()
+        print(f"✅ Checkpointer: postgres (keep last {settings.checkpointer_keep_last} per session)")
+    else:
+        _checkpointer = BoundedMemorySaver(
+            keep_last=settings.checkpointer_keep_last,
+            ttl_seconds=settings.checkpointer_memory_ttl_seconds,
+            max_threads=settings.checkpointer_memory_max_threads,
+            serde=checkpoint_serde(),
+        )
+        print(f"✅ Checkpointer: memory (keep last {settings.checkpointer_keep_last}, TTL {settings.checkpointer_memory_ttl_seconds}s)")
+
+    return _checkpointer
+
+
+async def close_checkpointer() -> None:
+    """Release the checkpointer and its connection pool. Called on shutdown."""
+    global _checkpointer, _pg_pool
+
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+    _checkpointer = None
+
+
+async def get_checkpointer():
+    """Get the active checkpointer, creating it on first use."""
+    if _checkpointer is None:
+        return await init_checkpointer()
+    return _checkpointer
+
+
+async def release_session_checkpoints(session_id: str) -> None:
+    """Delete all checkpoints of a finished session (completed, failed, or stopped)."""
+    checkpointer = _checkpointer
+    if checkpointer is None:
+        return
+
+    try:
+        if isinstance(checkpointer, BoundedMemorySaver):
+            checkpointer.drop_thread(session_id)
+        else:
+            getattr(checkpointer, "_puts", {}).pop(session_id, None)
+            if hasattr(checkpointer, "adelete_thread"):
+                await checkpointer.adelete_thread(session_id)
+            else:
+                await delete_postgres_thread(session_id)
+    except Exception as e:
+        print(f"⚠️ Failed to release checkpoints for {session_id}: {e}")
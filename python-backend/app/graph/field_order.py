@@ -0,0 +1,185 @@
+"""
+Field Order Model
+Per-exam model of the order in which form fields are filled, and of which
+on-page label maps to which user_data key - learned from successful sessions.
+
+The LLM-driven workflow uses it for a multi-field fast path: once the LLM has
+filled one field the model knows, the rest of the expected sequence is queued
+and filled without vision calls, until something doesn't match.
+
+Stored as JSON next to the playbook prompt cache (playbooks/cache/field_order_<exam_id>.json):
+    {
+      "runs": 4,
+      "fields": {
+        "fullName": {"pos_sum": 0.0, "count": 4, "labels": {"Full Name": 4}},
+        ...
+      }
+    }
+pos_sum accumulates each field's normalised position (0 = first, 1 = last) per run.
+
+Several workers may learn at once: each run is merged into the file's current content
+under an exclusive lock (field_order_<exam_id>.lock) and written atomically (temp file +
+os.replace). Loaded models are memoised until the file changes.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+# Same directory as the playbook prompt cache
+CACHE_DIR = Path(__file__).parent.parent / "playbooks" / "cache"
+
+# Successful runs required before the model drives the fast path
+MIN_RUNS = 2
+# A field must appear in at least this share of runs to be queued
+MIN_FIELD_SUPPORT = 0.5
+
+# exam_id -> (file mtime_ns when loaded, model)
+_models: dict[str, tuple[int, dict]] = {}
+
+
+def _model_path(exam_id: str) -> Path:
+    return CACHE_DIR / f"field_order_{exam_id}.json"
+
+
+def _mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _read_model(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except Exception:
+        return {"runs": 0, "fields": {}}
+
+
+def load_model(exam_id: Any) -> dict:
+    """Load the field-order model for an exam (memoised until another worker rewrites it)."""
+    exam_id = str(exam_id)
+    path = _model_path(exam_id)
+    mtime = _mtime_ns(path)
+    cached = _models.get(exam_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    model = _read_model(path) if mtime else {"runs": 0, "fields": {}}
+    _models[exam_id] = (mtime, model)
+    return model
+
+
+def _add_run(model: dict, sequence: list[tuple[str, str]]) -> None:
+    fields = model.setdefault("fields", {})
+    last = len(sequence) - 1
+    for index, (key, label) in enumerate(sequence):
+        entry = fields.setdefault(key, {"pos_sum": 0.0, "count": 0, "labels": {}})
+        entry["pos_sum"] += index / last
+        entry["count"] += 1
+        entry["labels"][label] = entry["labels"].get(label, 0) + 1
+    model["runs"] = model.get("runs", 0) + 1
+
+
+def _save_run(exam_id: str, sequence: list[tuple[str, str]]) -> None:
+    """Merge one run into the model on disk (blocking: file lock, read, atomic replace)."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _model_path(exam_id)
+    with open(path.with_suffix(".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        model = _read_model(path)
+        _add_run(model, sequence)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(model, f, indent=2)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        _models[exam_id] = (_mtime_ns(path), model)
+
+
+def match_user_data_key(user_data: dict, label: Optional[str], value: Optional[str]) -> Optional[str]:
+    """
+    Map a filled field (LLM label + value typed) to its user_data key.
+    Prefers an exact value match; breaks ties on label similarity.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    candidates = [k for k, v in user_data.items() if v is not None and str(v).strip() == value and not k.startswith("_")]
+    if not candidates:
+        return None
+    if len(candidates) == 1 or not label:
+        return candidates[0]
+    label_norm = "".join(ch for ch in label.lower() if ch.isalnum())
+    for key in candidates:
+        key_norm = "".join(ch for ch in key.lower() if ch.isalnum())
+        if key_norm and (key_norm in label_norm or label_norm in key_norm):
+            return key
+    return candidates[0]
+
+
+def fill_sequence(history: list[dict]) -> list[tuple[str, str]]:
+    """(key, label) of successful fill_field actions in first-fill order, de-duplicated by key."""
+    seen: set[str] = set()
+    sequence = []
+    for entry in sorted(history, key=lambda e: e.get("ts") or 0):
+        key = entry.get("key")
+        if entry.get("action") != "fill_field" or not entry.get("success") or not key or key in seen:
+            continue
+        seen.add(key)
+        sequence.append((key, entry.get("target") or key))
+    return sequence
+
+
+async def learn_from_history(exam_id: Any, history: list[dict]) -> int:
+    """Fold one successful session's action history into the exam's model. Returns fields learned."""
+    sequence = fill_sequence(history)
+    if len(sequence) < 2:
+        return 0
+
+    await asyncio.to_thread(_save_run, str(exam_id), sequence)
+    return len(sequence)
+
+
+def expected_order(exam_id: Any) -> list[str]:
+    """Keys in learned fill order (empty until the model has MIN_RUNS runs)."""
+    model = load_model(exam_id)
+    runs = model.get("runs", 0)
+    if runs < MIN_RUNS:
+        return []
+    fields = model.get("fields", {})
+    supported = [k for k, f in fields.items() if f["count"] >= runs * MIN_FIELD_SUPPORT]
+    return sorted(supported, key=lambda k: fields[k]["pos_sum"] / fields[k]["count"])
+
+
+def label_for(exam_id: Any, key: str) -> str:
+    """Most common on-page label seen for a user_data key (falls back to the key)."""
+    labels = load_model(exam_id).get("fields", {}).get(key, {}).get("labels", {})
+    if not labels:
+        return key
+    return max(labels.items(), key=lambda item: item[1])[0]
+
+
+def plan_after(exam_id: Any, key: str, user_data: dict, already_filled: list[str]) -> list[str]:
+    """
+    Keys expected to follow `key`, skipping ones already filled or without a value.
+    Empty if the model doesn't know `key` (the LLM stays in charge).
+    """
+    order = expected_order(exam_id)
+    if key not in order:
+        return []
+    filled = {f.lower().strip() for f in already_filled}
+    queue = []
+    for next_key in order[order.index(key) + 1:]:
+        value = user_data.get(next_key)
+        if value in (None, ""):
+            continue
+        if next_key.lower() in filled or label_for(exam_id, next_key).lower().strip() in filled:
+            continue
+        queue.append(next_key)
+    return queue
@@ -14,6 +14,7 @@ from pydantic import BaseModel, Field
 from google import genai
 
 from app.config import settings
+from app.services.tracing import span
 
 
 # Configure Gemini Client (new google-genai package)
@@ -404,21 +405,22 @@ If all fields are filled (including captcha in Already filled list), click the s
         try:
             # Run sync call in executor with timeout
             loop = asyncio.get_event_loop()
-            response = await asyncio.wait_for(
-                loop.run_in_executor(
-                    None, 
-                    lambda: client.models.generate_content(
-                        model="gemini-2.5-flash",  # Supported model with vision (gemini-1.5-flash can 404)
-                        contents=contents,
-                        config=genai.types.GenerateContentConfig(
-                            temperature=0.1,
-                            top_p=0.95,
-                            response_mime_type="application/json",
+            async with span("llm", "decide_next_action"):
+                response = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        None, 
+                        lambda: client.models.generate_content(
+                            model="gemini-2.5-flash",  # Supported model with vision (gemini-1.5-flash can 404)
+                            contents=contents,
+                            config=genai.types.GenerateContentConfig(
+                                temperature=0.1,
+                                top_p=0.95,
+                                response_mime_type="application/json",
+                            )
                         )
-                    )
-                ),
-                timeout=30.0  # Reduced to 30s since optimized image should be faster
-            )
+                    ),
+                    timeout=30.0  # Reduced to 30s since optimized image should be faster
+                )
         except asyncio.TimeoutError:
             print("[LLM] Gemini API call timed out after 30s")
             return ActionDecision(
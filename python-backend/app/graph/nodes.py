@@ -5,14 +5,20 @@ Uses LangGraph's built-in interrupt() for human-in-the-loop.
 Calls TypeScript Stagehand backend for browser automation.
 Now uses LLM Vision decision layer for intelligent action selection.
 """
-from typing import Any
-from datetime import datetime
+from typing import Any, Optional
 import httpx
 from langgraph.types import interrupt
 
-from app.graph.state import GraphState
+from app.graph.state import GraphState, ActionRecord, make_action, as_action_record
 from app.graph.llm_decision import decide_next_action, ActionDecision
 from app.config import settings
+from app.services.blob_store import put_screenshot, get_screenshot_base64
+from app.services.action_log import append_actions, read_actions
+from app.graph import field_order
+from app.graph.page_fingerprint import fingerprint_page, same_page
+from app.graph.resume_latency import mark_graph_resumed, mark_next_action
+from app.services.tracing import span, traced_sleep
+from app.services.portal_limiter import get_portal_limiter
 from app.api.websocket import (
     send_screenshot,
     send_log,
@@ -33,14 +39,22 @@ TIMEOUT = 60.0  # 60 second timeout for browser operations
 
 # ============= Helper Functions =============
 
+def stagehand_span_name(endpoint: str, data: dict) -> str:
+    """Trace span name for a Stagehand call, e.g. 'execute:act' or 'screenshot'."""
+    action = data.get("action") if isinstance(data, dict) else None
+    return f"{endpoint}:{action}" if action else endpoint
+
+
 async def call_stagehand(endpoint: str, data: dict, timeout: float = TIMEOUT) -> dict:
     """
-    Make HTTP call to TypeScript Stagehand backend.
+    Make HTTP call to TypeScript Stagehand backend (paced per exam portal).
     """
+    await get_portal_limiter().action(data.get("sessionId") if isinstance(data, dict) else None, endpoint)
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(f"{STAGEHAND_URL}/api/{endpoint}", json=data)
-            return response.json()
+        async with span("stagehand", stagehand_span_name(endpoint, data)):
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                response = await client.post(f"{STAGEHAND_URL}/api/{endpoint}", json=data)
+                return response.json()
     except httpx.ConnectError:
         return {"success": False, "error": "Cannot connect to Stagehand backend (port 3001)"}
     except Exception as e:
@@ -54,6 +68,30 @@ async def forward_screenshot(session_id: str, result: dict, step: str = "capture
         await send_screenshot(session_id, screenshot, step)
 
 
+async def record_action(
+    session_id: str,
+    action: str,
+    target: Optional[str] = None,
+    success: bool = True,
+    key: Optional[str] = None
+) -> list[ActionRecord]:
+    """
+    Create an ActionRecord, append it to the session's full action log,
+    and return it as a one-item list for the state's bounded action_history.
+    """
+    record = make_action(action, target, success, key)
+    await append_actions(session_id, [record])
+    return [record]
+
+
+async def stash_screenshot(session_id: str, result: dict) -> Optional[str]:
+    """
+    Store the screenshot from a Stagehand response in the blob store (pinned for the session).
+    Returns its content hash - state and checkpoints carry only this, never the base64.
+    """
+    return await put_screenshot(result.get("screenshot"), session_id)
+
+
 # ============= Core Nodes =============
 
 async def init_browser_node(state: GraphState) -> dict:
@@ -61,7 +99,6 @@ async def init_browser_node(state: GraphState) -> dict:
     Initialize browser and navigate to exam URL.
     This is the entry point of the workflow.
     Includes retry logic for navigation failures.
-    SKIPS if browser already initialized (resuming from waiting state).
     """
     session_id = state["session_id"]
     if is_session_cancelled(session_id):
@@ -69,16 +106,8 @@ async def init_browser_node(state: GraphState) -> dict:
     exam_url = state["exam_url"]
     max_init_retries = 3
     
-    # Check if we're resuming (browser already open)
-    # If we have human_input_value set, it means we're resuming after user input
-    if state.get("human_input_value") is not None:
-        await send_log(session_id, "Resuming from user input, skipping browser init...", "info")
-        return {"current_step": "init_browser"}  # Skip init, proceed to capture
-    
-    # Also check if we already have progress (browser was initialized before)
-    if state.get("progress", 0) > 5:
-        await send_log(session_id, "Browser session exists, skipping re-init...", "info")
-        return {"current_step": "init_browser"}
+    # Paused workflows resume at await_input via the checkpointer, so this node
+    # only ever runs once per session - no "already initialized" heuristics needed.
     
     # Check phase and skip completed phases
     current_phase = state.get("current_phase", "registration")
@@ -112,7 +141,7 @@ async def init_browser_node(state: GraphState) -> dict:
             wait_time = 2 ** attempt  # Exponential backoff: 2, 4, 8 seconds
             await send_log(session_id, f"Retry {attempt}/{max_init_retries} in {wait_time}s...", "warning")
             import asyncio
-            await asyncio.sleep(wait_time)
+            await traced_sleep(wait_time)
         
         # Call TypeScript backend to initialize browser
         result = await call_stagehand("init", {
@@ -129,13 +158,8 @@ async def init_browser_node(state: GraphState) -> dict:
                 "current_step": "init_browser",
                 "progress": 10,
                 "page_url": exam_url,
-                "screenshot_base64": result.get("screenshot"),
-                "action_history": [{
-                    "action": "navigate",
-                    "target": exam_url,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "success": True
-                }]
+                "screenshot_hash": await stash_screenshot(session_id, result),
+                "action_history": await record_action(session_id, "navigate", exam_url)
             }
         
         last_error = result.get("error", "Failed to initialize browser")
@@ -228,7 +252,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
                 "prompt": "Click on the FIRST OTP input box (the leftmost empty digit input box)"
             }, timeout=30.0)
             
-            await asyncio.sleep(0.5)
+            await traced_sleep(0.5)
             
             # Type the ENTIRE OTP string - boxes will auto-advance after each digit
             # Using a very explicit prompt
@@ -242,7 +266,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
             await send_log(session_id, f"✓ OTP entered, waiting for dialog...", "success")
             
             # Wait for OK/success dialog to appear after OTP entry
-            await asyncio.sleep(4.5)
+            await traced_sleep(4.5)
             
             await call_stagehand("execute", {
                 "sessionId": session_id,
@@ -262,6 +286,9 @@ async def capture_screenshot_node(state: GraphState) -> dict:
     # Clear the input after using it
     if human_input:
         clear_input["human_input_value"] = None
+        elapsed_ms = mark_next_action(session_id)
+        if elapsed_ms is not None:
+            print(f"⏱️ Resume latency for {session_id}: {elapsed_ms:.0f}ms to next action")
     
     # Capture screenshot
     result = await call_stagehand("screenshot", {"sessionId": session_id})
@@ -319,7 +346,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
                     # First, dismiss any popups that might be showing
                     await send_log(session_id, "🔍 Checking for popups to dismiss...", "info")
                     import asyncio
-                    await asyncio.sleep(1.0)  # Wait for popup to appear if any
+                    await traced_sleep(1.0)  # Wait for popup to appear if any
                     
                     popup_result = await call_stagehand("execute", {
                         "sessionId": session_id,
@@ -329,7 +356,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
                     
                     if popup_result.get("success"):
                         await send_log(session_id, "✅ Dismissed popup", "success")
-                        await asyncio.sleep(1.0)
+                        await traced_sleep(1.0)
                         result = await call_stagehand("screenshot", {"sessionId": session_id})
                         if result.get("success"):
                             await forward_screenshot(session_id, result, "capture")
@@ -344,7 +371,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
                     
                     if login_result.get("success"):
                         await send_log(session_id, "✅ Switched to login form", "success")
-                        await asyncio.sleep(2.0)  # Wait for form to load
+                        await traced_sleep(2.0)  # Wait for form to load
                         result = await call_stagehand("screenshot", {"sessionId": session_id})
                         if result.get("success"):
                             await forward_screenshot(session_id, result, "capture")
@@ -423,7 +450,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
                                     return {
                                         **clear_input,
                                         "current_step": "capture_screenshot",
-                                        "screenshot_base64": result.get("screenshot"),
+                                        "screenshot_hash": await stash_screenshot(session_id, result),
                                         "email_already_registered_detected": email_already_registered_detected,
                                         "already_filled_fields": ["email"],
                                         "page_url": state.get("page_url", ""),
@@ -439,7 +466,7 @@ async def capture_screenshot_node(state: GraphState) -> dict:
         return_dict = {
             **clear_input,
             "current_step": "capture_screenshot",
-            "screenshot_base64": result.get("screenshot"),
+            "screenshot_hash": await stash_screenshot(session_id, result),
             "email_already_registered_detected": email_already_registered_detected,  # Set flag from UI
             "page_url": state.get("exam_url") if should_navigate_to_login else state.get("page_url"),
         }
@@ -466,14 +493,14 @@ async def llm_decide_node(state: GraphState) -> dict:
     session_id = state["session_id"]
     if is_session_cancelled(session_id):
         return {"status": "stopped", "current_step": "llm_decide"}
-    screenshot = state.get("screenshot_base64", "")
+    screenshot_hash = state.get("screenshot_hash")
     user_data = state.get("user_data", {})
     already_filled = state.get("already_filled_fields", [])
     page_url = state.get("page_url", "")
     retry_count = state.get("retry_count", 0)
     captcha_fail_count = state.get("captcha_fail_count", 0)
     
-    if not screenshot:
+    if not screenshot_hash:
         await send_log(session_id, "No screenshot available for analysis", "error")
         return {
             "current_step": "llm_decide",
@@ -481,52 +508,39 @@ async def llm_decide_node(state: GraphState) -> dict:
             "last_error": "No screenshot"
         }
     
-    # OPTIMIZATION: Check if page has changed since last LLM call
-    import hashlib
-    screenshot_hash = hashlib.md5(screenshot.encode()).hexdigest()[:16]
-    last_screenshot_hash = state.get("last_screenshot_hash", "")
-    consecutive_no_change = state.get("consecutive_no_change", 0)
-    
-    # If screenshot is identical and we just executed an action that might not have changed the page
-    # (e.g., typing in a field), and we have remaining fields, skip LLM and fill next field
-    page_unchanged = (screenshot_hash == last_screenshot_hash)
+    # FAST PATH: continue the learned field sequence without a vision call.
+    # The queue is planned from the per-exam field-order model after the LLM fills a
+    # field it knows; execute_action clears it on any mismatch (failed fill, navigation).
+    exam_id = state.get("exam_id")
+    fast_path_queue = list(state.get("fast_path_queue") or [])
     last_action = state.get("last_action_type", "")
     
-    if page_unchanged and consecutive_no_change < 2 and last_action == "fill_field":
-        # Page hasn't changed after fill - likely can continue filling without LLM
-        remaining_fields = {k: v for k, v in user_data.items() if k not in already_filled and v}
-        if remaining_fields:
-            # Pick next field to fill
-            next_field_key = list(remaining_fields.keys())[0]
-            next_field_value = remaining_fields[next_field_key]
-            
-            await send_log(session_id, f"⚡ Fast path: Filling next field without LLM (page unchanged)", "info")
-            
-            # Create a fill_field decision without LLM call
-            from app.graph.llm_decision import ActionDecision, build_fill_prompt
-            decision = ActionDecision(
-                action_type="fill_field",
-                field_name=next_field_key,
-                field_value=str(next_field_value),
-                stagehand_prompt=build_fill_prompt(next_field_key, str(next_field_value)),
-                reasoning=f"Fast path: Page unchanged, filling next field {next_field_key}"
-            )
-            
-            email_already_registered_detected = state.get("email_already_registered_detected", False)
-            account_creation_complete = state.get("account_creation_complete", False)
-            
-            return {
-                "current_step": "llm_decide",
-                "llm_decision": decision.model_dump(),
-                "progress": 25,
-                "last_screenshot_hash": screenshot_hash,
-                "consecutive_no_change": consecutive_no_change + 1,
-                "email_already_registered_detected": email_already_registered_detected,
-                "account_creation_complete": account_creation_complete,
-            }
-    
-    # Reset counter if we're doing a full LLM call
-    consecutive_no_change = 0
+    while fast_path_queue and last_action == "fill_field":
+        next_field_key = fast_path_queue.pop(0)
+        next_field_value = user_data.get(next_field_key)
+        if next_field_value in (None, ""):
+            continue
+        
+        field_label = field_order.label_for(exam_id, next_field_key)
+        await send_log(session_id, f"⚡ Fast path: Filling '{field_label}' from learned field order ({len(fast_path_queue)} more queued)", "info")
+        
+        from app.graph.llm_decision import ActionDecision, build_fill_prompt
+        decision = ActionDecision(
+            action_type="fill_field",
+            field_name=field_label,
+            field_value=str(next_field_value),
+            stagehand_prompt=build_fill_prompt(field_label, str(next_field_value)),
+            reasoning=f"Fast path: learned field order for this exam, filling {next_field_key}"
+        )
+        
+        return {
+            "current_step": "llm_decide",
+            "llm_decision": decision.model_dump(),
+            "progress": 25,
+            "fast_path_queue": fast_path_queue,
+            "email_already_registered_detected": state.get("email_already_registered_detected", False),
+            "account_creation_complete": state.get("account_creation_complete", False),
+        }
     
     await send_log(session_id, "🤖 LLM analyzing page...", "info")
     await send_status(session_id, "llm_decide", state.get("progress", 20), "AI analyzing page...")
@@ -534,6 +548,16 @@ async def llm_decide_node(state: GraphState) -> dict:
     # Check if account creation is complete
     account_creation_complete = state.get("account_creation_complete", False)
     
+    # Load the image only when the LLM actually needs it
+    screenshot = await get_screenshot_base64(screenshot_hash)
+    if not screenshot:
+        await send_log(session_id, "Screenshot missing from blob store", "error")
+        return {
+            "current_step": "llm_decide",
+            "llm_decision": None,
+            "last_error": "Screenshot not found"
+        }
+    
     # Call LLM to decide next action
     decision = await decide_next_action(
         screenshot_base64=screenshot,
@@ -577,6 +601,15 @@ async def llm_decide_node(state: GraphState) -> dict:
         "info"
     )
     
+    # If the LLM is filling a field the learned model knows, queue the rest of the sequence
+    fast_path_queue = []
+    if decision.action_type == "fill_field":
+        field_key = field_order.match_user_data_key(user_data, decision.field_name, decision.field_value)
+        if field_key:
+            fast_path_queue = field_order.plan_after(exam_id, field_key, user_data, already_filled)
+            if fast_path_queue:
+                await send_log(session_id, f"⚡ Learned field order: {len(fast_path_queue)} fields queued after '{field_key}'", "info")
+    
     # CRITICAL: Preserve email_already_registered_detected flag
     email_already_registered_detected = state.get("email_already_registered_detected", False)
     if email_already_registered_detected:
@@ -587,7 +620,7 @@ async def llm_decide_node(state: GraphState) -> dict:
         "llm_decision": decision.model_dump(),
         "progress": 25,
         "last_screenshot_hash": screenshot_hash,
-        "consecutive_no_change": consecutive_no_change,
+        "fast_path_queue": fast_path_queue,
         "email_already_registered_detected": email_already_registered_detected,
         "account_creation_complete": account_creation_complete,
     }
@@ -688,7 +721,7 @@ async def execute_single_action_node(state: GraphState) -> dict:
     
     if action_type == "wait_for_human":
         input_type = decision.input_type or "custom"
-        screenshot = state.get("screenshot_base64", "")
+        screenshot = await get_screenshot_base64(state.get("screenshot_hash")) or ""
         
         await send_log(session_id, f"⏸️ Waiting for user input: {decision.wait_reason}", "warning")
         await send_status(session_id, "waiting_input", state.get("progress", 50), f"Waiting for {input_type}...")
@@ -701,9 +734,8 @@ async def execute_single_action_node(state: GraphState) -> dict:
         else:
             await request_custom_input(session_id, decision.wait_reason or "Input required")
         
-        # Return with waiting status - workflow will END here
-        # When user provides input, resume_workflow will be called which will
-        # set human_input_value and waiting_for_input_type=None, then restart loop
+        # Return with waiting status - the graph routes to await_input and pauses there.
+        # resume_workflow resumes that node with the user's input (no restart from START).
         return {
             "current_step": "execute_action",
             "status": "waiting_input",
@@ -776,7 +808,7 @@ async def execute_single_action_node(state: GraphState) -> dict:
                     return {
                         "current_step": "execute_action",
                         "email_already_registered_detected": True,
-                        "screenshot_base64": result.get("screenshot"),
+                        "screenshot_hash": await stash_screenshot(session_id, result),
                         "already_filled_fields": [],  # Clear filled fields for login flow
                     }
     
@@ -804,9 +836,9 @@ async def execute_single_action_node(state: GraphState) -> dict:
                 stagehand_prompt = short
 
     # For notice/announcement links: if we're clicking the same link 3+ times without page change, try scrolling or simpler phrasing
-    last_action_history = state.get("action_history", [])[-3:] if state.get("action_history") else []
+    last_action_history = [as_action_record(a) for a in (state.get("action_history") or [])[-3:]]
     if action_type == "click_button" and decision.button_text and len(last_action_history) >= 3:
-        last_3_targets = [a.get("target") for a in last_action_history if a.get("action") == "click_button"]
+        last_3_targets = [a.target for a in last_action_history if a.action == "click_button"]
         if last_3_targets and all(t == last_3_targets[0] for t in last_3_targets) and decision.button_text == last_3_targets[0]:
             await send_log(session_id, f"⚠️ Stuck clicking same link 3+ times: '{decision.button_text[:60]}' - trying alternative", "warning")
             if "link" in stagehand_prompt.lower() and ("re-opening" in stagehand_prompt.lower() or "application" in stagehand_prompt.lower()):
@@ -830,8 +862,7 @@ async def execute_single_action_node(state: GraphState) -> dict:
     
     # Track page state BEFORE action (for loop detection)
     previous_page_url = state.get("page_url", "")
-    previous_page_text = state.get("screenshot_base64", "")  # We'll use page_text from result instead
-    previous_page_text_hash = state.get("previous_page_text_hash", "")
+    previous_fingerprint = state.get("page_fingerprint")
     
     # Execute via Stagehand
     result = await call_stagehand("execute", {
@@ -845,26 +876,22 @@ async def execute_single_action_node(state: GraphState) -> dict:
     
     # ========== DETECT PAGE CHANGE AFTER BUTTON CLICK ==========
     page_changed = False
-    previous_page_url = state.get("page_url", "")
-    previous_page_text_hash = state.get("previous_page_text_hash", "")
     repeated_action_count = state.get("repeated_action_count", 0)
     
     current_page_url = result.get("pageUrl", "") or previous_page_url
     current_page_text = result.get("page_text", "")
     
-    # Create hash of page text for comparison
-    import hashlib
-    if current_page_text:
-        current_page_text_hash = hashlib.md5(current_page_text.encode()).hexdigest()[:16]
-    else:
-        current_page_text_hash = ""
+    # Fingerprint = URL + normalised text hash + perceptual image hash (tolerant to cursor/clock noise)
+    screenshot_hash = await stash_screenshot(session_id, result)
+    current_fingerprint = await fingerprint_page(screenshot_hash, current_page_text, current_page_url)
+    page_same = same_page(previous_fingerprint, current_fingerprint)
     
     # Check if page changed (URL or content)
     if action_type == "click_button":
         if current_page_url != previous_page_url and current_page_url:
             page_changed = True
             await send_log(session_id, f"✅ Page navigated: {current_page_url[:80]}", "success")
-        elif current_page_text_hash and current_page_text_hash != previous_page_text_hash:
+        elif previous_fingerprint and not page_same:
             page_changed = True
             await send_log(session_id, "✅ Page content changed", "success")
         else:
@@ -890,6 +917,12 @@ async def execute_single_action_node(state: GraphState) -> dict:
                     if alternative_result.get("success"):
                         await send_log(session_id, "✅ Alternative navigation attempted", "info")
                         result = alternative_result  # Use alternative result
+                        # Describe the page after the retry, not the one that was stuck
+                        current_page_url = result.get("pageUrl", "") or previous_page_url
+                        current_page_text = result.get("page_text", "")
+                        screenshot_hash = await stash_screenshot(session_id, result)
+                        current_fingerprint = await fingerprint_page(screenshot_hash, current_page_text, current_page_url)
+                        page_same = same_page(previous_fingerprint, current_fingerprint)
                         # Reset counter if alternative worked
                         if alternative_result.get("pageUrl") != previous_page_url:
                             repeated_action_count = 0
@@ -958,7 +991,7 @@ async def execute_single_action_node(state: GraphState) -> dict:
     # IMPORTANT: Wait for any popups/dialogs to appear after action
     # This prevents analyzing a faded background before popup shows
     import asyncio
-    await asyncio.sleep(2.0)  # 2 second delay for popups
+    await traced_sleep(2.0)  # 2 second delay for popups
     
     # ========== DETECT SUCCESSFUL LOGIN ==========
     account_creation_complete = state.get("account_creation_complete", False)
@@ -1041,6 +1074,21 @@ async def execute_single_action_node(state: GraphState) -> dict:
         else:
             await send_log(session_id, f"⚠️ Field '{decision.field_name}' was already filled - skipping duplicate", "warning")
     
+    # Map the filled field to its user_data key (for the learned field-order model)
+    filled_key = None
+    if action_type == "fill_field" and result.get("success"):
+        filled_key = field_order.match_user_data_key(state.get("user_data", {}), decision.field_name, decision.field_value)
+    
+    # Fast-path queue only survives a successful fill on the same page
+    fast_path_queue = list(state.get("fast_path_queue") or [])
+    if fast_path_queue and (
+        action_type != "fill_field"
+        or not result.get("success")
+        or (previous_fingerprint and not page_same)
+    ):
+        await send_log(session_id, "↩️ Page diverged from learned field order - handing back to LLM", "info")
+        fast_path_queue = []
+    
     # Save form filling progress to database periodically (every 5 fields or on phase change)
     current_phase = state.get("current_phase", "registration")
     if current_phase == "form_filling" and len(already_filled) > 0:
@@ -1079,7 +1127,7 @@ async def execute_single_action_node(state: GraphState) -> dict:
     
     return {
         "current_step": "execute_action",
-        "screenshot_base64": result.get("screenshot"),
+        "screenshot_hash": screenshot_hash,
         "already_filled_fields": already_filled,
         "email_already_registered_detected": email_error_detected,  # Preserve flag from UI detection
         "account_creation_complete": account_creation_complete,  # Track if login/registration is complete
@@ -1088,17 +1136,20 @@ async def execute_single_action_node(state: GraphState) -> dict:
         "registration_completed": registration_completed_state,  # Preserve registration completion status
         "page_url": current_page_url,  # Update page URL
         "previous_page_url": previous_page_url,  # Track previous URL
-        "previous_page_text_hash": current_page_text_hash if current_page_text else previous_page_text_hash,  # Track page content hash
+        "page_fingerprint": current_fingerprint,  # Page state after this action (loop/fast-path checks)
         "repeated_action_count": repeated_action_count,  # Track loop attempts
         "retry_count": retry_count,  # Preserve or reset retry count
         "progress": min(state.get("progress", 30) + 5, 90),
         "last_action_type": action_type,  # Track action type for LLM optimization
-        "action_history": state.get("action_history", []) + [{
-            "action": action_type,
-            "target": decision.field_name or decision.checkbox_label or decision.button_text,
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": result.get("success", False)
-        }]
+        "fast_path_queue": fast_path_queue,
+        # Only the new record - the bounded_append reducer merges it into history
+        "action_history": await record_action(
+            session_id,
+            action_type,
+            decision.field_name or decision.checkbox_label or decision.button_text,
+            result.get("success", False),
+            key=filled_key
+        )
     }
 
 
@@ -1150,7 +1201,7 @@ async def analyze_page_node(state: GraphState) -> dict:
     return {
         "current_step": "analyze_page",
         "analysis": analysis,
-        "screenshot_base64": result.get("screenshot"),
+        "screenshot_hash": await stash_screenshot(session_id, result),
         "progress": 20,
     }
 
@@ -1307,13 +1358,8 @@ async def fill_form_node(state: GraphState) -> dict:
     return {
         "current_step": "fill_form",
         "progress": 50,
-        "screenshot_base64": result.get("screenshot"),
-        "action_history": [{
-            "action": "fill_form",
-            "target": f"{success_count} fields",
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": success_count > 0
-        }]
+        "screenshot_hash": await stash_screenshot(session_id, result),
+        "action_history": await record_action(session_id, "fill_form", f"{success_count} fields", success_count > 0)
     }
 
 
@@ -1341,13 +1387,8 @@ async def click_action_node(state: GraphState) -> dict:
         return {
             "current_step": "click_action",
             "progress": 55,
-            "screenshot_base64": result.get("screenshot"),
-            "action_history": [{
-                "action": "click_checkbox",
-                "target": checkbox_to_click[:30],
-                "timestamp": datetime.utcnow().isoformat(),
-                "success": result.get("success", False)
-            }]
+            "screenshot_hash": await stash_screenshot(session_id, result),
+            "action_history": await record_action(session_id, "click_checkbox", checkbox_to_click[:30], result.get("success", False))
         }
     
     # Click submit button
@@ -1359,19 +1400,52 @@ async def click_action_node(state: GraphState) -> dict:
     return {
         "current_step": "click_action",
         "progress": 60,
-        "screenshot_base64": result.get("screenshot"),
+        "screenshot_hash": await stash_screenshot(session_id, result),
         "page_url": result.get("pageUrl", ""),
-        "action_history": [{
-            "action": "click",
-            "target": "submit",
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": result.get("success", False)
-        }]
+        "action_history": await record_action(session_id, "click", "submit", result.get("success", False))
     }
 
 
 # ============= Human Intervention Nodes (using LangGraph interrupt()) =============
 
+async def await_input_node(state: GraphState) -> dict:
+    """
+    Pause point for human input (OTP, captcha, custom field).
+    The input request was already sent to the frontend by the node that set
+    status="waiting_input"; this node only calls interrupt(), so the checkpoint
+    points here and resume_workflow continues from this node with Command(resume=...).
+    Nothing before interrupt() has side effects, since the node re-runs on resume.
+    """
+    session_id = state["session_id"]
+    
+    response = interrupt({
+        "type": "human_input",
+        "input_type": state.get("waiting_for_input_type"),
+        "session_id": session_id,
+    })
+    
+    # Resumed: response is {"value": ..., "field_id": ...} from resume_workflow
+    if isinstance(response, dict):
+        value = response.get("value")
+        field_id = response.get("field_id")
+    else:
+        value, field_id = response, None
+    
+    received_custom_inputs = dict(state.get("received_custom_inputs") or {})
+    if field_id:
+        received_custom_inputs[field_id] = value
+    
+    mark_graph_resumed(session_id)
+    
+    return {
+        "current_step": "await_input",
+        "status": "running",
+        "human_input_value": value,
+        "waiting_for_input_type": None,
+        "received_custom_inputs": received_custom_inputs,
+    }
+
+
 async def request_otp_node(state: GraphState) -> dict:
     """
     Request OTP from user using LangGraph's built-in interrupt().
@@ -1405,11 +1479,7 @@ async def request_otp_node(state: GraphState) -> dict:
         "current_step": "request_otp",
         "received_otp": otp,
         "pending_intervention": None,
-        "action_history": [{
-            "action": "otp_entered",
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": True
-        }]
+        "action_history": await record_action(session_id, "otp_entered")
     }
 
 
@@ -1451,11 +1521,7 @@ async def request_captcha_node(state: GraphState) -> dict:
         "current_step": "request_captcha",
         "received_captcha": solution,
         "pending_intervention": None,
-        "action_history": [{
-            "action": "captcha_solved",
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": True
-        }]
+        "action_history": await record_action(session_id, "captcha_solved")
     }
 
 
@@ -1513,12 +1579,7 @@ async def request_custom_input_node(state: GraphState) -> dict:
         "current_step": "request_custom_input",
         "received_custom_inputs": received_custom,
         "pending_intervention": None,
-        "action_history": [{
-            "action": "custom_input_entered",
-            "target": unknown_field,
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": True
-        }]
+        "action_history": await record_action(session_id, "custom_input_entered", unknown_field)
     }
 
 
@@ -1538,12 +1599,8 @@ async def enter_input_node(state: GraphState) -> dict:
     return {
         "current_step": "enter_input",
         "progress": 70,
-        "screenshot_base64": result.get("screenshot"),
-        "action_history": [{
-            "action": "continue_after_input",
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": result.get("success", True)
-        }]
+        "screenshot_hash": await stash_screenshot(session_id, result),
+        "action_history": await record_action(session_id, "continue_after_input", None, result.get("success", True))
     }
 
 
@@ -1600,12 +1657,7 @@ async def error_recovery_node(state: GraphState) -> dict:
         "current_step": "error_recovery",
         "retry_count": retry_count + 1,
         "last_error": None,
-        "action_history": [{
-            "action": "retry",
-            "target": f"attempt_{retry_count + 1}",
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": True
-        }]
+        "action_history": await record_action(session_id, "retry", f"attempt_{retry_count + 1}")
     }
 
 
@@ -1615,6 +1667,15 @@ async def save_analytics_node(state: GraphState) -> dict:
     """
     session_id = state["session_id"]
     
+    # Learn this exam's field order from a successful run (drives the no-LLM fast path)
+    if state.get("status") == "completed" and state.get("exam_id"):
+        try:
+            learned = await field_order.learn_from_history(state["exam_id"], await read_actions(session_id))
+            if learned:
+                await send_log(session_id, f"🧠 Learned field order from {learned} filled fields", "info")
+        except Exception as e:
+            await send_log(session_id, f"⚠️ Failed to update field order model: {e}", "warning")
+    
     # TODO: Save to ExamAnalytics collection
     await send_log(session_id, "📊 Analytics saved", "info")
     
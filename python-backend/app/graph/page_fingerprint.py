@@ -0,0 +1,136 @@
+"""
+Page Fingerprint
+Cheap page-state fingerprint for change and loop detection.
+
+A fingerprint combines:
+- url:   the page URL without its #fragment
+- text:  hash of the normalised page text (lowercased, whitespace collapsed, clock times masked)
+- image: 64-bit difference hash (dHash) of a 9x8 greyscale downsample of the screenshot
+
+Two fingerprints describe the same page when the URL and text match and the image hashes
+differ in at most `tolerance` bits, so a blinking cursor or ticking clock is not a "change".
+
+Screenshots are already content-addressed in the blob store, so the dHash is memoised by
+blob digest: an identical screenshot is never decoded twice.
+"""
+import asyncio
+import hashlib
+import io
+import re
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.services.blob_store import get_screenshot_bytes
+
+
+# blob digest -> dHash (bounded LRU)
+_DHASH_CACHE_SIZE = 512
+_dhash_cache: OrderedDict[str, int] = OrderedDict()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_CLOCK_RE = re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?\s*(?:am|pm)?\b")
+
+
+def normalize_url(url: Optional[str]) -> str:
+    return (url or "").split("#", 1)[0].rstrip("/")
+
+
+def text_digest(page_text: Optional[str]) -> Optional[str]:
+    """Hash of normalised page text (None if there is no text)."""
+    if not page_text:
+        return None
+    text = _CLOCK_RE.sub("<time>", page_text.lower())
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _dhash(image_bytes: bytes) -> int:
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("L", (64, 64))  # JPEG: decode at reduced scale
+    pixels = list(img.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+async def image_dhash(screenshot_hash: Optional[str]) -> Optional[int]:
+    """dHash of a stored screenshot, memoised by its blob digest."""
+    if not screenshot_hash:
+        return None
+    cached = _dhash_cache.get(screenshot_hash)
+    if cached is not None:
+        _dhash_cache.move_to_end(screenshot_hash)
+        return cached
+
+    data = await get_screenshot_bytes(screenshot_hash)
+    if not data:
+        return None
+    try:
+        value = await asyncio.to_thread(_dhash, data)
+    except Exception:
+        return None
+
+    _dhash_cache[screenshot_hash] = value
+    while len(_dhash_cache) > _DHASH_CACHE_SIZE:
+        _dhash_cache.popitem(last=False)
+    return value
+
+
+async def fingerprint_page(
+    screenshot_hash: Optional[str],
+    page_text: Optional[str] = None,
+    page_url: Optional[str] = None
+) -> dict:
+    """Build a page fingerprint (plain dict so it can live in workflow state)."""
+    dhash = await image_dhash(screenshot_hash)
+    return {
+        "url": normalize_url(page_url),
+        "text": text_digest(page_text),
+        "image": f"{dhash:016x}" if dhash is not None else None,
+        "blob": screenshot_hash,
+    }
+
+
+def image_distance(a: Optional[dict], b: Optional[dict]) -> Optional[int]:
+    """Hamming distance between two fingerprints' image hashes (None if either is missing)."""
+    if not a or not b:
+        return None
+    if a.get("blob") and a.get("blob") == b.get("blob"):
+        return 0
+    if not a.get("image") or not b.get("image"):
+        return None
+    return bin(int(a["image"], 16) ^ int(b["image"], 16)).count("1")
+
+
+def same_page(a: Optional[dict], b: Optional[dict], tolerance: Optional[int] = None) -> bool:
+    """
+    True if two fingerprints describe the same page state.
+    Components missing on either side are ignored; with nothing to compare, it's a change.
+    """
+    if not a or not b:
+        return False
+    if tolerance is None:
+        tolerance = settings.page_fingerprint_tolerance
+
+    compared = False
+    if a.get("url") and b.get("url"):
+        if a["url"] != b["url"]:
+            return False
+        compared = True
+    if a.get("text") and b.get("text"):
+        if a["text"] != b["text"]:
+            return False
+        compared = True
+    distance = image_distance(a, b)
+    if distance is not None:
+        if distance > tolerance:
+            return False
+        compared = True
+    return compared
@@ -13,6 +13,7 @@ Usage:
 
 import asyncio
 import base64
+import hashlib
 import io
 import json
 from datetime import datetime, timezone
@@ -22,6 +23,9 @@ from typing import Any, Optional
 import httpx
 
 from app.config import settings
+from app.services.tracing import span, traced, traced_sleep
+from app.services.portal_limiter import get_portal_limiter
+from app.services import session_counters, step_metrics
 from app.api.websocket import (
     send_screenshot,
     send_log,
@@ -95,10 +99,15 @@ def _extract_actions_from_result(response: dict) -> list:
 # ── Stagehand helpers ────────────────────────────────────────────────
 
 async def _stagehand(endpoint: str, data: dict, timeout: float = TIMEOUT) -> dict:
+    action = data.get("action")
+    await get_portal_limiter().action(data.get("sessionId"), endpoint)
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            resp = await client.post(f"{STAGEHAND_URL}/api/{endpoint}", json=data)
-            return resp.json()
+        async with span("stagehand", f"{endpoint}:{action}" if action else endpoint):
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                resp = await client.post(f"{STAGEHAND_URL}/api/{endpoint}", json=data)
+                result = resp.json()
+                step_metrics.note_stagehand(action, len(resp.request.content), len(resp.content), bool(result.get("success")))
+                return result
     except httpx.ConnectError:
         return {"success": False, "error": "Cannot connect to Stagehand (port 3001)"}
     except Exception as e:
@@ -125,6 +134,14 @@ def load_playbook(exam_slug: str) -> Optional[dict]:
         return json.load(f)
 
 
+def playbook_version(playbook: dict) -> str:
+    """The playbook's "version", or a short hash of its steps (changes whenever they are edited)."""
+    if playbook.get("version"):
+        return str(playbook["version"])[:64]
+    steps = json.dumps(playbook.get("workflow_steps", []), sort_keys=True)
+    return hashlib.sha256(steps.encode()).hexdigest()[:12]
+
+
 # ── Human-input wait / resolve ───────────────────────────────────────
 
 async def wait_for_human_input(
@@ -154,9 +171,11 @@ async def wait_for_human_input(
     await send_log(session_id, f"⏳ {wait_reason}", "warning")
 
     try:
-        await asyncio.wait_for(event.wait(), timeout=timeout_seconds)
+        async with span("human", input_type):
+            await asyncio.wait_for(event.wait(), timeout=timeout_seconds)
     except asyncio.TimeoutError:
         _pending_inputs.pop(session_id, None)
+        session_counters.discard(session_id)
         raise RuntimeError(f"Timeout ({timeout_seconds}s) waiting for {input_type}")
 
     value = _pending_inputs.pop(session_id, {}).get("value", "")
@@ -245,7 +264,9 @@ def _build_prompt(field: dict, value: str) -> str:
 
 # ── LLM helpers (Gemini — only for captcha + success check) ──────────
 
+@traced("llm")
 async def _read_captcha_llm(screenshot_b64: str) -> str:
+    step_metrics.note_llm_call()
     from google import genai
     from app.graph.llm_decision import client as gemini_client
 
@@ -284,7 +305,9 @@ async def _read_captcha_llm(screenshot_b64: str) -> str:
     return resp.text.strip()
 
 
+@traced("llm")
 async def _check_success_llm(screenshot_b64: str, patterns: list[str]) -> bool:
+    step_metrics.note_llm_call()
     from google import genai
     from app.graph.llm_decision import client as gemini_client
 
@@ -324,12 +347,14 @@ async def _check_success_llm(screenshot_b64: str, patterns: list[str]) -> bool:
     return "yes" in resp.text.strip().lower()
 
 
+@traced("llm")
 async def _detect_missing_fields_llm(screenshot_b64: str, field_value_pairs: list[dict]) -> list[dict]:
     """Analyze screenshot to find fields that are still empty/unfilled.
 
     Returns list of dicts: [{"label": "...", "value": "..."}, ...] for fields
     the LLM sees as empty on the page.
     """
+    step_metrics.note_llm_call()
     from google import genai
     from app.graph.llm_decision import client as gemini_client
 
@@ -390,8 +415,10 @@ async def _detect_missing_fields_llm(screenshot_b64: str, field_value_pairs: lis
     return []
 
 
+@traced("llm")
 async def _check_errors_llm(screenshot_b64: str, error_patterns: list[str]) -> Optional[str]:
     """Return the matched error string, or None if no error on page."""
+    step_metrics.note_llm_call()
     from google import genai
     from app.graph.llm_decision import client as gemini_client
 
@@ -436,6 +463,7 @@ async def _check_errors_llm(screenshot_b64: str, error_patterns: list[str]) -> O
 
 # ── Individual step executors ────────────────────────────────────────
 
+@traced("handler")
 async def _exec_click(session_id: str, step: dict, exam_slug: str = None, prompt_cache: dict = None) -> dict:
     target = step.get("target", "")
     step_name = step.get("name", "")
@@ -456,7 +484,7 @@ async def _exec_click(session_id: str, step: dict, exam_slug: str = None, prompt
             "direction": step.get("scroll_direction", "down"),
             "pixels": step.get("scroll_pixels", 600),
         })
-        await asyncio.sleep(0.5)
+        await traced_sleep(0.5)
 
     used_cached = False
     if cached_actions:
@@ -517,6 +545,7 @@ async def _exec_click(session_id: str, step: dict, exam_slug: str = None, prompt
     return result
 
 
+@traced("handler")
 async def _exec_click_checkbox(session_id: str, step: dict, exam_slug: str = None, prompt_cache: dict = None) -> dict:
     target = step["target"]
     step_name = step.get("name", "")
@@ -537,7 +566,7 @@ async def _exec_click_checkbox(session_id: str, step: dict, exam_slug: str = Non
             "direction": step.get("scroll_direction", "down"),
             "pixels": step.get("scroll_pixels", 600),
         })
-        await asyncio.sleep(0.5)
+        await traced_sleep(0.5)
 
     used_cached = False
     if cached_actions:
@@ -590,6 +619,7 @@ async def _exec_click_checkbox(session_id: str, step: dict, exam_slug: str = Non
     return result
 
 
+@traced("handler")
 async def _exec_scroll(session_id: str, step: dict) -> dict:
     # Use deterministic scroll endpoint (Stagehand /api/scroll) so scroll always works
     direction = step.get("direction", "down")
@@ -603,10 +633,11 @@ async def _exec_scroll(session_id: str, step: dict) -> dict:
         })
         if not res.get("success"):
             return res
-        await asyncio.sleep(0.4)
+        await traced_sleep(0.4)
     return res
 
 
+@traced("handler")
 async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slug: str = None, prompt_cache: dict = None) -> dict:
     if step.get("scroll_first"):
         await _stagehand("scroll", {
@@ -614,7 +645,7 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
             "direction": "down",
             "pixels": step.get("scroll_pixels", 600),
         })
-        await asyncio.sleep(0.3)
+        await traced_sleep(0.3)
 
     step_name = step.get("name", "")
     fields = step.get("fields", [])
@@ -677,7 +708,7 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
                 break
             if attempt < max_field_retries - 1:
                 await send_log(session_id, f"  ⚠️ {field['label']} retry {attempt+1}...", "warning")
-                await asyncio.sleep(1.0)
+                await traced_sleep(1.0)
 
         if not field_success:
             await send_log(session_id, f"  ⚠️ {field['label']} failed: {result.get('error','')}", "warning")
@@ -707,10 +738,10 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
         # Delay after field — use delay_after_ms if set (e.g. for dropdowns that need time to open/filter)
         delay_after_ms = field.get("delay_after_ms")
         if delay_after_ms is not None:
-            await asyncio.sleep(delay_after_ms / 1000.0)
+            await traced_sleep(delay_after_ms / 1000.0)
         else:
             delay = 0.5 if field.get("type") == "select" else 0.15
-            await asyncio.sleep(delay)
+            await traced_sleep(delay)
 
     await send_log(session_id, f"  ✅ Filled {filled}/{len(fields)} fields", "success")
 
@@ -720,7 +751,7 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
         "direction": "down",
         "pixels": 300,
     })
-    await asyncio.sleep(0.3)
+    await traced_sleep(0.3)
     await _screenshot(session_id, f"section_{step.get('name', 'done')}")
 
     # ── Self-healing: if some fields were missed, use LLM screenshot analysis ──
@@ -736,7 +767,7 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
 
             # Scroll up to see the section, take screenshot
             await _stagehand("scroll", {"sessionId": session_id, "direction": "up", "pixels": 600})
-            await asyncio.sleep(0.3)
+            await traced_sleep(0.3)
             ss = await _screenshot(session_id, "self_heal_check")
 
             if ss:
@@ -763,7 +794,7 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
                         else:
                             await send_log(session_id, f"  ⚠️ Self-heal failed for: {label}", "warning")
                         await _screenshot(session_id, f"heal_{label.replace(' ', '_').lower()}")
-                        await asyncio.sleep(0.3)
+                        await traced_sleep(0.3)
                     if healed > 0:
                         await send_log(session_id, f"  🩹 Self-heal recovered {healed} field(s) — now {filled}/{len(fields)}", "success")
                 else:
@@ -774,6 +805,7 @@ async def _exec_fill_form(session_id: str, step: dict, user_data: dict, exam_slu
     return {"success": True, "filled": filled, "total": len(fields)}
 
 
+@traced("handler")
 async def _exec_solve_captcha(session_id: str, step: dict) -> dict:
     max_tries = step.get("max_retries", 3)
 
@@ -785,15 +817,18 @@ async def _exec_solve_captcha(session_id: str, step: dict) -> dict:
         if not ss:
             return {"success": False, "error": "Could not take screenshot for captcha"}
 
+        solved_by_llm = True
         try:
             captcha_text = await _read_captcha_llm(ss)
         except Exception as e:
             await send_log(session_id, f"  ⚠️ Captcha LLM error: {e}", "warning")
+            session_counters.count(session_id, session_counters.CAPTCHA_LLM_FAILED)
             if attempt == max_tries - 1 and step.get("fallback_to_human"):
                 await send_log(session_id, "Asking user to solve captcha...", "warning")
                 captcha_text = await wait_for_human_input(
                     session_id, "captcha", "Please solve the CAPTCHA", captcha_image=ss,
                 )
+                solved_by_llm = False
             else:
                 continue
 
@@ -804,8 +839,12 @@ async def _exec_solve_captcha(session_id: str, step: dict) -> dict:
             "prompt": f"Find the CAPTCHA input field (the text box above or near the captcha image) and type '{captcha_text}' into it. Clear any existing text first.",
         })
         if result.get("success"):
+            if solved_by_llm:
+                session_counters.count(session_id, session_counters.CAPTCHA_LLM_SOLVED)
             return {"success": True}
 
+        if solved_by_llm:
+            session_counters.count(session_id, session_counters.CAPTCHA_LLM_FAILED)
         await send_log(session_id, f"  ⚠️ Captcha fill failed (attempt {attempt+1})", "warning")
 
     if step.get("fallback_to_human"):
@@ -823,6 +862,7 @@ async def _exec_solve_captcha(session_id: str, step: dict) -> dict:
     return {"success": False, "error": "Captcha solving failed"}
 
 
+@traced("handler")
 async def _exec_wait_for_human(session_id: str, step: dict) -> dict:
     input_type = step.get("input_type", "custom")
     wait_reason = step.get("wait_reason", "Input needed")
@@ -847,6 +887,7 @@ async def _exec_wait_for_human(session_id: str, step: dict) -> dict:
     return {"success": True, "value": value}
 
 
+@traced("handler")
 async def _exec_check_success(session_id: str, step: dict) -> dict:
     ss = await _screenshot(session_id, "check_success")
     if not ss:
@@ -865,6 +906,16 @@ async def _exec_check_success(session_id: str, step: dict) -> dict:
 # ── Main step dispatcher ────────────────────────────────────────────
 
 async def _run_step(session_id: str, step: dict, user_data: dict, **kwargs) -> dict:
+    """Execute one playbook step and record its step metrics. kwargs may also include exam_id, playbook_version."""
+    async with step_metrics.measure_step(
+        session_id, step, kwargs.get("exam_id"), kwargs.get("playbook_version")
+    ) as metrics:
+        result = await _execute_step(session_id, step, user_data, **kwargs)
+        metrics.finish(result)
+    return result
+
+
+async def _execute_step(session_id: str, step: dict, user_data: dict, **kwargs) -> dict:
     """Execute one playbook step. Returns {success, error?, completed?}. kwargs may include exam_slug, prompt_cache for cost optimization."""
     action = step.get("action")
     name = step.get("name", f"step_{step.get('step')}")
@@ -879,6 +930,7 @@ async def _run_step(session_id: str, step: dict, user_data: dict, **kwargs) -> d
     for attempt in range(max_retries):
         if is_session_cancelled(session_id):
             return {"success": False, "error": "Stopped by user"}
+        step_metrics.note_attempt()
 
         try:
             if action == "click":
@@ -922,7 +974,7 @@ async def _run_step(session_id: str, step: dict, user_data: dict, **kwargs) -> d
 
             # Post-step wait
             if wait_after > 0:
-                await asyncio.sleep(wait_after / 1000)
+                await traced_sleep(wait_after / 1000)
 
             # Screenshot after step
             await _screenshot(session_id, name)
@@ -950,20 +1002,21 @@ async def _run_step(session_id: str, step: dict, user_data: dict, **kwargs) -> d
             last_error = str(e)
             if attempt < max_retries - 1:
                 await send_log(session_id, f"  ⚠️ Retry {attempt+1}/{max_retries}: {last_error}", "warning")
-                await asyncio.sleep(2)
+                await traced_sleep(2)
 
     return {"success": False, "error": last_error}
 
 
 # ── Main entry point ─────────────────────────────────────────────────
 
-async def run_playbook(session_id: str, playbook: dict, user_data: dict, start_from_step: int = None) -> dict:
+async def run_playbook(session_id: str, playbook: dict, user_data: dict, start_from_step: int = None, exam_id: int = None) -> dict:
     """
     Execute a full playbook from start to finish.
     
     Args:
         start_from_step: Optional step number to start from (for debugging). 
                         If set, browser will NOT be re-initialized - assumes session already exists.
+        exam_id: Exam the step metrics are recorded under (with the playbook version).
 
     Returns {"status": "completed"|"failed"|"stopped", "result_message": str}
     """
@@ -973,6 +1026,12 @@ async def run_playbook(session_id: str, playbook: dict, user_data: dict, start_f
     start_url = playbook.get("start_url", "")
     total = len(steps)
     prompt_cache = _load_prompt_cache(exam_slug) if exam_slug else {}
+    step_kwargs = {
+        "exam_slug": exam_slug,
+        "prompt_cache": prompt_cache,
+        "exam_id": exam_id,
+        "playbook_version": playbook_version(playbook),
+    }
 
     steps_filtered = None
     if start_from_step is not None:
@@ -1011,7 +1070,7 @@ async def run_playbook(session_id: str, playbook: dict, user_data: dict, start_f
 
     await send_log(session_id, "✅ Ready", "success")
     await _screenshot(session_id, "init")
-    await asyncio.sleep(2)
+    await traced_sleep(2)
 
     # ── Walk through steps ──
     captcha_step = None  # track for retry_captcha handler
@@ -1025,7 +1084,7 @@ async def run_playbook(session_id: str, playbook: dict, user_data: dict, start_f
         if step["action"] == "solve_captcha":
             captcha_step = step
 
-        result = await _run_step(session_id, step, user_data, exam_slug=exam_slug, prompt_cache=prompt_cache)
+        result = await _run_step(session_id, step, user_data, **step_kwargs)
 
         # Handle special error flags
         if not result.get("success"):
@@ -1036,9 +1095,10 @@ async def run_playbook(session_id: str, playbook: dict, user_data: dict, start_f
 
             if result.get("retry_captcha") and captcha_step:
                 await send_log(session_id, "🔄 Captcha was wrong — re-solving…", "warning")
-                cap_res = await _run_step(session_id, captcha_step, user_data, exam_slug=exam_slug, prompt_cache=prompt_cache)
+                session_counters.count(session_id, session_counters.CAPTCHA_RETRY)
+                cap_res = await _run_step(session_id, captcha_step, user_data, **step_kwargs)
                 if cap_res.get("success"):
-                    result = await _run_step(session_id, step, user_data, exam_slug=exam_slug, prompt_cache=prompt_cache)
+                    result = await _run_step(session_id, step, user_data, **step_kwargs)
                     if result.get("success"):
                         continue
                 # If still failing, fall through to generic error
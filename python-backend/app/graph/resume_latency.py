@@ -0,0 +1,75 @@
+"""
+Resume Latency Tracking
+Measures how long a paused workflow takes to act again after the user submits input.
+
+Stages (milliseconds since the input was submitted):
+- graph_resumed: the checkpointer restored the interrupted node (await_input)
+- next_action:   the input has been entered in the browser (first action after resume)
+"""
+import time
+from collections import deque
+from typing import Optional
+
+
+# Samples kept per stage (most recent first-in-first-out window)
+MAX_SAMPLES = 500
+
+# session_id -> perf_counter() at input submission
+_submitted_at: dict[str, float] = {}
+_samples: dict[str, deque] = {
+    "graph_resumed": deque(maxlen=MAX_SAMPLES),
+    "next_action": deque(maxlen=MAX_SAMPLES),
+}
+
+
+def mark_input_submitted(session_id: str) -> None:
+    """Record the moment user input (OTP/captcha/custom) was received."""
+    _submitted_at[session_id] = time.perf_counter()
+
+
+def _record(session_id: str, stage: str, finish: bool) -> Optional[float]:
+    started = _submitted_at.pop(session_id, None) if finish else _submitted_at.get(session_id)
+    if started is None:
+        return None
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _samples[stage].append(elapsed_ms)
+    return elapsed_ms
+
+
+def mark_graph_resumed(session_id: str) -> Optional[float]:
+    """Record submission -> interrupted node restored. Returns elapsed ms (None if not tracked)."""
+    return _record(session_id, "graph_resumed", finish=False)
+
+
+def mark_next_action(session_id: str) -> Optional[float]:
+    """Record submission -> first browser action after resume. Returns elapsed ms (None if not tracked)."""
+    return _record(session_id, "next_action", finish=True)
+
+
+def discard(session_id: str) -> None:
+    """Forget a pending measurement (e.g. session stopped while waiting)."""
+    _submitted_at.pop(session_id, None)
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def get_resume_latency_stats() -> dict:
+    """Count, mean, p50, p95 and max per stage, in milliseconds."""
+    stats = {}
+    for stage, samples in _samples.items():
+        values = sorted(samples)
+        if not values:
+            stats[stage] = {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+            continue
+        stats[stage] = {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values), 1),
+            "p50_ms": round(_percentile(values, 50), 1),
+            "p95_ms": round(_percentile(values, 95), 1),
+            "max_ms": round(values[-1], 1),
+        }
+    stats["pending"] = len(_submitted_at)
+    return stats
@@ -3,9 +3,10 @@ GraphState Definition
 Defines the state that flows through the LangGraph workflow.
 Uses TypedDict for LangGraph compatibility with Pydantic schemas.
 """
-from typing import TypedDict, Literal, Optional, Any, Annotated
+import sys
+import time
+from typing import TypedDict, Literal, Optional, Any, Annotated, NamedTuple
 from pydantic import BaseModel, Field
-from operator import add
 
 
 # ============= Pydantic Schemas for Structured LLM Output =============
@@ -95,6 +96,60 @@ class ActionHistoryEntry(BaseModel):
     error: Optional[str] = None
 
 
+class ActionRecord(NamedTuple):
+    """
+    Compact action log entry kept in workflow state.
+    A tuple (no per-instance dict) with an interned action name and an epoch timestamp,
+    so it serialises into checkpoints far smaller than the old dict-with-ISO-string entries.
+    """
+    action: str
+    target: Optional[str] = None
+    ts: float = 0.0
+    success: bool = True
+    key: Optional[str] = None  # user_data key for fill_field actions (feeds the field-order model)
+
+
+# Number of recent actions kept in state (full history is spilled to app.services.action_log)
+ACTION_HISTORY_MAX = 20
+
+
+def make_action(
+    action: str,
+    target: Optional[str] = None,
+    success: bool = True,
+    key: Optional[str] = None
+) -> ActionRecord:
+    """Build an ActionRecord stamped with the current time."""
+    return ActionRecord(
+        action=sys.intern(action),
+        target=target[:200] if isinstance(target, str) else target,
+        ts=time.time(),
+        success=bool(success),
+        key=key,
+    )
+
+
+def as_action_record(entry: Any) -> ActionRecord:
+    """Normalise a history entry restored from a checkpoint (record, plain tuple/list, or legacy dict)."""
+    if isinstance(entry, ActionRecord):
+        return entry
+    if isinstance(entry, dict):
+        return ActionRecord(
+            action=entry.get("action", ""),
+            target=entry.get("target"),
+            ts=entry.get("ts", 0.0),
+            success=entry.get("success", True),
+            key=entry.get("key"),
+        )
+    return ActionRecord(*entry)
+
+
+def bounded_append(left: Optional[list], right: Optional[list]) -> list:
+    """Reducer for action_history: append new records and keep only the newest ACTION_HISTORY_MAX."""
+    merged = [as_action_record(e) for e in (left or [])] + [as_action_record(e) for e in (right or [])]
+    return merged[-ACTION_HISTORY_MAX:]
+
+
 # ============= LangGraph State =============
 
 class GraphState(TypedDict):
@@ -117,7 +172,7 @@ class GraphState(TypedDict):
     
     # Browser state
     page_url: str
-    screenshot_base64: Optional[str]
+    screenshot_hash: Optional[str]  # Content hash in the blob store (never the image itself)
     page_html: Optional[str]
     
     # LLM Analysis result (legacy)
@@ -139,8 +194,8 @@ class GraphState(TypedDict):
     email_already_registered_detected: bool  # Flag to track if email already registered error was detected
     account_creation_complete: bool  # Flag to track if account creation/login is complete (prevents going back to registration)
     
-    # Action tracking (using Annotated with add for append-only)
-    action_history: Annotated[list[dict], add]
+    # Action tracking: bounded ring of recent ActionRecords (nodes return only new records)
+    action_history: Annotated[list[ActionRecord], bounded_append]
     
     # Progress
     current_step: str
@@ -163,8 +218,13 @@ class GraphState(TypedDict):
     
     # Page state tracking for loop detection
     previous_page_url: Optional[str]  # Previous page URL to detect navigation
-    previous_page_text_hash: Optional[str]  # Hash of previous page text to detect content changes
+    page_fingerprint: Optional[dict]  # Page fingerprint after the last action (see app.graph.page_fingerprint)
     repeated_action_count: int  # Count of repeated actions without page change
+    
+    # LLM call avoidance
+    last_screenshot_hash: Optional[str]  # Screenshot the last decision was made on
+    last_action_type: Optional[str]  # Action type executed last
+    fast_path_queue: list[str]  # user_data keys to fill next without the LLM (learned field order)
 
 
 def create_initial_state(
@@ -187,7 +247,7 @@ def create_initial_state(
         field_mappings=field_mappings,
         user_data=user_data,
         page_url="",
-        screenshot_base64=None,
+        screenshot_hash=None,
         page_html=None,
         analysis=None,
         llm_decision=None,
@@ -215,6 +275,9 @@ def create_initial_state(
         login_completed=False,
         form_filling_progress={},
         previous_page_url=None,
-        previous_page_text_hash=None,
+        page_fingerprint=None,
         repeated_action_count=0,
+        last_screenshot_hash=None,
+        last_action_type=None,
+        fast_path_queue=[],
     )
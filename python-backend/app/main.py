@@ -15,7 +15,7 @@ from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.services.database import Database
-from app.api import exams, users, websocket, analytics, batch
+from app.api import exams, users, websocket, analytics, batch, screenshots, sessions
 
 
 @asynccontextmanager
@@ -29,9 +29,38 @@ async def lifespan(app: FastAPI):
     print(f"DB Config: {settings.db_user}@{settings.db_host}:{settings.db_port}/{settings.db_name}")
     await Database.connect()
     
+    # Checkpointer first - the compiled graph binds to it
+    from app.graph.checkpointer import init_checkpointer, close_checkpointer
+    await init_checkpointer()
+    
+    # Compile the LangGraph workflow once, shared by every session
+    from app.graph.builder import warm_workflow_graph
+    await warm_workflow_graph()
+    
+    # Event bus - forwards live session events between workers
+    from app.services.event_bus import init_event_bus, close_event_bus
+    await init_event_bus(websocket.on_bus_event)
+    
+    # Batch scheduler - claims queued batch items from PostgreSQL
+    from app.services.batch_scheduler import start_batch_scheduler, stop_batch_scheduler
+    await start_batch_scheduler()
+    
     yield
     
     # Shutdown
+    await stop_batch_scheduler()
+    from app.services.portal_limiter import close_portal_limiter
+    await close_portal_limiter()
+    await close_event_bus()
+    from app.services.session_writer import close_session_writer
+    from app.services.session_events import close_session_event_writer
+    from app.services.session_counters import close_session_counter_writer
+    from app.services.step_metrics import close_step_metric_writer
+    await close_session_writer()
+    await close_session_event_writer()
+    await close_session_counter_writer()
+    await close_step_metric_writer()
+    await close_checkpointer()
     await Database.disconnect()
     print("👋 Shutdown complete")
 
@@ -58,6 +87,8 @@ app.include_router(exams.router, prefix="/api/exams", tags=["Exams"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
 app.include_router(batch.router, prefix="/api/batch", tags=["Batch"])
+app.include_router(screenshots.router, prefix="/api/screenshots", tags=["Screenshots"])
+app.include_router(sessions.router, prefix="/api/sessions", tags=["Sessions"])
 # Note: sync.router removed - no longer needed with shared PostgreSQL database
 app.include_router(websocket.router, prefix="/ws", tags=["WebSocket"])
 
@@ -0,0 +1,66 @@
+"""
+Action Log Spill Store
+Append-only, per-session record of every workflow action.
+
+Workflow state keeps only the last few actions (see ActionRecord / bounded_append in
+app.graph.state) so checkpoints stay small; the complete history lives here as one
+JSON line per action under settings.action_log_dir/<session_id>.jsonl, deleted with
+delete_actions() once the session reaches a terminal status.
+"""
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Iterable
+
+from app.config import settings
+
+
+def _log_path(session_id: str) -> Path:
+    return Path(settings.action_log_dir) / f"{session_id}.jsonl"
+
+
+def _append_lines(path: Path, lines: list[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def _read_lines(path: Path) -> list[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+async def append_actions(session_id: str, records: Iterable[Any]) -> None:
+    """Append action records (ActionRecord tuples) to the session's log. Never raises."""
+    lines = [json.dumps(record._asdict(), default=str) + "\n" for record in records]
+    if not lines or not session_id:
+        return
+    try:
+        await asyncio.to_thread(_append_lines, _log_path(session_id), lines)
+    except OSError as e:
+        print(f"⚠️ Failed to spill action log for {session_id}: {e}")
+
+
+async def read_actions(session_id: str) -> list[dict]:
+    """Full action history of a session, oldest first."""
+    return await asyncio.to_thread(_read_lines, _log_path(session_id))
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+async def delete_actions(session_id: str) -> None:
+    """Delete a finished session's action log. Never raises."""
+    if not session_id:
+        return
+    try:
+        await asyncio.to_thread(_unlink, _log_path(session_id))
+    except OSError as e:
+        print(f"⚠️ Failed to delete action log for {session_id}: {e}")
@@ -0,0 +1,135 @@
+"""
+Analytics Rollups
+Per (exam, day, terminal status) session counts and duration sums, maintained as
+sessions finish, so analytics read O(exams x days) rows instead of scanning
+automation_sessions.
+
+- roll_up_sessions(): adds sessions that reached a terminal status. The
+  rolled_up_at column is claimed in the same statement, so a session is counted
+  once however many times this is called.
+- unroll_sessions(): takes sessions back out before they are resumed or retried,
+  so the rollup always reflects each session's latest outcome.
+A session's day is the date of its completed_at (or of rolled_up_at if it has none).
+"""
+from typing import Iterable, Optional
+
+from app.services.database import Database
+
+
+_ROLL_UP_SQL = """
+    WITH done AS (
+        UPDATE automation_sessions
+        SET rolled_up_at = CURRENT_TIMESTAMP
+        WHERE id = ANY($1::uuid[]) AND rolled_up_at IS NULL
+          AND status IN ('completed', 'failed', 'stopped')
+        RETURNING exam_id, status,
+            COALESCE(completed_at, rolled_up_at) AS finished_at,
+            EXTRACT(EPOCH FROM (completed_at - started_at))::float8 AS duration
+    )
+    INSERT INTO automation_session_rollups AS r
+        (exam_id, day, status, sessions, duration_count, duration_sum, duration_sum_sq, last_completed_at)
+    SELECT exam_id, finished_at::date, status, count(*), count(duration),
+           COALESCE(sum(duration), 0), COALESCE(sum(duration * duration), 0), max(finished_at)
+    FROM done
+    GROUP BY exam_id, finished_at::date, status
+    ON CONFLICT (exam_id, day, status) DO UPDATE SET
+        sessions = r.sessions + EXCLUDED.sessions,
+        duration_count = r.duration_count + EXCLUDED.duration_count,
+        duration_sum = r.duration_sum + EXCLUDED.duration_sum,
+        duration_sum_sq = r.duration_sum_sq + EXCLUDED.duration_sum_sq,
+        last_completed_at = GREATEST(r.last_completed_at, EXCLUDED.last_completed_at)
+"""
+
+_UNROLL_SQL = """
+    WITH undone AS (
+        SELECT id, exam_id, status,
+            COALESCE(completed_at, rolled_up_at) AS finished_at,
+            EXTRACT(EPOCH FROM (completed_at - started_at))::float8 AS duration
+        FROM automation_sessions
+        WHERE id = ANY($1::uuid[]) AND rolled_up_at IS NOT NULL
+        FOR UPDATE
+    ), cleared AS (
+        UPDATE automation_sessions s SET rolled_up_at = NULL
+        FROM undone u WHERE s.id = u.id
+    )
+    UPDATE automation_session_rollups r
+    SET sessions = r.sessions - d.sessions,
+        duration_count = r.duration_count - d.duration_count,
+        duration_sum = r.duration_sum - d.duration_sum,
+        duration_sum_sq = r.duration_sum_sq - d.duration_sum_sq
+    FROM (
+        SELECT exam_id, finished_at::date AS day, status, count(*) AS sessions,
+               count(duration) AS duration_count,
+               COALESCE(sum(duration), 0) AS duration_sum,
+               COALESCE(sum(duration * duration), 0) AS duration_sum_sq
+        FROM undone
+        GROUP BY exam_id, finished_at::date, status
+    ) d
+    WHERE r.exam_id = d.exam_id AND r.day = d.day AND r.status = d.status
+"""
+
+
+async def roll_up_sessions(session_ids: Iterable, conn=None) -> None:
+    """Add terminal, not yet counted sessions to the rollups (others are ignored)."""
+    ids = [sid for sid in session_ids if sid]
+    if not ids:
+        return
+    if conn is not None:
+        await conn.execute(_ROLL_UP_SQL, ids)
+        return
+    async with Database.connection() as conn:
+        await conn.execute(_ROLL_UP_SQL, ids)
+
+
+async def unroll_sessions(session_ids: Iterable, conn=None) -> None:
+    """Take counted sessions back out of the rollups (call before they run again)."""
+    ids = [sid for sid in session_ids if sid]
+    if not ids:
+        return
+    if conn is not None:
+        await conn.execute(_UNROLL_SQL, ids)
+        return
+    async with Database.connection() as conn:
+        await conn.execute(_UNROLL_SQL, ids)
+
+
+async def roll_up_pending(limit: int = 1000) -> int:
+    """Roll up one chunk of terminal sessions that were never counted; returns how many."""
+    async with Database.connection() as conn:
+        rows = await conn.fetch("""
+            SELECT id FROM automation_sessions
+            WHERE rolled_up_at IS NULL AND status IN ('completed', 'failed', 'stopped')
+            ORDER BY created_at
+            LIMIT $1
+        """, limit)
+        await roll_up_sessions([r["id"] for r in rows], conn)
+    return len(rows)
+
+
+def duration_stats(count: int, total: float, total_sq: float) -> tuple[float, float]:
+    """Mean and (population) standard deviation from count, sum and sum of squares."""
+    if not count:
+        return 0.0, 0.0
+    mean = total / count
+    variance = max(0.0, total_sq / count - mean * mean)
+    return mean, variance ** 0.5
+
+
+async def get_rollup_totals(exam_id: Optional[int] = None) -> list[dict]:
+    """Rollup totals per terminal status (all exams, or one)."""
+    query = """
+        SELECT status, sum(sessions)::int AS sessions,
+               sum(duration_count)::int AS duration_count,
+               sum(duration_sum) AS duration_sum,
+               sum(duration_sum_sq) AS duration_sum_sq,
+               max(last_completed_at) AS last_completed_at
+        FROM automation_session_rollups
+    """
+    args = []
+    if exam_id is not None:
+        query += " WHERE exam_id = $1"
+        args.append(exam_id)
+    query += " GROUP BY status"
+    async with Database.connection() as conn:
+        rows = await conn.fetch(query, *args)
+    return [dict(row) for row in rows]
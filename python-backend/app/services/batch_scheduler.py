@@ -0,0 +1,628 @@
+"""
+Batch Scheduler
+Runs batch items (one user of a batch job each) from PostgreSQL with a worker pool.
+
+- Items are claimed with FOR UPDATE SKIP LOCKED, so any number of workers share one queue
+- Each worker runs at most settings.batch_max_concurrency workflows; per exam at most
+  settings.batch_max_per_exam run cluster-wide (claims for an exam are serialised with an
+  advisory lock so the running count can't be overshot)
+- Items are only claimed while their exam's portal has room (app.services.portal_limiter);
+  the workflow itself then waits for its portal slot like any other
+- A claimed item is leased to its worker; the lease is renewed by heartbeat and, if the
+  worker dies, expires so the item is queued again - batches resume after a restart. A
+  worker that can't renew (database unreachable) stops its own items before the lease
+  runs out, so a reclaimed item never runs on two workers at once
+- Failed items are retried with exponential backoff up to the job's max_attempts
+- Items are claimed earliest deadline first (the batch's deadline, else the exam's
+  registration_deadline), then by priority; exams with batch_paused set are skipped
+- Completion of each batch is projected from the exam's recent item durations at current
+  capacity, with a warning when it will miss its deadline
+- Flat user profiles of the next settings.batch_prefetch_size queued items are loaded in
+  bulk (get_users_flat_bulk) ahead of their start, so a starting item doesn't wait on them
+"""
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from app.config import settings
+from app.services.database import Database, fetch_all, fetch_one
+from app.services.analytics_rollups import roll_up_sessions, unroll_sessions
+from app.services.portal_limiter import exam_portal_host, get_portal_limiter, portal_limits
+
+
+# pg_advisory_xact_lock(namespace, exam_id) guards per-exam claims
+ADVISORY_NAMESPACE = 0x6261  # "ba"
+
+# Session statuses that end a batch item
+_SESSION_DONE = {"completed": "completed", "failed": "failed", "stopped": "cancelled"}
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before the next attempt: base * 2^(attempts-1), capped, with 20% jitter."""
+    delay = min(settings.batch_retry_max_seconds, settings.batch_retry_base_seconds * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.0)
+
+
+class ProfileCache:
+    """Flat user profiles loaded ahead of use, dropped after `ttl` seconds."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # user_id -> (loaded at, flat data)
+        self.entries: dict[int, tuple[float, dict]] = {}
+
+    def missing(self, user_ids) -> list[int]:
+        now = time.monotonic()
+        return [
+            user_id for user_id in dict.fromkeys(user_ids)
+            if user_id not in self.entries or now - self.entries[user_id][0] > self.ttl
+        ]
+
+    def put(self, profiles: dict[int, dict]) -> None:
+        now = time.monotonic()
+        for user_id, data in profiles.items():
+            self.entries[user_id] = (now, data)
+
+    def pop(self, user_id: int) -> Optional[dict]:
+        entry = self.entries.pop(user_id, None)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def expire(self) -> None:
+        now = time.monotonic()
+        for user_id in [u for u, (loaded, _) in self.entries.items() if now - loaded > self.ttl]:
+            del self.entries[user_id]
+
+
+_UPCOMING_USERS_SQL = """
+    SELECT i.user_id
+    FROM automation_batch_items i
+    JOIN automation_batch_jobs j ON j.id = i.batch_id
+    JOIN automation_exams e ON e.id = i.exam_id
+    WHERE i.status = 'queued' AND j.status IN ('pending', 'running') AND NOT e.batch_paused
+    ORDER BY i.deadline, i.priority DESC, i.next_attempt_at, i.id
+    LIMIT $1
+"""
+
+
+_CLAIM_SQL = """
+    WITH claimable AS (
+        SELECT i.id
+        FROM automation_batch_items i
+        JOIN automation_batch_jobs j ON j.id = i.batch_id
+        WHERE i.exam_id = $1
+          AND i.status = 'queued'
+          AND i.next_attempt_at <= CURRENT_TIMESTAMP
+          AND j.status IN ('pending', 'running')
+          AND (j.delay_seconds = 0 OR (
+              -- Spaced batches start one item at a time
+              j.next_start_at <= CURRENT_TIMESTAMP
+              AND i.id = (
+                  SELECT q.id FROM automation_batch_items q
+                  WHERE q.batch_id = j.id AND q.status = 'queued' AND q.next_attempt_at <= CURRENT_TIMESTAMP
+                  ORDER BY q.priority DESC, q.next_attempt_at, q.id
+                  LIMIT 1
+              )
+          ))
+        -- Earliest deadline first (no deadline last), then highest priority, then FIFO
+        ORDER BY i.deadline, i.priority DESC, i.next_attempt_at, i.id
+        LIMIT $2
+        FOR UPDATE OF i SKIP LOCKED
+    )
+    UPDATE automation_batch_items i
+    SET status = 'running',
+        attempts = i.attempts + 1,
+        lease_owner = $3,
+        lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $4),
+        started_at = CURRENT_TIMESTAMP,
+        last_error = NULL
+    FROM claimable c, automation_batch_jobs j
+    WHERE i.id = c.id AND j.id = i.batch_id
+    RETURNING i.id, i.batch_id, i.exam_id, i.user_id, i.session_id, i.status, i.attempts, i.last_error, j.max_attempts
+"""
+
+
+class BatchScheduler:
+    """One per worker process: claims batch items and runs their workflows."""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # item id -> running item task
+        self.running: dict[int, asyncio.Task] = {}
+        # item id -> session id, once the item's session exists
+        self.sessions: dict[int, str] = {}
+        self._renewed_at = time.monotonic()
+        self.profiles = ProfileCache(settings.batch_prefetch_ttl_seconds)
+        self._wakeup = asyncio.Event()
+        self._loops: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._loops = [
+            asyncio.create_task(self._claim_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+        print(f"🗂️ Batch scheduler started ({self.worker_id}, {settings.batch_max_concurrency} slots)")
+
+    async def stop(self) -> None:
+        """Stop claiming, cancel running items and hand them back to the queue."""
+        for task in self._loops:
+            task.cancel()
+        for task in list(self.running.values()):
+            task.cancel()
+        if self.running:
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+        # Interrupted by shutdown, not failed: don't count the attempt
+        released = await fetch_all("""
+            UPDATE automation_batch_items
+            SET status = 'queued', attempts = GREATEST(attempts - 1, 0),
+                lease_owner = NULL, lease_expires_at = NULL, next_attempt_at = CURRENT_TIMESTAMP
+            WHERE lease_owner = $1 AND status = 'running'
+            RETURNING id, batch_id, exam_id, user_id, session_id, status, attempts, last_error
+        """, self.worker_id)
+        await _fail_sessions([r["session_id"] for r in released], "Batch worker shut down")
+        publish_items(released)
+
+    def wake(self) -> None:
+        """Claim now instead of at the next poll (e.g. a batch was just created)."""
+        self._wakeup.set()
+
+    # ============= Claiming =============
+
+    async def _claim_loop(self) -> None:
+        while True:
+            try:
+                await self._reclaim_expired()
+                await self._claim()
+                await self._prefetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Batch scheduler: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.batch_poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> None:
+        free = settings.batch_max_concurrency - len(self.running)
+        if free <= 0:
+            return
+
+        # Exams with the most urgent ready work get free slots first
+        exams = await fetch_all("""
+            SELECT e.*
+            FROM automation_exams e
+            JOIN LATERAL (
+                SELECT count(*) AS ready, min(i.deadline) AS deadline, max(i.priority) AS priority
+                FROM automation_batch_items i
+                JOIN automation_batch_jobs j ON j.id = i.batch_id
+                WHERE i.exam_id = e.id AND i.status = 'queued'
+                  AND i.next_attempt_at <= CURRENT_TIMESTAMP
+                  AND j.status IN ('pending', 'running')
+            ) q ON q.ready > 0
+            WHERE NOT e.batch_paused
+            ORDER BY q.deadline, q.priority DESC, e.id
+        """)
+
+        for exam in exams:
+            if free <= 0:
+                return
+            slots = min(free, get_portal_limiter().available_starts(exam_portal_host(exam)))
+            if slots <= 0:
+                continue
+
+            async with Database.transaction() as conn:
+                await conn.execute("SELECT pg_advisory_xact_lock($1, $2)", ADVISORY_NAMESPACE, exam["id"])
+                running = await conn.fetchval(
+                    "SELECT count(*) FROM automation_batch_items WHERE exam_id = $1 AND status = 'running'",
+                    exam["id"]
+                )
+                slots = min(slots, settings.batch_max_per_exam - running)
+                if slots <= 0:
+                    continue
+                items = [dict(r) for r in await conn.fetch(
+                    _CLAIM_SQL, exam["id"], slots, self.worker_id, float(settings.batch_lease_seconds)
+                )]
+                if items:
+                    await conn.execute("""
+                        UPDATE automation_batch_jobs
+                        SET status = 'running',
+                            next_start_at = CURRENT_TIMESTAMP + make_interval(secs => delay_seconds),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ANY($1::uuid[]) AND status IN ('pending', 'running')
+                    """, list({item["batch_id"] for item in items}))
+
+            if items:
+                publish_items(items)
+                await self._load_profiles([item["user_id"] for item in items])
+            for item in items:
+                free -= 1
+                task = asyncio.create_task(self._run_item(item, exam))
+                self.running[item["id"]] = task
+                task.add_done_callback(lambda _, item_id=item["id"]: self._forget(item_id))
+
+    # ============= Profile prefetch =============
+
+    async def _load_profiles(self, user_ids: list[int]) -> None:
+        """Bulk-load the profiles of user_ids not cached yet (errors only mean loading at start)."""
+        from app.api.users import get_users_flat_bulk
+
+        missing = self.profiles.missing(user_ids)
+        if not missing:
+            return
+        try:
+            self.profiles.put(await get_users_flat_bulk(missing))
+        except Exception as e:
+            print(f"⚠️ Batch profile prefetch failed ({len(missing)} users): {e}")
+
+    async def _prefetch(self) -> None:
+        """Load the profiles of the next queued items, ahead of their claim."""
+        self.profiles.expire()
+        if settings.batch_prefetch_size <= 0:
+            return
+        rows = await fetch_all(_UPCOMING_USERS_SQL, settings.batch_prefetch_size)
+        await self._load_profiles([r["user_id"] for r in rows])
+
+    async def _reclaim_expired(self) -> None:
+        """Queue again (or fail, when out of attempts) items whose worker stopped renewing its lease."""
+        expired = await fetch_all("""
+            UPDATE automation_batch_items i
+            SET status = CASE WHEN i.attempts >= j.max_attempts THEN 'failed' ELSE 'queued' END,
+                completed_at = CASE WHEN i.attempts >= j.max_attempts THEN CURRENT_TIMESTAMP END,
+                lease_owner = NULL,
+                lease_expires_at = NULL,
+                next_attempt_at = CURRENT_TIMESTAMP,
+                last_error = 'Batch worker lost'
+            FROM automation_batch_jobs j
+            WHERE j.id = i.batch_id AND i.status = 'running' AND i.lease_expires_at < CURRENT_TIMESTAMP
+            RETURNING i.id, i.batch_id, i.exam_id, i.user_id, i.session_id, i.status, i.attempts, i.last_error
+        """)
+        if not expired:
+            return
+        print(f"♻️ Reclaimed {len(expired)} batch item(s) from lost workers")
+        await _fail_sessions([r["session_id"] for r in expired], "Batch worker lost")
+        publish_items(expired)
+        for batch_id in {r["batch_id"] for r in expired}:
+            await refresh_batch(batch_id)
+
+    def _forget(self, item_id: int) -> None:
+        self.running.pop(item_id, None)
+        self.sessions.pop(item_id, None)
+
+    async def _heartbeat_loop(self) -> None:
+        interval = max(1.0, settings.batch_lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not self.running:
+                self._renewed_at = time.monotonic()
+                continue
+            try:
+                async with Database.connection() as conn:
+                    await conn.execute("""
+                        UPDATE automation_batch_items
+                        SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $2)
+                        WHERE lease_owner = $1 AND status = 'running'
+                    """, self.worker_id, float(settings.batch_lease_seconds))
+                self._renewed_at = time.monotonic()
+            except Exception as e:
+                print(f"⚠️ Batch lease heartbeat failed: {e}")
+                # The next heartbeat would come after the leases expire
+                if time.monotonic() - self._renewed_at + interval >= settings.batch_lease_seconds:
+                    self._abandon_running()
+
+    def _abandon_running(self) -> None:
+        """
+        Leases are about to expire unrenewed: stop this worker's items so the workers that
+        reclaim them don't drive the same sessions. Nothing is written - the expired leases
+        queue the items again (or fail them) through _reclaim_expired.
+        """
+        from app.api.websocket import abort_workflow
+
+        print(f"⚠️ Batch leases not renewed for {time.monotonic() - self._renewed_at:.0f}s - stopping {len(self.running)} item(s)")
+        for item_id, task in list(self.running.items()):
+            session_id = self.sessions.get(item_id)
+            if session_id:
+                abort_workflow(session_id)
+            task.cancel()
+
+    # ============= Running =============
+
+    async def _run_item(self, item: dict, exam: dict) -> None:
+        from app.api.users import get_user_flat
+        from app.api.websocket import create_session, start_workflow_task, add_session_log
+
+        status, error = "failed", None
+        try:
+            if item.get("session_id"):
+                # Created with the batch; retries run in the same session
+                session_id = str(item["session_id"])
+                async with Database.transaction() as conn:
+                    await unroll_sessions([item["session_id"]], conn)
+                    await conn.execute("""
+                        UPDATE automation_sessions
+                        SET status = 'running', started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+                            success = NULL, error = NULL, completed_at = NULL
+                        WHERE id = $1
+                    """, item["session_id"])
+            else:
+                session_id = await create_session(exam["id"], item["user_id"])
+                async with Database.connection() as conn:
+                    await conn.execute(
+                        "UPDATE automation_batch_items SET session_id = $2 WHERE id = $1",
+                        item["id"], uuid.UUID(session_id)
+                    )
+            self.sessions[item["id"]] = session_id
+            await add_session_log(
+                session_id,
+                f"Batch {item['batch_id']} - attempt {item['attempts']}/{item['max_attempts']}",
+                level="info"
+            )
+
+            user_data = self.profiles.pop(item["user_id"])
+            if user_data is None:
+                user_data = (await get_user_flat(item["user_id"])).data
+            task = start_workflow_task(session_id, exam, item["user_id"], user_data)
+            # asyncio.wait does not re-raise when the workflow task itself is cancelled
+            # (stop, batch cancel, input timeout); only our own cancellation propagates
+            await asyncio.wait([task])
+            if task.cancelled():
+                status, error = await self._stopped_outcome(session_id)
+            else:
+                status, error = await self._wait_for_session(session_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+
+        await self._finish_item(item, status, error)
+
+    async def _wait_for_session(self, session_id: str) -> tuple[str, Optional[str]]:
+        """Item outcome once the session ends (waits out human input, up to batch_input_timeout_seconds)."""
+        from app.api.websocket import get_session, request_stop
+
+        deadline = time.monotonic() + settings.batch_input_timeout_seconds
+        while True:
+            session = await get_session(session_id) or {}
+            status = session.get("status")
+            if status in _SESSION_DONE:
+                return _SESSION_DONE[status], session.get("error") or session.get("result_message")
+            if time.monotonic() > deadline:
+                await request_stop(session_id)
+                return "failed", "Timed out waiting for user input"
+            await asyncio.sleep(settings.batch_poll_interval_seconds)
+
+    async def _stopped_outcome(self, session_id: str) -> tuple[str, Optional[str]]:
+        """Item outcome after the workflow task was cancelled (the session's final status, else cancelled)."""
+        from app.api.websocket import get_session
+
+        session = await get_session(session_id) or {}
+        status = session.get("status")
+        if status in _SESSION_DONE:
+            return _SESSION_DONE[status], session.get("error") or session.get("result_message")
+        return "cancelled", "Stopped"
+
+    async def _finish_item(self, item: dict, status: str, error: Optional[str]) -> None:
+        retry = status == "failed" and item["attempts"] < item["max_attempts"]
+        next_status = "queued" if retry else status
+        row = await fetch_one("""
+            UPDATE automation_batch_items i
+            SET status = CASE WHEN $2 = 'queued' AND j.status = 'cancelled' THEN 'cancelled' ELSE $2 END,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => $3),
+                completed_at = CASE WHEN $2 = 'queued' THEN NULL ELSE CURRENT_TIMESTAMP END,
+                lease_owner = NULL,
+                lease_expires_at = NULL,
+                last_error = $4
+            FROM automation_batch_jobs j
+            WHERE i.id = $1 AND j.id = i.batch_id AND i.lease_owner = $5
+            RETURNING i.id, i.batch_id, i.exam_id, i.user_id, i.session_id, i.status, i.attempts, i.last_error
+        """, item["id"], next_status, retry_delay(item["attempts"]) if retry else 0.0, error, self.worker_id)
+
+        if row:
+            publish_items([row])
+        if row and row["status"] == "queued":
+            print(f"🔁 Batch item {item['id']} failed (attempt {item['attempts']}), retrying: {error}")
+        await refresh_batch(item["batch_id"])
+        self.wake()
+
+
+def publish_items(rows: list[dict]) -> None:
+    """Send item state transitions (rows of automation_batch_items) to each batch's subscribers."""
+    from app.api.websocket import publish_batch_items
+
+    by_batch: dict[tuple, list[dict]] = {}
+    for row in rows:
+        by_batch.setdefault((str(row["batch_id"]), row["exam_id"]), []).append({
+            "item_id": row["id"],
+            "user_id": row["user_id"],
+            "session_id": str(row["session_id"]) if row.get("session_id") else None,
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "error": row.get("last_error"),
+        })
+    for (batch_id, exam_id), items in by_batch.items():
+        publish_batch_items(batch_id, exam_id, items)
+
+
+async def _fail_sessions(session_ids: list, reason: str) -> None:
+    session_ids = [s for s in session_ids if s]
+    if not session_ids:
+        return
+    async with Database.connection() as conn:
+        await conn.execute("""
+            UPDATE automation_sessions
+            SET status = 'failed', success = false, error = $2, completed_at = CURRENT_TIMESTAMP
+            WHERE id = ANY($1::uuid[]) AND status NOT IN ('completed', 'failed', 'stopped')
+        """, session_ids, reason)
+        await roll_up_sessions(session_ids, conn)
+
+
+async def batch_counts(batch_id) -> Optional[dict]:
+    """Job row plus item counts by outcome."""
+    return await fetch_one("""
+        SELECT j.*,
+            count(i.id) FILTER (WHERE i.status = 'completed') AS successful,
+            count(i.id) FILTER (WHERE i.status = 'failed') AS failed,
+            count(i.id) FILTER (WHERE i.status = 'cancelled') AS cancelled,
+            count(i.id) FILTER (WHERE i.status IN ('queued', 'running')) AS remaining
+        FROM automation_batch_jobs j
+        LEFT JOIN automation_batch_items i ON i.batch_id = j.id
+        WHERE j.id = $1
+        GROUP BY j.id
+    """, batch_id if isinstance(batch_id, uuid.UUID) else uuid.UUID(str(batch_id)))
+
+
+async def exam_throughput(exam: dict) -> Optional[float]:
+    """
+    Items per hour the exam can finish at current capacity, from its recent item durations
+    (None until an item has finished). Capacity is batch_max_per_exam parallel runs, within
+    the limits of the exam's portal.
+    """
+    row = await fetch_one("""
+        SELECT count(*) AS samples, avg(extract(epoch FROM r.completed_at - r.started_at)) AS avg_seconds
+        FROM (
+            SELECT started_at, completed_at FROM automation_batch_items
+            WHERE exam_id = $1 AND status IN ('completed', 'failed')
+              AND started_at IS NOT NULL AND completed_at IS NOT NULL
+            ORDER BY completed_at DESC
+            LIMIT $2
+        ) r
+    """, exam["id"], settings.batch_throughput_sample_size)
+    if not row or not row["samples"]:
+        return None
+    limits = portal_limits(exam_portal_host(exam))
+    parallel = min(settings.batch_max_per_exam, limits["max_sessions"])
+    per_hour = parallel * 3600 / max(1.0, float(row["avg_seconds"] or 0))
+    return min(per_hour, limits["starts_per_minute"] * 60)
+
+
+async def project_batch(job: dict) -> dict:
+    """
+    Projected completion of a batch: its remaining items plus everything of the same exam
+    scheduled before them, at the exam's measured throughput.
+    """
+    row = await fetch_one("""
+        WITH mine AS (
+            SELECT COALESCE(max(deadline), 'infinity'::timestamp) AS deadline, min(priority) AS priority
+            FROM automation_batch_items
+            WHERE batch_id = $1 AND status IN ('queued', 'running')
+        )
+        SELECT
+            (NOW() AT TIME ZONE 'UTC') AS now,  -- deadlines are naive UTC
+            COALESCE(j.deadline, e.registration_deadline) AS deadline,
+            e.batch_paused AS paused,
+            e.id AS exam_id, e.slug, e.url,
+            (
+                SELECT count(*) FROM automation_batch_items i
+                WHERE i.exam_id = j.exam_id AND i.status IN ('queued', 'running')
+                  AND (i.batch_id = j.id OR (COALESCE(i.deadline, 'infinity'::timestamp), -i.priority) <= (m.deadline, -m.priority))
+            ) AS ahead
+        FROM automation_batch_jobs j
+        JOIN automation_exams e ON e.id = j.exam_id
+        CROSS JOIN mine m
+        WHERE j.id = $1
+    """, job["id"])
+    if not row:
+        return {}
+
+    deadline = row["deadline"]
+    projection = {
+        "deadline": deadline.isoformat() if deadline else None,
+        "paused": row["paused"],
+        "throughput_per_hour": None,
+        "projected_completion_at": None,
+        "at_risk": False,
+    }
+    if job["remaining"] == 0:
+        return projection
+    if row["paused"]:
+        projection["at_risk"] = deadline is not None
+        return projection
+
+    per_hour = await exam_throughput({"id": row["exam_id"], "slug": row["slug"], "url": row["url"]})
+    if per_hour:
+        projected = row["now"] + timedelta(hours=row["ahead"] / per_hour)
+        projection["throughput_per_hour"] = round(per_hour, 2)
+        projection["projected_completion_at"] = projected.isoformat()
+        projection["at_risk"] = deadline is not None and projected > deadline
+    elif deadline is not None:
+        projection["at_risk"] = row["now"] > deadline
+    return projection
+
+
+# Batches already warned about, so a warning is printed once per batch
+_warned_at_risk: set[str] = set()
+
+
+async def refresh_batch(batch_id) -> None:
+    """Complete the job once no items remain, and publish its progress."""
+    from app.api.websocket import publish_batch_progress
+
+    job = await batch_counts(batch_id)
+    if not job:
+        return
+    finished = job["remaining"] == 0
+    if finished and job["status"] in ("pending", "running"):
+        async with Database.connection() as conn:
+            await conn.execute("""
+                UPDATE automation_batch_jobs
+                SET status = 'completed', completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = $1 AND status IN ('pending', 'running')
+            """, job["id"])
+        job["status"] = "completed"
+
+    payload = {
+        "status": job["status"],
+        "current": job["total"] - job["remaining"],
+        "total": job["total"],
+        "successful": job["successful"],
+        "failed": job["failed"],
+    }
+    if not finished:
+        try:
+            projection = await project_batch(job)
+        except Exception as e:
+            print(f"⚠️ Batch projection failed for {job['id']}: {e}")
+            projection = {}
+        payload.update(projection)
+        if projection.get("at_risk") and str(job["id"]) not in _warned_at_risk:
+            _warned_at_risk.add(str(job["id"]))
+            print(
+                f"⏰ Batch {job['id']} will miss its deadline {projection['deadline']}"
+                f" (projected {projection['projected_completion_at'] or 'unknown'}, {job['remaining']} left)"
+            )
+    else:
+        _warned_at_risk.discard(str(job["id"]))
+    publish_batch_progress(str(job["id"]), job["exam_id"], payload, final=finished)
+
+
+# Global scheduler instance
+_scheduler: Optional[BatchScheduler] = None
+
+
+def get_batch_scheduler() -> Optional[BatchScheduler]:
+    return _scheduler
+
+
+async def start_batch_scheduler() -> None:
+    """Start claiming batch items on this worker (call once at startup)."""
+    global _scheduler
+
+    if _scheduler is None and settings.batch_max_concurrency > 0:
+        _scheduler = BatchScheduler()
+        await _scheduler.start()
+
+
+async def stop_batch_scheduler() -> None:
+    """Stop the scheduler and release its items (call at shutdown, before the pool closes)."""
+    global _scheduler
+
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
@@ -0,0 +1,386 @@
+"""
+Content-Addressed Blob Store
+Stores large binary payloads (screenshots) once, keyed by SHA-256 digest.
+Workflow state, checkpoints and session rows carry only the digest.
+
+Backends (settings.blob_store_backend):
+- "disk":     files under settings.blob_store_dir, LRU-evicted above settings.blob_store_max_bytes
+- "postgres": PostgreSQL large objects indexed by the automation_blobs table, LRU-evicted above
+              settings.blob_store_max_bytes (checked in the background as blobs are added)
+
+Both sit behind an in-memory LRU cache (settings.blob_cache_max_bytes) for hot blobs; every
+put still goes through to the backend so its LRU sees blobs that stay hot in memory.
+
+put(data, owner=session_id) also pins the blob for that session (one pin per session, the
+latest), and eviction skips pinned blobs until unpin(session_id) or, on Postgres, until the
+session reaches a terminal status - a paused workflow's screenshot outlives any LRU churn.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+
+
+def blob_digest(data: bytes) -> str:
+    """Content address of a blob (hex SHA-256)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(ABC):
+    """Interface for content-addressed blob backends."""
+
+    @abstractmethod
+    async def put(self, data: bytes, owner: Optional[str] = None) -> str:
+        """Store data (refresh its LRU position if already present), pin it for owner, return its digest."""
+
+    @abstractmethod
+    async def get(self, digest: str) -> Optional[bytes]:
+        """Return the blob for a digest, or None if unknown."""
+
+    @abstractmethod
+    async def delete(self, digest: str) -> None:
+        """Remove a blob."""
+
+    @abstractmethod
+    async def unpin(self, owner: str) -> None:
+        """Let eviction take the blob pinned by owner again."""
+
+
+class MemoryLRUCache:
+    """Byte-bounded LRU cache of digest -> bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, digest: str) -> Optional[bytes]:
+        data = self._items.get(digest)
+        if data is not None:
+            self._items.move_to_end(digest)
+        return data
+
+    def put(self, digest: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        if digest in self._items:
+            self._items.move_to_end(digest)
+            return
+        self._items[digest] = data
+        self.size += len(data)
+        while self.size > self.max_bytes and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, digest: str) -> None:
+        data = self._items.pop(digest, None)
+        if data is not None:
+            self.size -= len(data)
+
+
+# ============= Local Disk =============
+
+class LocalDiskBlobStore(BlobStore):
+    """
+    Blobs as files under root/ab/cd/<digest>.
+    Keeps an in-memory LRU index (by access time) and evicts the oldest files above max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._index: OrderedDict[str, int] = OrderedDict()
+        # owner -> digest kept from eviction
+        self._pins: dict[str, str] = {}
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _load_index(self) -> None:
+        """Scan existing blobs once, oldest access first."""
+        entries = []
+        if self.root.exists():
+            for path in self.root.glob("*/*/*"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, path.name, stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._index[digest] = size
+            self.size += size
+        self._loaded = True
+
+    def _write(self, digest: str, data: bytes) -> None:
+        path = self._path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _unlink(self, digest: str) -> None:
+        try:
+            self._path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    async def put(self, data: bytes, owner: Optional[str] = None) -> str:
+        digest = blob_digest(data)
+        async with self._lock:
+            if not self._loaded:
+                await asyncio.to_thread(self._load_index)
+            if owner:
+                self._pins[owner] = digest
+            if digest in self._index:
+                self._index.move_to_end(digest)
+                return digest
+            await asyncio.to_thread(self._write, digest, data)
+            self._index[digest] = len(data)
+            self.size += len(data)
+            await self._evict()
+        return digest
+
+    async def get(self, digest: str) -> Optional[bytes]:
+        data = await asyncio.to_thread(self._read, digest)
+        if data is not None and digest in self._index:
+            self._index.move_to_end(digest)
+        return data
+
+    async def delete(self, digest: str) -> None:
+        async with self._lock:
+            size = self._index.pop(digest, None)
+            if size is not None:
+                self.size -= size
+            await asyncio.to_thread(self._unlink, digest)
+
+    async def unpin(self, owner: str) -> None:
+        self._pins.pop(owner, None)
+
+    async def _evict(self) -> None:
+        """Drop least recently used unpinned blobs until under max_bytes (caller holds the lock)."""
+        pinned = set(self._pins.values())
+        # Never the blob just written (last in the index)
+        for digest in list(self._index)[:-1]:
+            if self.size <= self.max_bytes:
+                break
+            if digest in pinned:
+                continue
+            self.size -= self._index.pop(digest)
+            await asyncio.to_thread(self._unlink, digest)
+
+
+# ============= PostgreSQL Large Objects =============
+
+class PostgresBlobStore(BlobStore):
+    """
+    Blobs as PostgreSQL large objects, indexed by digest in automation_blobs.
+    evict_lru(max_bytes) runs in the background each time about 1% of max_bytes has been
+    added (and after the first put, since the table may already be over the cap).
+    Pins live in automation_blob_pins and only count while their session is unfinished.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._evict_every = max(1, max_bytes // 100)
+        self._added = self._evict_every
+        self._evicting: Optional[asyncio.Task] = None
+
+    async def put(self, data: bytes, owner: Optional[str] = None) -> str:
+        from app.services.database import Database
+
+        digest = blob_digest(data)
+        added = False
+        async with Database.transaction() as conn:
+            # Serialise writers of the same digest so no orphan large object is created
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", digest)
+            touched = await conn.execute(
+                "UPDATE automation_blobs SET last_accessed_at = CURRENT_TIMESTAMP WHERE hash = $1", digest
+            )
+            if touched.endswith(" 0"):
+                await conn.execute("""
+                    INSERT INTO automation_blobs (hash, oid, size_bytes)
+                    VALUES ($1, lo_from_bytea(0, $2), $3)
+                """, digest, data, len(data))
+                added = True
+            if owner:
+                await conn.execute("""
+                    INSERT INTO automation_blob_pins (session_id, hash)
+                    SELECT $1, $2 WHERE EXISTS (SELECT 1 FROM automation_sessions WHERE id = $1)
+                    ON CONFLICT (session_id) DO UPDATE SET hash = EXCLUDED.hash, pinned_at = CURRENT_TIMESTAMP
+                """, uuid.UUID(owner), digest)
+        if added:
+            self._added += len(data)
+            self._maybe_evict()
+        return digest
+
+    def _maybe_evict(self) -> None:
+        if self._added < self._evict_every or (self._evicting and not self._evicting.done()):
+            return
+        self._added = 0
+        self._evicting = asyncio.create_task(self._evict())
+
+    async def _evict(self) -> None:
+        try:
+            removed = await self.evict_lru(self.max_bytes)
+            if removed:
+                print(f"🧹 Evicted {removed} blob(s) above {self.max_bytes} bytes")
+        except Exception as e:
+            print(f"⚠️ Blob eviction failed: {e}")
+
+    async def get(self, digest: str) -> Optional[bytes]:
+        from app.services.database import fetch_one
+
+        row = await fetch_one("""
+            UPDATE automation_blobs SET last_accessed_at = CURRENT_TIMESTAMP
+            WHERE hash = $1
+            RETURNING lo_get(oid) AS data
+        """, digest)
+        return bytes(row["data"]) if row else None
+
+    async def delete(self, digest: str) -> None:
+        from app.services.database import Database
+
+        async with Database.transaction() as conn:
+            await conn.execute("""
+                WITH removed AS (
+                    DELETE FROM automation_blobs WHERE hash = $1 RETURNING oid
+                )
+                SELECT lo_unlink(oid) FROM removed
+            """, digest)
+
+    async def unpin(self, owner: str) -> None:
+        from app.services.database import Database
+
+        async with Database.connection() as conn:
+            await conn.execute("DELETE FROM automation_blob_pins WHERE session_id = $1", uuid.UUID(owner))
+
+    async def evict_lru(self, max_bytes: int) -> int:
+        """
+        Delete least recently accessed blobs until the total is under max_bytes, skipping blobs
+        pinned by unfinished sessions (they still count towards the total). Returns count removed.
+        """
+        from app.services.database import Database
+
+        async with Database.transaction() as conn:
+            rows = await conn.fetch("""
+                WITH pinned AS (
+                    SELECT DISTINCT p.hash
+                    FROM automation_blob_pins p
+                    JOIN automation_sessions s ON s.id = p.session_id
+                    WHERE s.status NOT IN ('completed', 'failed', 'stopped')
+                ),
+                ranked AS (
+                    SELECT hash, oid,
+                           SUM(size_bytes) OVER (ORDER BY last_accessed_at DESC, hash) AS running
+                    FROM automation_blobs
+                ),
+                removed AS (
+                    DELETE FROM automation_blobs b
+                    USING ranked r
+                    WHERE b.hash = r.hash AND r.running > $1
+                      AND b.hash NOT IN (SELECT hash FROM pinned)
+                    RETURNING b.oid
+                )
+                SELECT lo_unlink(oid) FROM removed
+            """, max_bytes)
+        return len(rows)
+
+
+# ============= Cached Front =============
+
+class CachedBlobStore(BlobStore):
+    """In-memory LRU in front of a persistent backend."""
+
+    def __init__(self, backend: BlobStore, cache_max_bytes: int):
+        self.backend = backend
+        self.cache = MemoryLRUCache(cache_max_bytes)
+
+    async def put(self, data: bytes, owner: Optional[str] = None) -> str:
+        # Always through to the backend: a blob kept hot here must stay fresh in its LRU too
+        digest = await self.backend.put(data, owner)
+        self.cache.put(digest, data)
+        return digest
+
+    async def get(self, digest: str) -> Optional[bytes]:
+        data = self.cache.get(digest)
+        if data is None:
+            data = await self.backend.get(digest)
+            if data is not None:
+                self.cache.put(digest, data)
+        return data
+
+    async def delete(self, digest: str) -> None:
+        self.cache.discard(digest)
+        await self.backend.delete(digest)
+
+    async def unpin(self, owner: str) -> None:
+        await self.backend.unpin(owner)
+
+
+# Global blob store instance
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Get or create the configured blob store."""
+    global _blob_store
+
+    if _blob_store is None:
+        if (settings.blob_store_backend or "disk").lower() == "postgres":
+            backend: BlobStore = PostgresBlobStore(settings.blob_store_max_bytes)
+        else:
+            backend = LocalDiskBlobStore(settings.blob_store_dir, settings.blob_store_max_bytes)
+        _blob_store = CachedBlobStore(backend, settings.blob_cache_max_bytes)
+
+    return _blob_store
+
+
+# ============= Screenshot Helpers =============
+
+async def put_screenshot(image_base64: Optional[str], session_id: Optional[str] = None) -> Optional[str]:
+    """
+    Store a base64 screenshot and return its digest (None for empty/invalid input).
+    With a session_id it becomes that session's pinned screenshot.
+    """
+    if not image_base64:
+        return None
+    try:
+        data = base64.b64decode(image_base64)
+    except (binascii.Error, ValueError):
+        return None
+    return await get_blob_store().put(data, session_id)
+
+
+async def get_screenshot_bytes(digest: Optional[str]) -> Optional[bytes]:
+    """Load raw screenshot bytes by digest."""
+    if not digest:
+        return None
+    return await get_blob_store().get(digest)
+
+
+async def get_screenshot_base64(digest: Optional[str]) -> Optional[str]:
+    """Load a screenshot by digest as base64 (for LLM calls and legacy clients)."""
+    data = await get_screenshot_bytes(digest)
+    if data is None:
+        return None
+    return base64.b64encode(data).decode("ascii")
@@ -0,0 +1,176 @@
+"""
+Event Bus
+Carries live session events between uvicorn workers, so a viewer connected to any
+worker sees a workflow running on any other.
+
+Each worker always delivers to its own viewers directly; the bus only forwards
+envelopes to the other workers:
+    {"kind": "session",    "session_id", "message"}   # seq-stamped viewer event
+    {"kind": "screenshot", "session_id", "shot"}      # {"hash", "step", "timestamp"} - by reference
+    {"kind": "topic",      "topics", "message"}       # batch progress etc.
+    {"kind": "control",    "session_id", "message"}   # viewer input for the worker owning the session
+
+Backends (settings.event_bus_backend):
+- "local":    single worker - nothing to forward
+- "postgres": NOTIFY on a shared channel, LISTEN on a dedicated connection.
+              Envelopes above the NOTIFY payload limit are stored in the blob store and
+              sent by digest, as are screenshots - use a shared blob store
+              (blob_store_backend=postgres) when workers run on different hosts.
+"""
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+
+from app.config import settings
+from app.services.blob_store import get_blob_store
+
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_BYTES = 7900
+
+BusHandler = Callable[[dict], Awaitable[None]]
+
+
+class EventBus:
+    """Interface for forwarding envelopes to the other workers."""
+
+    # True if other workers may be listening (viewer input must then be routed to the owner)
+    distributed = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._handler: Optional[BusHandler] = None
+
+    async def start(self, handler: BusHandler) -> None:
+        """Begin receiving envelopes published by other workers."""
+        self._handler = handler
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, envelope: dict) -> None:
+        """Forward an envelope to the other workers (never blocks)."""
+        pass
+
+
+class InProcessEventBus(EventBus):
+    """Single-worker deployments: every viewer is local, nothing to forward."""
+
+
+class PostgresEventBus(EventBus):
+    """LISTEN/NOTIFY on one channel; envelopes are sent and handled in publish order."""
+
+    distributed = True
+
+    def __init__(self, channel: str):
+        super().__init__()
+        self.channel = channel
+        self._conn: Optional[asyncpg.Connection] = None
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, handler: BusHandler) -> None:
+        await super().start(handler)
+        await self._ensure_connection()
+        self._tasks = [
+            asyncio.create_task(self._send_loop()),
+            asyncio.create_task(self._receive_loop()),
+        ]
+        print(f"📡 Event bus listening on '{self.channel}' (worker {self.worker_id})")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._conn and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+    def publish(self, envelope: dict) -> None:
+        self._outbox.put_nowait(envelope)
+
+    async def _ensure_connection(self) -> asyncpg.Connection:
+        # Dedicated connection: LISTEN is per connection, so it can't come from the pool
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await asyncpg.connect(
+                host=settings.db_host,
+                port=settings.db_port,
+                database=settings.db_name,
+                user=settings.db_user,
+                password=settings.db_password,
+            )
+            await self._conn.add_listener(self.channel, self._on_notify)
+        return self._conn
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._inbox.put_nowait(payload)
+
+    async def _send_loop(self) -> None:
+        while True:
+            envelope = await self._outbox.get()
+            try:
+                data = json.dumps({**envelope, "origin": self.worker_id}, default=str)
+                if len(data.encode("utf-8")) > NOTIFY_MAX_BYTES:
+                    digest = await get_blob_store().put(data.encode("utf-8"))
+                    data = json.dumps({"origin": self.worker_id, "ref": digest})
+                conn = await self._ensure_connection()
+                await conn.execute("SELECT pg_notify($1, $2)", self.channel, data)
+            except Exception as e:
+                print(f"⚠️ Event bus publish failed ({envelope.get('kind')}): {e}")
+
+    async def _receive_loop(self) -> None:
+        while True:
+            payload = await self._inbox.get()
+            try:
+                envelope = json.loads(payload)
+                if envelope.get("origin") == self.worker_id:
+                    continue
+                if "ref" in envelope:
+                    data = await get_blob_store().get(envelope["ref"])
+                    if data is None:
+                        continue
+                    envelope = json.loads(data)
+                if self._handler:
+                    await self._handler(envelope)
+            except Exception as e:
+                print(f"⚠️ Event bus delivery failed: {e}")
+
+
+# Global event bus instance
+_event_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """Get or create the configured event bus."""
+    global _event_bus
+
+    if _event_bus is None:
+        if (settings.event_bus_backend or "local").lower() == "postgres":
+            _event_bus = PostgresEventBus(settings.event_bus_channel)
+        else:
+            _event_bus = InProcessEventBus()
+
+    return _event_bus
+
+
+async def init_event_bus(handler: BusHandler) -> EventBus:
+    """Start the event bus (call once at startup)."""
+    bus = get_event_bus()
+    if bus.distributed and (settings.blob_store_backend or "disk").lower() != "postgres":
+        print("⚠️ Event bus is distributed but the blob store is on local disk - "
+              "screenshots are only visible across workers sharing blob_store_dir")
+    await bus.start(handler)
+    return bus
+
+
+async def close_event_bus() -> None:
+    """Stop the event bus (call at shutdown)."""
+    global _event_bus
+
+    if _event_bus is not None:
+        await _event_bus.stop()
+        _event_bus = None
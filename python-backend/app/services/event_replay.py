@@ -0,0 +1,58 @@
+"""
+Event Replay Buffer
+Bounded, sequence-numbered ring of recent events for one stream (a session or a topic).
+
+Reconnecting clients send the last sequence number they saw and get only the events
+they missed - straight from memory, no database queries. If the ring has already
+dropped some of those events, since() reports the gap so the caller can fall back to
+a snapshot (last screenshot, pending input request, status).
+"""
+import time
+import uuid
+from collections import deque
+from typing import Optional
+
+
+class EventReplayBuffer:
+    """Ring buffer of (seq, event) plus the sticky state needed to rebuild a viewer."""
+
+    def __init__(self, max_events: int, epoch: Optional[str] = None):
+        self.events: deque[tuple[int, dict]] = deque(maxlen=max(1, max_events))
+        self.seq = 0
+        # Sticky state, replayed even after its event left the ring
+        self.last_status: Optional[tuple[int, dict]] = None
+        self.last_screenshot: Optional[dict] = None  # {"hash", "step", "timestamp"}
+        self.pending_input: Optional[tuple[int, dict]] = None
+        self.touched_at = time.monotonic()
+        # Identifies this buffer, so a seq numbered by another worker (or by a buffer that
+        # expired since) isn't mistaken for one of ours. Mirrors of another worker's stream
+        # take the owner's epoch, since they carry its numbering.
+        self.epoch = epoch or uuid.uuid4().hex[:8]
+
+    def append(self, event: dict, seq: Optional[int] = None) -> int:
+        """
+        Store an event and return its sequence number.
+        Pass seq for events numbered elsewhere (another worker's stream).
+        """
+        self.seq = max(self.seq, seq) if seq is not None else self.seq + 1
+        self.events.append((self.seq, event))
+        self.touched_at = time.monotonic()
+        return self.seq
+
+    @property
+    def oldest_seq(self) -> int:
+        return self.events[0][0] if self.events else self.seq + 1
+
+    def sticky_before_ring(self) -> list[tuple[int, dict]]:
+        """Last status and pending input request, if they already left the ring (oldest first)."""
+        sticky = [item for item in (self.last_status, self.pending_input) if item and item[0] < self.oldest_seq]
+        return sorted(sticky, key=lambda item: item[0])
+
+    def since(self, seq: int) -> tuple[list[tuple[int, dict]], bool]:
+        """
+        Events with a sequence number greater than seq, oldest first,
+        and whether the ring still held all of them (False = some were dropped).
+        """
+        seq = max(0, seq)
+        complete = seq + 1 >= self.oldest_seq or not self.events
+        return [(s, e) for s, e in self.events if s > seq], complete
@@ -0,0 +1,383 @@
+"""
+Portal Limiter
+Per-portal admission control for every workflow - WebSocket starts, batch items and
+retries alike - so bursts never reach an exam portal from many sessions at once.
+
+A portal is the host of the playbook's start_url (else the exam url). Per portal, with
+limits from settings.portal_limits (else the portal_* defaults):
+- at most max_sessions workflows hold a session slot; the rest wait in FIFO order
+- session starts are spaced by a token bucket (starts_per_minute, start_burst)
+- browser actions (Stagehand init/reload/execute) are paced by a token bucket
+  (actions_per_second, action_burst), handed out in FIFO order across sessions
+
+Backends (settings.portal_limiter_backend):
+- "local":    slots are counted in this worker
+- "postgres": each slot is also a session-level advisory lock on a dedicated connection,
+              so max_sessions holds across all workers (a dead worker's locks are released
+              with its connection). Start and action rates are enforced per worker.
+
+Time spent queued is kept per portal (metrics(), GET /api/analytics/portal-metrics) and
+recorded as "portal" spans in session traces.
+"""
+import asyncio
+import time
+import zlib
+from collections import deque
+from typing import Optional
+from urllib.parse import urlsplit
+
+import asyncpg
+
+from app.config import settings
+from app.services.tracing import span
+
+
+# pg_try_advisory_lock(namespace, slot key) - one lock per portal slot
+ADVISORY_NAMESPACE = 0x706F  # "po"
+
+# Stagehand endpoints that stay inside the browser (never reach the portal): not paced
+UNPACED_ENDPOINTS = frozenset({"screenshot", "analyze", "close"})
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is)."""
+        self._refill()
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def portal_host(url: Optional[str]) -> str:
+    """Rate-limit key of an exam portal."""
+    return (urlsplit(url or "").hostname or "").lower()
+
+
+def exam_portal_host(exam: dict) -> str:
+    """Portal of an exam: its playbook's start_url if it has one, else its url."""
+    from app.graph.playbook_executor import load_playbook
+
+    playbook = load_playbook(exam.get("slug") or "")
+    return portal_host((playbook or {}).get("start_url") or exam.get("url"))
+
+
+def portal_limits(host: str) -> dict:
+    """
+    Limits of a portal: settings.portal_limits entry for the host or its closest parent
+    domain (e.g. "nta.nic.in" covers "cuet.nta.nic.in"), then "*", over the defaults.
+    """
+    limits = {
+        "max_sessions": settings.portal_max_sessions,
+        "starts_per_minute": settings.portal_starts_per_minute,
+        "start_burst": settings.portal_start_burst,
+        "actions_per_second": settings.portal_actions_per_second,
+        "action_burst": settings.portal_action_burst,
+    }
+    configured = settings.portal_limits or {}
+    limits.update(configured.get("*") or {})
+    labels = host.split(".")
+    for i in range(len(labels)):
+        match = configured.get(".".join(labels[i:]))
+        if match:
+            limits.update(match)
+            break
+    limits["max_sessions"] = max(1, int(limits["max_sessions"]))
+    return limits
+
+
+class Portal:
+    """Slots, waiters, rate limiters and queue-time counters of one portal host."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.limits = portal_limits(host)
+        # session_id -> advisory slot number (None when counted locally only)
+        self.active: dict[str, Optional[int]] = {}
+        self.waiters: deque[tuple[str, asyncio.Future]] = deque()
+        self.starts = TokenBucket(self.limits["starts_per_minute"] / 60, self.limits["start_burst"])
+        self.actions = TokenBucket(self.limits["actions_per_second"], self.limits["action_burst"])
+        self.action_lock = asyncio.Lock()  # FIFO hand-out of action tokens
+        self.changed = asyncio.Event()
+        self.pump: Optional[asyncio.Task] = None
+        self.stats = {
+            "admitted": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+            "actions": 0,
+            "action_wait_seconds_total": 0.0,
+        }
+
+    def metrics(self) -> dict:
+        admitted, actions = self.stats["admitted"], self.stats["actions"]
+        return {
+            "limits": self.limits,
+            "active": len(self.active),
+            "waiting": len(self.waiters),
+            "admitted": admitted,
+            "avg_queue_seconds": round(self.stats["queue_seconds_total"] / admitted, 3) if admitted else 0.0,
+            "max_queue_seconds": round(self.stats["queue_seconds_max"], 3),
+            "actions": actions,
+            "avg_action_wait_ms": round(self.stats["action_wait_seconds_total"] * 1000 / actions, 1) if actions else 0.0,
+        }
+
+
+class PortalLimiter:
+    """One per worker process: admits workflows to portals and paces their actions."""
+
+    # True if slots are also held cluster-wide (advisory locks)
+    cluster = False
+
+    def __init__(self):
+        self.portals: dict[str, Portal] = {}
+        # session_id -> host of the slot it holds
+        self.session_hosts: dict[str, str] = {}
+
+    def portal(self, host: str) -> Portal:
+        portal = self.portals.get(host)
+        if portal is None:
+            portal = self.portals[host] = Portal(host)
+        return portal
+
+    def available_starts(self, host: str) -> int:
+        """Workflows this worker could start on a portal right now (local view)."""
+        if not host:
+            return settings.batch_max_concurrency
+        portal = self.portal(host)
+        free = portal.limits["max_sessions"] - len(portal.active) - len(portal.waiters)
+        return max(0, min(free, portal.starts.available()))
+
+    async def admit(self, session_id: str, host: str) -> float:
+        """Wait for a session slot on the portal (FIFO); returns the seconds spent queued."""
+        if not host or session_id in self.session_hosts:
+            return 0.0
+        portal = self.portal(host)
+        future = asyncio.get_running_loop().create_future()
+        portal.waiters.append((session_id, future))
+        queued_at = time.monotonic()
+        self._wake(portal)
+        try:
+            async with span("portal", f"admit:{host}"):
+                await future
+        except asyncio.CancelledError:
+            if (session_id, future) in portal.waiters:
+                portal.waiters.remove((session_id, future))
+            elif future.done() and not future.cancelled():
+                # Admitted just as it was cancelled: hand the slot back
+                self.session_hosts[session_id] = host
+                self.release(session_id)
+            raise
+
+        waited = time.monotonic() - queued_at
+        self.session_hosts[session_id] = host
+        portal.stats["admitted"] += 1
+        portal.stats["queue_seconds_total"] += waited
+        portal.stats["queue_seconds_max"] = max(portal.stats["queue_seconds_max"], waited)
+        return waited
+
+    def release(self, session_id: str) -> None:
+        """Give back a session's slot (safe to call more than once)."""
+        host = self.session_hosts.pop(session_id, None)
+        if host is None:
+            return
+        portal = self.portal(host)
+        slot = portal.active.pop(session_id, None)
+        if slot is not None:
+            asyncio.create_task(self._unlock(host, slot))
+        self._wake(portal)
+
+    async def action(self, session_id: Optional[str], endpoint: str = None) -> None:
+        """Wait for the pace of the session's portal before a browser action (Stagehand endpoint)."""
+        if endpoint in UNPACED_ENDPOINTS:
+            return
+        host = self.session_hosts.get(session_id)
+        if host is None:
+            return
+        portal = self.portal(host)
+        started = time.monotonic()
+        async with portal.action_lock:
+            while not portal.actions.take():
+                async with span("portal", "action_wait"):
+                    await asyncio.sleep(portal.actions.wait_time())
+        portal.stats["actions"] += 1
+        portal.stats["action_wait_seconds_total"] += time.monotonic() - started
+
+    def metrics(self) -> dict:
+        return {
+            "backend": "postgres" if self.cluster else "local",
+            "portals": {host: portal.metrics() for host, portal in self.portals.items()},
+        }
+
+    async def close(self) -> None:
+        for portal in self.portals.values():
+            if portal.pump is not None:
+                portal.pump.cancel()
+
+    # ============= Admission =============
+
+    def _wake(self, portal: Portal) -> None:
+        portal.changed.set()
+        if portal.pump is None or portal.pump.done():
+            portal.pump = asyncio.create_task(self._pump(portal))
+
+    async def _pump(self, portal: Portal) -> None:
+        """Admit the portal's waiters in order, as slots and start tokens allow."""
+        while portal.waiters:
+            portal.changed.clear()
+            # Skip waiters that gave up
+            while portal.waiters and portal.waiters[0][1].done():
+                portal.waiters.popleft()
+            if not portal.waiters:
+                return
+
+            if len(portal.active) >= portal.limits["max_sessions"]:
+                await self._wait_change(portal, None)
+                continue
+            wait = portal.starts.wait_time()
+            if wait > 0:
+                await self._wait_change(portal, wait)
+                continue
+            try:
+                slot = await self._lock_slot(portal)
+            except Exception as e:
+                print(f"⚠️ Portal slot lock failed for {portal.host}: {e}")
+                slot = None
+            if slot is False:
+                # Every slot is held by other workers
+                await self._wait_change(portal, settings.portal_poll_interval_seconds)
+                continue
+
+            session_id, future = portal.waiters.popleft()
+            if future.done():
+                if slot is not None:
+                    await self._unlock(portal.host, slot)
+                continue
+            portal.starts.take()
+            portal.active[session_id] = slot
+            future.set_result(None)
+
+    @staticmethod
+    async def _wait_change(portal: Portal, timeout: Optional[float]) -> None:
+        try:
+            await asyncio.wait_for(portal.changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _lock_slot(self, portal: Portal):
+        """Cluster slot for a new session: its number, None (not clustered) or False (none free)."""
+        return None
+
+    async def _unlock(self, host: str, slot: int) -> None:
+        pass
+
+
+class PostgresPortalLimiter(PortalLimiter):
+    """Slots are advisory locks held on one dedicated connection per worker."""
+
+    cluster = True
+
+    def __init__(self):
+        super().__init__()
+        self._conn: Optional[asyncpg.Connection] = None
+        self._conn_lock = asyncio.Lock()
+
+    @staticmethod
+    def _slot_key(host: str, slot: int) -> int:
+        # Advisory lock keys are signed 32-bit
+        key = zlib.crc32(f"{host}#{slot}".encode())
+        return key - (1 << 32) if key >= (1 << 31) else key
+
+    async def _ensure_connection(self) -> asyncpg.Connection:
+        # Dedicated connection: session-level advisory locks live as long as it does
+        if self._conn is None or self._conn.is_closed():
+            if self._conn is not None:
+                print("⚠️ Portal limiter lost its connection - slots held by this worker were released")
+                for portal in self.portals.values():
+                    for session_id in portal.active:
+                        portal.active[session_id] = None
+            self._conn = await asyncpg.connect(
+                host=settings.db_host,
+                port=settings.db_port,
+                database=settings.db_name,
+                user=settings.db_user,
+                password=settings.db_password,
+            )
+        return self._conn
+
+    async def _lock_slot(self, portal: Portal):
+        held = set(portal.active.values())
+        async with self._conn_lock:
+            conn = await self._ensure_connection()
+            for slot in range(portal.limits["max_sessions"]):
+                if slot in held:
+                    continue
+                if await conn.fetchval(
+                    "SELECT pg_try_advisory_lock($1, $2)", ADVISORY_NAMESPACE, self._slot_key(portal.host, slot)
+                ):
+                    return slot
+        return False
+
+    async def _unlock(self, host: str, slot: int) -> None:
+        try:
+            async with self._conn_lock:
+                if self._conn is not None and not self._conn.is_closed():
+                    await self._conn.fetchval(
+                        "SELECT pg_advisory_unlock($1, $2)", ADVISORY_NAMESPACE, self._slot_key(host, slot)
+                    )
+        except Exception as e:
+            print(f"⚠️ Portal slot unlock failed for {host}: {e}")
+
+    async def close(self) -> None:
+        await super().close()
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+
+# Global limiter instance
+_limiter: Optional[PortalLimiter] = None
+
+
+def get_portal_limiter() -> PortalLimiter:
+    """Get or create the configured portal limiter."""
+    global _limiter
+
+    if _limiter is None:
+        if (settings.portal_limiter_backend or "local").lower() == "postgres":
+            _limiter = PostgresPortalLimiter()
+        else:
+            _limiter = PortalLimiter()
+
+    return _limiter
+
+
+async def close_portal_limiter() -> None:
+    """Release all slots (call at shutdown, after workflows have stopped)."""
+    global _limiter
+
+    if _limiter is not None:
+        await _limiter.close()
+        _limiter = None
@@ -0,0 +1,105 @@
+"""
+Screenshot Previews
+Server-side downscaled JPEG previews of stored screenshots for live viewers.
+
+Previews are encoded once per (screenshot digest, width, quality) and cached, so every
+viewer watching a session at the same preview size shares one encoding. Concurrent
+requests for the same preview wait on a single in-flight encode.
+Full-resolution images are only served on demand (GET /api/screenshots/{digest}).
+"""
+import asyncio
+import io
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.services.blob_store import get_screenshot_bytes
+
+
+# Bounds for viewer-requested preview settings
+MIN_PREVIEW_WIDTH = 160
+MAX_PREVIEW_WIDTH = 1920
+MIN_PREVIEW_QUALITY = 20
+MAX_PREVIEW_QUALITY = 95
+
+# (digest, width, quality) -> JPEG bytes, byte-bounded LRU
+_cache: OrderedDict[tuple[str, int, int], bytes] = OrderedDict()
+_cache_bytes = 0
+# (digest, width, quality) -> in-flight encode
+_inflight: dict[tuple[str, int, int], asyncio.Task] = {}
+
+
+def _as_int(value, default: int) -> int:
+    """A viewer-supplied number, or the default when it is missing or not a number."""
+    try:
+        return int(value or default)
+    except (TypeError, ValueError, OverflowError):
+        return default
+
+
+def normalize_preview(width: Optional[int] = None, quality: Optional[int] = None) -> tuple[int, int]:
+    """Clamp a viewer's requested preview size/quality (defaults from settings)."""
+    width = _as_int(width, settings.ws_preview_width)
+    quality = _as_int(quality, settings.ws_preview_quality)
+    return (
+        max(MIN_PREVIEW_WIDTH, min(MAX_PREVIEW_WIDTH, width)),
+        max(MIN_PREVIEW_QUALITY, min(MAX_PREVIEW_QUALITY, quality)),
+    )
+
+
+def _encode(image_bytes: bytes, width: int, quality: int) -> bytes:
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("RGB", (width, width * 4))  # JPEG: decode at a reduced scale when possible
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.width > width:
+        img = img.resize((width, max(1, int(img.height * width / img.width))), Image.Resampling.BILINEAR)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=False)
+    return out.getvalue()
+
+
+def _cache_put(key: tuple[str, int, int], data: bytes) -> None:
+    global _cache_bytes
+    if key in _cache:
+        return
+    _cache[key] = data
+    _cache_bytes += len(data)
+    while _cache_bytes > settings.ws_preview_cache_bytes and len(_cache) > 1:
+        _, evicted = _cache.popitem(last=False)
+        _cache_bytes -= len(evicted)
+
+
+async def _build_preview(key: tuple[str, int, int]) -> Optional[bytes]:
+    digest, width, quality = key
+    data = await get_screenshot_bytes(digest)
+    if not data:
+        return None
+    try:
+        preview = await asyncio.to_thread(_encode, data, width, quality)
+    except Exception as e:
+        print(f"⚠️ Preview encode failed for {digest[:12]}: {e}")
+        return None
+    _cache_put(key, preview)
+    return preview
+
+
+async def get_preview(digest: str, width: Optional[int] = None, quality: Optional[int] = None) -> Optional[bytes]:
+    """JPEG preview of a stored screenshot (None if the screenshot is unknown or undecodable)."""
+    width, quality = normalize_preview(width, quality)
+    key = (digest, width, quality)
+
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache.move_to_end(key)
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_build_preview(key))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one viewer going away must not cancel the encode others are waiting on
+    return await asyncio.shield(task)
@@ -0,0 +1,198 @@
+"""
+Session Counters
+Typed intervention counters per session and per exam (automation_session_counters,
+automation_exam_counters), so analytics read a few rows instead of parsing session logs.
+
+count() and input_requested() only add to an in-memory tally; a background flush upserts
+the tally into both tables every settings.session_counter_flush_ms. Human wait time (input
+requested -> submitted) is added to the request's counter as wait_count / wait_seconds_sum.
+"""
+import asyncio
+import time
+import uuid
+from typing import Optional
+
+from app.config import settings
+from app.services.database import Database
+
+
+# ============= Counters =============
+
+OTP_REQUESTED = "otp_requested"
+CAPTCHA_REQUESTED = "captcha_requested"
+CUSTOM_REQUESTED = "custom_requested"
+CAPTCHA_LLM_SOLVED = "captcha_llm_solved"
+CAPTCHA_LLM_FAILED = "captcha_llm_failed"
+# The portal rejected a filled captcha and it was solved again
+CAPTCHA_RETRY = "captcha_retry"
+
+_INPUT_COUNTERS = {"otp": OTP_REQUESTED, "captcha": CAPTCHA_REQUESTED}
+
+_UPSERT_SQL = """
+    WITH d AS (
+        SELECT u.session_id, s.exam_id, u.counter, u.n, u.waits, u.wait_sum
+        FROM unnest($1::uuid[], $2::text[], $3::int[], $4::int[], $5::float8[])
+            AS u(session_id, counter, n, waits, wait_sum)
+        JOIN automation_sessions s ON s.id = u.session_id
+    ), per_exam AS (
+        INSERT INTO automation_exam_counters AS c (exam_id, counter, count, wait_count, wait_seconds_sum)
+        SELECT exam_id, counter, sum(n), sum(waits), sum(wait_sum)
+        FROM d
+        WHERE exam_id IS NOT NULL
+        GROUP BY exam_id, counter
+        ON CONFLICT (exam_id, counter) DO UPDATE SET
+            count = c.count + EXCLUDED.count,
+            wait_count = c.wait_count + EXCLUDED.wait_count,
+            wait_seconds_sum = c.wait_seconds_sum + EXCLUDED.wait_seconds_sum,
+            updated_at = CURRENT_TIMESTAMP
+    )
+    INSERT INTO automation_session_counters AS c (session_id, counter, count, wait_count, wait_seconds_sum)
+    SELECT session_id, counter, n, waits, wait_sum FROM d
+    ON CONFLICT (session_id, counter) DO UPDATE SET
+        count = c.count + EXCLUDED.count,
+        wait_count = c.wait_count + EXCLUDED.wait_count,
+        wait_seconds_sum = c.wait_seconds_sum + EXCLUDED.wait_seconds_sum,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+
+class SessionCounterWriter:
+    """Tally of counter increments not written yet, flushed in the background."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # (session_id, counter) -> [count, wait_count, wait_seconds_sum]
+        self.pending: dict[tuple[uuid.UUID, str], list] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, session_id: str, counter: str, n: int = 0, wait_seconds: Optional[float] = None) -> None:
+        tally = self.pending.setdefault((uuid.UUID(session_id), counter), [0, 0, 0.0])
+        tally[0] += n
+        if wait_seconds is not None:
+            tally[1] += 1
+            tally[2] += wait_seconds
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything tallied so far."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            tallies, self.pending = self.pending, {}
+            keys = list(tallies)
+            try:
+                async with Database.connection() as conn:
+                    await conn.execute(
+                        _UPSERT_SQL,
+                        [k[0] for k in keys],
+                        [k[1] for k in keys],
+                        [tallies[k][0] for k in keys],
+                        [tallies[k][1] for k in keys],
+                        [tallies[k][2] for k in keys],
+                    )
+            except Exception as e:
+                print(f"⚠️ Session counter flush failed ({len(keys)} counters): {e}")
+                # Put the tally back, merged with whatever arrived meanwhile
+                for key, (n, waits, wait_sum) in tallies.items():
+                    tally = self.pending.setdefault(key, [0, 0, 0.0])
+                    tally[0] += n
+                    tally[1] += waits
+                    tally[2] += wait_sum
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
+# Global writer
+_writer: Optional[SessionCounterWriter] = None
+# session_id -> (counter, monotonic time) of the input request waiting for the user
+_requested_at: dict[str, tuple[str, float]] = {}
+
+
+def get_session_counter_writer() -> SessionCounterWriter:
+    """Get or create the shared counter writer."""
+    global _writer
+
+    if _writer is None:
+        _writer = SessionCounterWriter(settings.session_counter_flush_ms / 1000)
+
+    return _writer
+
+
+async def close_session_counter_writer() -> None:
+    """Flush tallied counters (call at shutdown, before the pool closes)."""
+    global _writer
+
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+
+
+def count(session_id: str, counter: str, n: int = 1) -> None:
+    """Add n to one of a session's counters."""
+    get_session_counter_writer().add(session_id, counter, n)
+
+
+def input_requested(session_id: str, input_type: str) -> None:
+    """Count a human input request (otp, captcha, anything else is custom) and start its wait."""
+    counter = _INPUT_COUNTERS.get(input_type, CUSTOM_REQUESTED)
+    _requested_at[session_id] = (counter, time.monotonic())
+    count(session_id, counter)
+
+
+def input_submitted(session_id: str) -> None:
+    """Record how long the user took to answer the pending request (if one was counted)."""
+    requested = _requested_at.pop(session_id, None)
+    if requested is None:
+        return
+    counter, started = requested
+    get_session_counter_writer().add(session_id, counter, wait_seconds=time.monotonic() - started)
+
+
+def discard(session_id: str) -> None:
+    """Forget an unanswered request (session stopped, finished or timed out)."""
+    _requested_at.pop(session_id, None)
+
+
+async def get_counter_totals(exam_id: Optional[int] = None) -> dict[str, dict]:
+    """Counter totals (all exams, or one): counter -> count, wait_count, wait_seconds_sum."""
+    if _writer is not None:
+        await _writer.flush()
+
+    query = """
+        SELECT counter, sum(count)::bigint AS count,
+               sum(wait_count)::bigint AS wait_count,
+               sum(wait_seconds_sum) AS wait_seconds_sum
+        FROM automation_exam_counters
+    """
+    args = []
+    if exam_id is not None:
+        query += " WHERE exam_id = $1"
+        args.append(exam_id)
+    query += " GROUP BY counter"
+    async with Database.connection() as conn:
+        rows = await conn.fetch(query, *args)
+    return {row["counter"]: dict(row) for row in rows}
+
+
+async def get_session_counters(session_id: str) -> dict[str, dict]:
+    """One session's counters: counter -> count, wait_count, wait_seconds_sum."""
+    if _writer is not None:
+        await _writer.flush()
+
+    async with Database.connection() as conn:
+        rows = await conn.fetch("""
+            SELECT counter, count, wait_count, wait_seconds_sum
+            FROM automation_session_counters
+            WHERE session_id = $1
+        """, uuid.UUID(session_id))
+    return {row["counter"]: dict(row) for row in rows}
@@ -0,0 +1,158 @@
+"""
+Session Event Log
+Append-only session log (automation_session_events), written in batches.
+
+add_session_log() only queues the entry; a background flush writes queued entries with
+COPY every settings.session_event_flush_ms, or as soon as settings.session_event_batch_max
+entries are waiting. Entries are stamped when queued, so created_at reflects when they
+happened, not when they were flushed.
+
+The legacy automation_sessions.logs column is no longer appended to. With
+settings.session_logs_mirror_limit > 0 it is refreshed after each flush with the latest
+N entries of every session touched - a bounded summary, not the full log.
+"""
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.services.database import Database
+
+
+_COLUMNS = ("session_id", "level", "message", "node", "created_at")
+# Entries kept while the database is unreachable, in batches
+_MAX_PENDING_BATCHES = 100
+
+
+class SessionEventWriter:
+    """Queue of pending log rows, flushed in the background."""
+
+    def __init__(self, interval: float, batch_max: int):
+        self.interval = interval
+        self.batch_max = max(1, batch_max)
+        self.pending: list[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def append(self, session_id: str, level: str, message: str, node: Optional[str] = None) -> None:
+        self.pending.append((uuid.UUID(session_id), level, message, node, datetime.utcnow()))
+        if len(self.pending) >= self.batch_max:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self.pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything queued so far."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            try:
+                async with Database.connection() as conn:
+                    try:
+                        await conn.copy_records_to_table(
+                            "automation_session_events", records=rows, columns=_COLUMNS
+                        )
+                    except Exception:
+                        # COPY is all-or-nothing; drop only rows whose session no longer exists
+                        await conn.executemany("""
+                            INSERT INTO automation_session_events (session_id, level, message, node, created_at)
+                            SELECT $1, $2, $3, $4, $5
+                            WHERE EXISTS (SELECT 1 FROM automation_sessions WHERE id = $1)
+                        """, rows)
+                    if settings.session_logs_mirror_limit > 0:
+                        await self._refresh_mirror(conn, {row[0] for row in rows})
+            except Exception as e:
+                print(f"⚠️ Session log flush failed ({len(rows)} entries): {e}")
+                self.pending[:0] = rows
+                # Database down for long: keep the newest entries only
+                overflow = len(self.pending) - self.batch_max * _MAX_PENDING_BATCHES
+                if overflow > 0:
+                    del self.pending[:overflow]
+
+    @staticmethod
+    async def _refresh_mirror(conn, session_ids: set[uuid.UUID]) -> None:
+        await conn.execute("""
+            UPDATE automation_sessions s
+            SET logs = COALESCE((
+                SELECT jsonb_agg(jsonb_build_object(
+                    'timestamp', e.created_at, 'level', e.level, 'message', e.message, 'node', e.node
+                ) ORDER BY e.seq)
+                FROM (
+                    SELECT * FROM automation_session_events
+                    WHERE session_id = s.id
+                    ORDER BY seq DESC
+                    LIMIT $2
+                ) e
+            ), '[]'::jsonb)
+            WHERE s.id = ANY($1::uuid[])
+        """, list(session_ids), settings.session_logs_mirror_limit)
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
+# Global writer
+_writer: Optional[SessionEventWriter] = None
+
+
+def get_session_event_writer() -> SessionEventWriter:
+    """Get or create the shared session log writer."""
+    global _writer
+
+    if _writer is None:
+        _writer = SessionEventWriter(
+            settings.session_event_flush_ms / 1000,
+            settings.session_event_batch_max,
+        )
+
+    return _writer
+
+
+async def close_session_event_writer() -> None:
+    """Flush queued log entries (call at shutdown, before the pool closes)."""
+    global _writer
+
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+
+
+async def get_session_events(
+    session_id: str,
+    after_seq: int = 0,
+    limit: int = 100,
+    level: Optional[str] = None
+) -> list[dict]:
+    """One page of a session's log, oldest first, starting after after_seq."""
+    if _writer is not None:
+        await _writer.flush()
+
+    query = """
+        SELECT seq, level, message, node, created_at
+        FROM automation_session_events
+        WHERE session_id = $1 AND seq > $2
+    """
+    args: list = [uuid.UUID(session_id), after_seq]
+    if level:
+        args.append(level)
+        query += f" AND level = ${len(args)}"
+    args.append(limit)
+    query += f" ORDER BY seq LIMIT ${len(args)}"
+
+    async with Database.connection() as conn:
+        rows = await conn.fetch(query, *args)
+    return [dict(row) for row in rows]
@@ -0,0 +1,112 @@
+"""
+Session Write-Behind Buffer
+Coalesces high-frequency automation_sessions updates (progress ticks) in memory.
+
+Successive updates of the same session merge (latest value per column wins) and are
+written every settings.session_write_interval_ms - all sessions in one round trip via
+executemany, grouped by the set of columns touched. Any other update (status changes,
+terminal states, input requests) is written immediately, together with whatever is
+still buffered for that session, so nothing is ever written out of order.
+Call close_session_writer() on shutdown to flush what's left.
+"""
+import asyncio
+import uuid
+from typing import Optional
+
+from app.config import settings
+from app.services.database import Database
+
+
+# Columns that may be buffered; anything else is written straight away
+BUFFERED_COLUMNS = frozenset({"progress", "current_step"})
+
+
+class SessionWriteBuffer:
+    """Pending column values per session, flushed in the background."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.pending: dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, session_id: str, fields: dict) -> None:
+        """Buffer column values for a session (merged with anything already pending)."""
+        self.pending.setdefault(session_id, {}).update(fields)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def take(self, session_id: str) -> dict:
+        """Remove and return a session's pending values (to be written by the caller)."""
+        return self.pending.pop(session_id, {})
+
+    def peek(self, session_id: str) -> dict:
+        return self.pending.get(session_id, {})
+
+    async def settle(self) -> None:
+        """Wait for an in-flight flush, so a following write can't be overtaken by it."""
+        if self._flush_lock.locked():
+            async with self._flush_lock:
+                pass
+
+    async def _run(self) -> None:
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending values: one executemany per distinct column set."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+
+            groups: dict[tuple[str, ...], list[tuple]] = {}
+            for session_id, fields in batch.items():
+                columns = tuple(sorted(fields))
+                groups.setdefault(columns, []).append(
+                    (*(fields[c] for c in columns), uuid.UUID(session_id))
+                )
+
+            try:
+                async with Database.connection() as conn:
+                    for columns, rows in groups.items():
+                        assignments = ", ".join(f"{c} = ${i}" for i, c in enumerate(columns, 1))
+                        await conn.executemany(f"""
+                            UPDATE automation_sessions
+                            SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                            WHERE id = ${len(columns) + 1}
+                        """, rows)
+            except Exception as e:
+                print(f"⚠️ Session write-behind flush failed ({len(batch)} sessions): {e}")
+                # Keep the values for the next flush, unless newer ones arrived meanwhile
+                for session_id, fields in batch.items():
+                    self.pending[session_id] = {**fields, **self.pending.get(session_id, {})}
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
+# Global write-behind buffer
+_session_writer: Optional[SessionWriteBuffer] = None
+
+
+def get_session_writer() -> Optional[SessionWriteBuffer]:
+    """The shared buffer, or None if write-behind is disabled (interval 0)."""
+    global _session_writer
+
+    if _session_writer is None and settings.session_write_interval_ms > 0:
+        _session_writer = SessionWriteBuffer(settings.session_write_interval_ms / 1000)
+
+    return _session_writer
+
+
+async def close_session_writer() -> None:
+    """Flush buffered session updates (call at shutdown, before the pool closes)."""
+    global _session_writer
+
+    if _session_writer is not None:
+        await _session_writer.close()
+        _session_writer = None
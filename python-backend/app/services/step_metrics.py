@@ -0,0 +1,226 @@
+"""
+Playbook Step Metrics
+One row per executed playbook step (automation_step_metrics): start, duration, attempts,
+outcome, cached-selector hits vs LLM calls, and bytes exchanged with Stagehand.
+
+measure_step() opens an accumulator in a contextvar for the duration of a step, so the
+helpers the step calls (Stagehand requests, LLM checks) add to it with note_*() without
+threading it through every signature; outside a step those calls do nothing. Finished
+steps are queued and written with COPY every settings.step_metrics_flush_ms.
+"""
+import asyncio
+import contextvars
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.services.database import Database
+
+
+_COLUMNS = (
+    "session_id", "exam_id", "playbook_version", "step_no", "step_name", "action",
+    "started_at", "duration_ms", "attempts", "outcome",
+    "cache_hits", "llm_calls", "bytes_sent", "bytes_received",
+)
+# Rows kept while the database is unreachable
+_MAX_PENDING = 50000
+
+
+class StepMetrics:
+    """Accumulator for the step being executed."""
+
+    def __init__(self, session_id: str, step: dict, exam_id: Optional[int], playbook_version: Optional[str]):
+        self.session_id = session_id
+        self.exam_id = exam_id
+        self.playbook_version = playbook_version
+        self.step_no = int(step.get("step") or 0)
+        self.step_name = step.get("name") or f"step_{self.step_no}"
+        self.action = step.get("action")
+        self.started_at = datetime.utcnow()
+        self.attempts = 0
+        self.outcome = "failed"
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def finish(self, result: dict) -> None:
+        """Set the outcome from a step result ({success, error?})."""
+        if result.get("success"):
+            self.outcome = "success"
+        elif result.get("error") == "Stopped by user":
+            self.outcome = "stopped"
+        else:
+            self.outcome = "failed"
+
+    def row(self, duration_ms: int) -> tuple:
+        return (
+            uuid.UUID(self.session_id), self.exam_id, self.playbook_version,
+            self.step_no, self.step_name[:100], self.action,
+            self.started_at, duration_ms, max(1, self.attempts), self.outcome,
+            self.cache_hits, self.llm_calls, self.bytes_sent, self.bytes_received,
+        )
+
+
+_current: contextvars.ContextVar[Optional[StepMetrics]] = contextvars.ContextVar("step_metrics", default=None)
+
+
+@asynccontextmanager
+async def measure_step(session_id: str, step: dict, exam_id: Optional[int] = None, playbook_version: Optional[str] = None):
+    """
+    Measure the enclosed step and queue its row when it ends.
+    Set the outcome with metrics.finish(result); a step left by an exception counts as failed
+    (stopped if the task was cancelled).
+    """
+    metrics = StepMetrics(session_id, step, exam_id, playbook_version)
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    try:
+        yield metrics
+    except asyncio.CancelledError:
+        metrics.outcome = "stopped"
+        raise
+    except Exception:
+        metrics.outcome = "failed"
+        raise
+    finally:
+        _current.reset(token)
+        get_step_metric_writer().append(metrics.row(int((time.perf_counter() - started) * 1000)))
+
+
+def note_attempt() -> None:
+    """Count one attempt of the current step."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.attempts += 1
+
+
+def note_llm_call() -> None:
+    """Count an LLM call made by the current step."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.llm_calls += 1
+
+
+def note_stagehand(action: Optional[str], bytes_sent: int, bytes_received: int, success: bool) -> None:
+    """Add a Stagehand request to the current step (act = LLM, successful actCached = cache hit)."""
+    metrics = _current.get()
+    if metrics is None:
+        return
+    metrics.bytes_sent += bytes_sent
+    metrics.bytes_received += bytes_received
+    if action == "act":
+        metrics.llm_calls += 1
+    elif action == "actCached" and success:
+        metrics.cache_hits += 1
+
+
+# ============= Writer =============
+
+class StepMetricWriter:
+    """Queue of finished step rows, flushed in the background."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.pending: list[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def append(self, row: tuple) -> None:
+        self.pending.append(row)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything queued so far."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            try:
+                async with Database.connection() as conn:
+                    try:
+                        await conn.copy_records_to_table(
+                            "automation_step_metrics", records=rows, columns=_COLUMNS
+                        )
+                    except Exception:
+                        # COPY is all-or-nothing; drop only rows whose session no longer exists
+                        await conn.executemany(f"""
+                            INSERT INTO automation_step_metrics ({", ".join(_COLUMNS)})
+                            SELECT {", ".join(f"${i}" for i in range(1, len(_COLUMNS) + 1))}
+                            WHERE EXISTS (SELECT 1 FROM automation_sessions WHERE id = $1)
+                        """, rows)
+            except Exception as e:
+                print(f"⚠️ Step metrics flush failed ({len(rows)} rows): {e}")
+                self.pending[:0] = rows
+                overflow = len(self.pending) - _MAX_PENDING
+                if overflow > 0:
+                    del self.pending[:overflow]
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
+# Global writer
+_writer: Optional[StepMetricWriter] = None
+
+
+def get_step_metric_writer() -> StepMetricWriter:
+    """Get or create the shared step metrics writer."""
+    global _writer
+
+    if _writer is None:
+        _writer = StepMetricWriter(settings.step_metrics_flush_ms / 1000)
+
+    return _writer
+
+
+async def close_step_metric_writer() -> None:
+    """Flush queued step rows (call at shutdown, before the pool closes)."""
+    global _writer
+
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+
+
+async def get_step_stats(exam_id: int, days: int = 30, playbook_version: Optional[str] = None) -> list[dict]:
+    """Per playbook version and step: runs, p50/p95/p99 duration, failure rate, cache and LLM use."""
+    if _writer is not None:
+        await _writer.flush()
+
+    query = """
+        SELECT playbook_version, step_no, step_name,
+            count(*)::int AS runs,
+            count(*) FILTER (WHERE outcome = 'failed')::int AS failures,
+            count(*) FILTER (WHERE outcome = 'stopped')::int AS stopped,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+            percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms,
+            avg(attempts)::float8 AS avg_attempts,
+            sum(cache_hits)::int AS cache_hits,
+            sum(llm_calls)::int AS llm_calls,
+            avg(bytes_sent + bytes_received)::float8 AS avg_bytes,
+            max(started_at) AS last_run_at
+        FROM automation_step_metrics
+        WHERE exam_id = $1 AND started_at > (NOW() AT TIME ZONE 'UTC') - make_interval(days => $2)
+    """
+    args: list = [exam_id, days]
+    if playbook_version:
+        args.append(playbook_version)
+        query += f" AND playbook_version = ${len(args)}"
+    query += " GROUP BY playbook_version, step_no, step_name ORDER BY playbook_version, step_no, step_name"
+
+    async with Database.connection() as conn:
+        rows = await conn.fetch(query, *args)
+    return [dict(row) for row in rows]
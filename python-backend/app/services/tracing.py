@@ -0,0 +1,199 @@
+"""
+Workflow Tracing
+Lightweight span tracing for workflow sessions (LangGraph nodes and playbook steps).
+
+Spans nest through a contextvar, so a node span becomes the parent of the
+Stagehand and LLM calls made inside it:
+
+    node:capture_screenshot
+      └─ stagehand:screenshot
+    node:llm_decide
+      └─ llm:decide_next_action
+
+Finished spans are
+- kept per session (bounded, most recent sessions only) for Chrome trace export
+  (chrome://tracing / Perfetto "traceEvents" JSON), and
+- aggregated into per-exam latency histograms keyed by (kind, name).
+
+Usage:
+    bind_session(session_id, exam_id)          # once per workflow task
+    async with span("stagehand", "execute"):   # around any awaited work
+        ...
+    @traced("handler")                          # on async functions
+    await traced_sleep(0.5)                     # fixed sleeps show up as "sleep" spans
+"""
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+
+# Histogram bucket upper bounds in milliseconds (last bucket is +inf)
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Sessions whose spans are retained for export, and spans kept per session
+MAX_TRACED_SESSIONS = 100
+MAX_SPANS_PER_SESSION = 5000
+
+# (session_id, exam_id) of the running workflow task
+_session_ctx: contextvars.ContextVar[Optional[tuple[str, str]]] = contextvars.ContextVar("trace_session", default=None)
+# Currently open span id (parent for new spans)
+_parent_ctx: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_parent", default=None)
+
+_span_ids = itertools.count(1)
+# session_id -> list of finished span dicts (LRU by last write)
+_session_spans: OrderedDict[str, list[dict]] = OrderedDict()
+# exam_id -> (kind, name) -> histogram
+_histograms: dict[str, dict[tuple[str, str], dict]] = {}
+
+
+def bind_session(session_id: str, exam_id: Any = None) -> None:
+    """Attribute spans recorded in the current task (and tasks it spawns) to a session."""
+    _session_ctx.set((str(session_id), str(exam_id) if exam_id is not None else "unknown"))
+
+
+def _new_histogram() -> dict:
+    return {"count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(BUCKET_BOUNDS_MS) + 1)}
+
+
+def _observe(exam_id: str, kind: str, name: str, duration_ms: float) -> None:
+    hist = _histograms.setdefault(exam_id, {}).get((kind, name))
+    if hist is None:
+        hist = _histograms[exam_id][(kind, name)] = _new_histogram()
+    hist["count"] += 1
+    hist["sum_ms"] += duration_ms
+    hist["max_ms"] = max(hist["max_ms"], duration_ms)
+    for i, bound in enumerate(BUCKET_BOUNDS_MS):
+        if duration_ms <= bound:
+            hist["buckets"][i] += 1
+            break
+    else:
+        hist["buckets"][-1] += 1
+
+
+def _store(session_id: str, record: dict) -> None:
+    spans = _session_spans.get(session_id)
+    if spans is None:
+        spans = _session_spans[session_id] = []
+        while len(_session_spans) > MAX_TRACED_SESSIONS:
+            _session_spans.popitem(last=False)
+    else:
+        _session_spans.move_to_end(session_id)
+    if len(spans) < MAX_SPANS_PER_SESSION:
+        spans.append(record)
+
+
+@asynccontextmanager
+async def span(kind: str, name: str, **attrs):
+    """
+    Record a span around the enclosed block.
+    A no-op (beyond timing) when no session is bound to the current task.
+    """
+    session = _session_ctx.get()
+    if session is None:
+        yield
+        return
+
+    span_id = next(_span_ids)
+    parent_id = _parent_ctx.get()
+    token = _parent_ctx.set(span_id)
+    started_ns = time.perf_counter_ns()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _parent_ctx.reset(token)
+        duration_ms = (time.perf_counter_ns() - started_ns) / 1_000_000
+        session_id, exam_id = session
+        record = {
+            "id": span_id,
+            "parent_id": parent_id,
+            "kind": kind,
+            "name": name,
+            "start_us": started_ns // 1000,
+            "duration_ms": duration_ms,
+        }
+        if attrs:
+            record["attrs"] = attrs
+        if error:
+            record["error"] = error
+        _store(session_id, record)
+        _observe(exam_id, kind, name, duration_ms)
+
+
+def traced(kind: str, name: Optional[str] = None):
+    """Decorator: wrap an async function in a span (name defaults to the function name)."""
+    def decorator(func):
+        span_name = name or func.__name__.lstrip("_")
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with span(kind, span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+async def traced_sleep(seconds: float) -> None:
+    """asyncio.sleep recorded as a 'sleep' span, so fixed waits are visible in traces."""
+    async with span("sleep", f"{seconds:g}s"):
+        await asyncio.sleep(seconds)
+
+
+# ============= Read / Export =============
+
+def get_latency_histograms(exam_id: Optional[str] = None) -> dict:
+    """
+    Latency histograms per exam: {exam_id: [{kind, name, count, mean_ms, max_ms, buckets}]}.
+    Bucket keys are upper bounds in ms ("+Inf" for the overflow bucket).
+    """
+    labels = [str(b) for b in BUCKET_BOUNDS_MS] + ["+Inf"]
+    exams = [str(exam_id)] if exam_id is not None else list(_histograms.keys())
+    result = {}
+    for exam in exams:
+        rows = []
+        for (kind, name), hist in sorted(_histograms.get(exam, {}).items()):
+            rows.append({
+                "kind": kind,
+                "name": name,
+                "count": hist["count"],
+                "mean_ms": round(hist["sum_ms"] / hist["count"], 2) if hist["count"] else 0.0,
+                "total_ms": round(hist["sum_ms"], 2),
+                "max_ms": round(hist["max_ms"], 2),
+                "buckets": dict(zip(labels, hist["buckets"])),
+            })
+        result[exam] = rows
+    return result
+
+
+def get_session_spans(session_id: str) -> list[dict]:
+    """Finished spans recorded for a session (empty if unknown or evicted)."""
+    return list(_session_spans.get(str(session_id), []))
+
+
+def export_chrome_trace(session_id: str) -> dict:
+    """Session spans in Chrome trace event format (complete "X" events, microseconds)."""
+    events = []
+    for record in get_session_spans(session_id):
+        args = {"id": record["id"], "parent_id": record["parent_id"], **record.get("attrs", {})}
+        if record.get("error"):
+            args["error"] = record["error"]
+        events.append({
+            "name": record["name"],
+            "cat": record["kind"],
+            "ph": "X",
+            "ts": record["start_us"],
+            "dur": int(record["duration_ms"] * 1000),
+            "pid": os.getpid(),
+            "tid": 1,
+            "args": args,
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"session_id": str(session_id)}}
@@ -0,0 +1 @@
+"""Maintenance and benchmark scripts (run with python -m scripts.<name>)."""
@@ -0,0 +1,47 @@
+"""
+Backfill: add finished sessions that were never counted to automation_session_rollups.
+
+Safe to run any number of times, also while the service is running - each session is
+claimed through rolled_up_at, so it is counted once. Use --rebuild (service stopped) to empty the rollups
+and count every finished session again.
+
+Run from python-backend/:
+    python -m scripts.backfill_analytics_rollups --chunk 1000
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.database import Database
+from app.services.analytics_rollups import roll_up_pending
+
+
+async def main(chunk: int, rebuild: bool) -> None:
+    await Database.connect()
+    try:
+        if rebuild:
+            async with Database.transaction() as conn:
+                await conn.execute("TRUNCATE automation_session_rollups")
+                await conn.execute("UPDATE automation_sessions SET rolled_up_at = NULL WHERE rolled_up_at IS NOT NULL")
+            print("Rollups emptied")
+
+        started = time.perf_counter()
+        total = 0
+        while True:
+            count = await roll_up_pending(chunk)
+            if not count:
+                break
+            total += count
+            print(f"  {total} sessions rolled up")
+
+        print(f"Done: {total} sessions in {time.perf_counter() - started:.1f}s")
+    finally:
+        await Database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk", type=int, default=1000, help="sessions per statement")
+    parser.add_argument("--rebuild", action="store_true", help="empty the rollups and count everything again")
+    args = parser.parse_args()
+    asyncio.run(main(args.chunk, args.rebuild))
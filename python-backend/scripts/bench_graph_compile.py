@@ -0,0 +1,45 @@
+"""
+Micro-benchmark: per-start graph overhead.
+
+Compares compiling the LangGraph workflow on every start (old behaviour)
+against fetching the shared compiled graph (get_compiled_graph).
+
+Run from python-backend/:
+    python -m scripts.bench_graph_compile --runs 200
+"""
+import argparse
+import asyncio
+import time
+
+from app.graph.builder import create_compiled_graph, get_compiled_graph, reset_compiled_graphs
+
+
+async def _time_per_call(factory, runs: int) -> float:
+    """Average milliseconds per call of an async factory."""
+    started = time.perf_counter()
+    for _ in range(runs):
+        await factory()
+    return (time.perf_counter() - started) * 1000 / runs
+
+
+async def main(runs: int) -> None:
+    reset_compiled_graphs()
+
+    compile_each_ms = await _time_per_call(create_compiled_graph, runs)
+
+    # First call compiles; the rest hit the cache
+    await get_compiled_graph()
+    cached_ms = await _time_per_call(get_compiled_graph, runs)
+
+    print(f"Runs: {runs}")
+    print(f"  compile per start : {compile_each_ms:8.3f} ms")
+    print(f"  shared graph      : {cached_ms:8.3f} ms")
+    if cached_ms > 0:
+        print(f"  speedup           : {compile_each_ms / cached_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs))